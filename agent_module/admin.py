@@ -1,3 +1,9 @@
 from django.contrib import admin
 
 # Register your models here.
+from .models import RecommendationJob
+
+@admin.register(RecommendationJob)
+class RecommendationJobAdmin(admin.ModelAdmin):
+    list_display = ('anomaly_event', 'status', 'attempts', 'available_at', 'created_at')
+    list_filter = ('status',)
@@ -0,0 +1,79 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
+
+from api.changes import bump_everything
+from api.models import AnomalyEvent, AgentRecommendation
+from agent_module.rules import RuleEngine
+
+
+class Command(BaseCommand):
+    help = "Re-runs the Rule Engine over stored anomalies (e.g. after a rule change) and rewrites their recommendations."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plot', type=int, action='append', help="Only this plot (repeatable).")
+        parser.add_argument('--since', help="Only anomalies detected at/after this date or datetime.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Events analyzed per batch.")
+
+    def handle(self, *args, **options):
+        events = AnomalyEvent.objects.all()
+        if options['plot']:
+            events = events.filter(plot_id__in=options['plot'])
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                day = parse_date(options['since'])
+                if day is None:
+                    raise CommandError(f"Invalid --since: {options['since']}")
+                since = datetime.datetime.combine(day, datetime.time())
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            events = events.filter(timestamp__gte=since)
+
+        engine = RuleEngine()
+        chunk_size = options['chunk_size']
+        columns = ('id', 'anomaly_type', 'description', 'model_confidence', 'sensor_type', 'value', 'reason_code')
+        last_id, updated, created = 0, 0, 0
+
+        # Keyset over ids: constant memory and one short transaction per chunk
+        while True:
+            chunk = list(events.filter(id__gt=last_id).order_by('id').only(*columns)[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+
+            analyses = engine.analyze_many(chunk)
+            existing = AgentRecommendation.objects.in_bulk(
+                [event.id for event in chunk], field_name='anomaly_event_id'
+            )
+            changed, missing = [], []
+            for event, analysis in zip(chunk, analyses):
+                recommendation = existing.get(event.id)
+                if recommendation is None:
+                    missing.append(AgentRecommendation(
+                        anomaly_event=event,
+                        recommended_action=analysis['action'],
+                        explanation_text=analysis['explanation'],
+                        confidence=analysis['confidence']
+                    ))
+                    continue
+                recommendation.recommended_action = analysis['action']
+                recommendation.explanation_text = analysis['explanation']
+                recommendation.confidence = analysis['confidence']
+                changed.append(recommendation)
+
+            with transaction.atomic():
+                AgentRecommendation.objects.bulk_update(
+                    changed, ['recommended_action', 'explanation_text', 'confidence'], batch_size=1000
+                )
+                AgentRecommendation.objects.bulk_create(missing, ignore_conflicts=True)
+            updated += len(changed)
+            created += len(missing)
+            self.stdout.write(f"  ... {updated + created} anomalies analyzed")
+
+        # Cached recommendation lists are stale now
+        bump_everything()
+        self.stdout.write(self.style.SUCCESS(f"✅ {updated} recommendation(s) updated, {created} created"))
@@ -0,0 +1,44 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from agent_module.worker import run_worker
+
+
+class Command(BaseCommand):
+    help = "Consumes the RecommendationJob queue with a pool of worker threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help="Worker threads (one DB connection each).")
+        parser.add_argument('--batch-size', type=int, default=100, help="Jobs claimed per round trip.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--max-attempts', type=int, default=5, help="Attempts before a job is marked failed.")
+        parser.add_argument('--lease', type=int, default=300,
+                            help="Seconds after which a running job of a dead worker is reclaimed.")
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit.")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        kwargs = {
+            'batch_size': options['batch_size'],
+            'poll_interval': options['poll_interval'],
+            'max_attempts': options['max_attempts'],
+            'lease_seconds': options['lease'],
+            'once': options['once'],
+        }
+        threads = [
+            threading.Thread(target=run_worker, args=(stop,), kwargs=kwargs, name=f"worker-{i}", daemon=True)
+            for i in range(options['concurrency'])
+        ]
+        self.stdout.write(f"🤖 Agent worker pool started ({len(threads)} threads)")
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping workers...")
+            stop.set()
+            for thread in threads:
+                thread.join()
@@ -1,3 +1,26 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+from api.models import AnomalyEvent
+
+
+class RecommendationJob(models.Model):
+    """
+    Durable work item: "run the agent for this AnomalyEvent".
+    Enqueued by ingest (same transaction as the event), consumed by `manage.py run_agent_worker`.
+    Successful jobs are deleted; jobs that keep failing stay as 'failed' for inspection.
+    """
+    STATUS = [('pending', 'Pending'), ('running', 'Running'), ('failed', 'Failed')]
+
+    anomaly_event = models.OneToOneField(AnomalyEvent, on_delete=models.CASCADE, related_name='agent_job')
+    status = models.CharField(max_length=10, choices=STATUS, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)  # Retry backoff
+    locked_at = models.DateTimeField(null=True, blank=True)    # Lease of the worker that claimed it
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='agent_job_ready_idx'),
+        ]
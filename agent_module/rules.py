@@ -1,79 +1,135 @@
 import re
+from collections import defaultdict
+
+import numpy as np
+
+
+def above(limit):
+    """Band edge for a "> limit" rule: `limit` itself still falls in the lower band."""
+    return float(np.nextafter(limit, np.inf))
+
+
+# --- RULES ---
+# sensor_type -> value bands of (upper edge, action, explanation template).
+# A value falls in the first band whose edge it is below; action None = no specific advice.
+RULES = {
+    # RULE 1: MOISTURE ISSUES
+    'moisture': [
+        (30, "Check irrigation pump and increase water flow.",
+         "Soil moisture is critically low ({value}%). Potential pump failure."),
+        (above(80), None, None),
+        (np.inf, "Stop irrigation and check drainage.",
+         "Soil moisture is abnormally high ({value}%). Risk of root rot."),
+    ],
+    # RULE 2: TEMPERATURE ISSUES
+    'temperature': [
+        (above(30), "Deploy frost covers or heaters.",
+         "Temperature is low ({value}°C). Frost damage risk."),
+        (np.inf, "Activate misting system or install shade nets.",
+         "Temperature is high ({value}°C). Risk of heat stress."),
+    ],
+    # RULE 3: HUMIDITY ISSUES
+    'humidity': [
+        (40, "Increase greenhouse humidity.",
+         "Humidity dropped to {value}%. Excessive transpiration risk."),
+        (np.inf, "Increase ventilation and air circulation.",
+         "Humidity rose to {value}%. Fungal disease risk."),
+    ],
+}
+
+# Legacy events (no structured payload, e.g. created through the API by hand):
+# keyword in anomaly_type -> sensor type, checked in order like the old if/elif chain
+LEGACY_KEYWORDS = [
+    (('moisture', 'drought', 'waterlogging'), 'moisture'),
+    (('temp', 'heat', 'frost', 'cold'), 'temperature'),
+    (('humidity', 'dry'), 'humidity'),
+]
+LEGACY_VALUE = re.compile(r"[-+]?\d*\.\d+|\d+")
+
+
+class BandTable:
+    """Value bands of one rule, looked up for a whole array of values at once."""
+
+    def __init__(self, bands):
+        self.edges = np.array([band[0] for band in bands], dtype=float)
+        self.actions = [band[1] for band in bands]
+        self.templates = [band[2] for band in bands]
+
+    def band(self, values):
+        # side='right': a value equal to an edge belongs to the next band ("below the edge" is strict)
+        index = np.searchsorted(self.edges, values, side='right')
+        return np.minimum(index, len(self.edges) - 1)
+
+
+def compile_rules(rules=RULES):
+    """
+    Dispatch table sensor_type -> BandTable. The advice depends on the sensor and its value
+    only: every reason the detector gives for a sensor (threshold, forest, plot baseline,
+    sudden change) leads to the same bands.
+    """
+    return {sensor_type: BandTable(bands) for sensor_type, bands in rules.items()}
+
 
 class RuleEngine:
     """
     Deterministic rule-based engine for agricultural recommendations.
     """
-    
-    def analyze(self, anomaly_event):
-        # Normalize inputs
+    dispatch = compile_rules()
+
+    def payload(self, anomaly_event):
+        """(sensor_type, value) of an event; legacy events fall back to their text."""
+        if anomaly_event.sensor_type and anomaly_event.value is not None:
+            return anomaly_event.sensor_type, anomaly_event.value
+
         anomaly_type = anomaly_event.anomaly_type.lower()
-        
-        # 1. Safely extract value
-        try:
-            match = re.search(r"[-+]?\d*\.\d+|\d+", anomaly_event.description)
-            sensor_val = float(match.group()) if match else 0
-        except:
-            sensor_val = 0
-
-        # 2. Get Confidence
-        current_conf = anomaly_event.model_confidence if anomaly_event.model_confidence else 0.8
-
-        # Default response
-        recommendation = {
-            "action": "Investigate manually.",
-            "explanation": f"Unknown anomaly type: {anomaly_type}",
-            "confidence": 0.5
-        }
-
-        # --- SMART LOGIC ---
-        
-        # RULE 1: MOISTURE ISSUES
-        # Handles "drought", "failure", or generic "abnormal moisture"
-        if "moisture" in anomaly_type or "drought" in anomaly_type or "waterlogging" in anomaly_type:
-            if sensor_val < 30:
-                recommendation = {
-                    "action": "Check irrigation pump and increase water flow.",
-                    "explanation": f"Soil moisture is critically low ({sensor_val}%). Potential pump failure.",
-                    "confidence": current_conf
-                }
-            elif sensor_val > 80:
-                recommendation = {
-                    "action": "Stop irrigation and check drainage.",
-                    "explanation": f"Soil moisture is abnormally high ({sensor_val}%). Risk of root rot.",
-                    "confidence": current_conf
-                }
+        sensor_type = anomaly_event.sensor_type or next(
+            (sensor for keywords, sensor in LEGACY_KEYWORDS if any(k in anomaly_type for k in keywords)), None
+        )
+        match = LEGACY_VALUE.search(anomaly_event.description or '')
+        return sensor_type, float(match.group()) if match else 0
 
-        # RULE 2: TEMPERATURE ISSUES
-        # Handles "heat", "frost", or generic "abnormal temperature"
-        elif "temp" in anomaly_type or "heat" in anomaly_type or "frost" in anomaly_type or "cold" in anomaly_type:
-            if sensor_val > 30:
-                recommendation = {
-                    "action": "Activate misting system or install shade nets.",
-                    "explanation": f"Temperature is high ({sensor_val}°C). Risk of heat stress.",
-                    "confidence": current_conf
-                }
-            else:
-                recommendation = {
-                    "action": "Deploy frost covers or heaters.",
-                    "explanation": f"Temperature is low ({sensor_val}°C). Frost damage risk.",
-                    "confidence": current_conf
-                }
+    def lookup(self, sensor_type):
+        return self.dispatch.get(sensor_type)
 
-        # RULE 3: HUMIDITY ISSUES
-        # Handles "dry air" or generic "abnormal humidity"
-        elif "humidity" in anomaly_type or "dry" in anomaly_type:
-            if sensor_val < 40:
-                recommendation = {
-                    "action": "Increase greenhouse humidity.",
-                    "explanation": f"Humidity dropped to {sensor_val}%. Excessive transpiration risk.",
-                    "confidence": current_conf
-                }
-            else:
-                recommendation = {
-                    "action": "Increase ventilation and air circulation.",
-                    "explanation": f"Humidity rose to {sensor_val}%. Fungal disease risk.",
-                    "confidence": current_conf
+    def analyze(self, anomaly_event):
+        return self.analyze_many([anomaly_event])[0]
+
+    def analyze_many(self, anomaly_events):
+        """
+        Recommendations for many events in one pass (a list or a queryset).
+        Events are grouped by rule and each group's bands are resolved with one vectorized lookup.
+        Returns a list of {"action", "explanation", "confidence"} aligned with the events.
+        """
+        anomaly_events = list(anomaly_events)
+        results = [None] * len(anomaly_events)
+
+        # 1. Group events by the rule that applies to them
+        groups = defaultdict(list)
+        for index, event in enumerate(anomaly_events):
+            sensor_type, value = self.payload(event)
+            groups[self.lookup(sensor_type)].append((index, value))
+
+        for table, members in groups.items():
+            # 2. Find every member's band at once
+            bands = table.band(np.array([value for _, value in members], dtype=float)) if table else None
+
+            for position, (index, value) in enumerate(members):
+                event = anomaly_events[index]
+                band = bands[position] if table else None
+
+                # 3. Default response when no rule (or no band) applies
+                if band is None or table.actions[band] is None:
+                    results[index] = {
+                        "action": "Investigate manually.",
+                        "explanation": f"Unknown anomaly type: {event.anomaly_type.lower()}",
+                        "confidence": 0.5
+                    }
+                    continue
+
+                results[index] = {
+                    "action": table.actions[band],
+                    "explanation": table.templates[band].format(value=value),
+                    "confidence": event.model_confidence if event.model_confidence else 0.8
                 }
 
-        return recommendation
\ No newline at end of file
+        return results
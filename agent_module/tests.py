@@ -1,3 +1,264 @@
-from django.test import TestCase
+import datetime
+import re
+import threading
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from api.models import FarmProfile, FieldPlot, AnomalyEvent, AgentRecommendation
+from ml_module.logic import (
+    REASON_LABELS, REASON_SUDDEN_CHANGE, REASON_UNUSUAL_FOR_PLOT, SAFETY_THRESHOLDS
+)
+from .models import RecommendationJob
+from .rules import RuleEngine
+from .worker import claim, process, run_worker
+
+
+class WorkerTests(TestCase):
+    """
+    The recommendation job queue: leases, reclaiming, retry backoff, giving up, and
+    exactly one recommendation per anomaly however often a job runs.
+    """
+    def setUp(self):
+        user = User.objects.create_user('worker', password='pw')
+        farm = FarmProfile.objects.create(user=user, name='Farm', owner_name='F', location='X', size_hectares=1)
+        self.plot = FieldPlot.objects.create(farm=farm, plot_name='P', crop_variety='Wheat', area_sqm=100)
+        # Jobs are queued at the real time: the worker's clock starts just after it
+        self.clock = timezone.now() + datetime.timedelta(seconds=1)
+        patcher = mock.patch('agent_module.worker.timezone.now', side_effect=lambda: self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def events(self, count):
+        """Saved anomalies; the post_save signal queues a job for each."""
+        return [
+            AnomalyEvent.objects.create(
+                plot=self.plot, anomaly_type='Drought / Pump Failure', description='Abnormal moisture reading: 5',
+                severity='critical', model_confidence=0.99, sensor_type='moisture', value=5,
+            )
+            for _ in range(count)
+        ]
+
+    def advance(self, seconds):
+        self.clock += datetime.timedelta(seconds=seconds)
+
+    def failing(self, *events):
+        """Makes the rule engine fail on these events (so on any batch holding one of them)."""
+        bad = {event.id for event in events}
+        payload = RuleEngine.payload
+
+        def broken_payload(engine, event):
+            if event.id in bad:
+                raise ValueError(f"bad event {event.id}")
+            return payload(engine, event)
+
+        return mock.patch.object(RuleEngine, 'payload', broken_payload)
+
+    def test_claim_leases_jobs_once(self):
+        events = self.events(3)
+        first = claim(2)
+        self.assertEqual([job.anomaly_event_id for job in first], [event.id for event in events[:2]])
+        stored = RecommendationJob.objects.filter(id__in=[job.id for job in first])
+        self.assertEqual({(job.status, job.attempts) for job in stored}, {('running', 1)})
+        # Leased jobs are not handed out again
+        self.assertEqual([job.anomaly_event_id for job in claim(10)], [events[2].id])
+        self.assertEqual(claim(10), [])
+
+    def test_expired_lease_is_reclaimed(self):
+        event, = self.events(1)
+        claim(10, lease_seconds=300)  # The worker that claimed it dies
+        self.advance(299)
+        self.assertEqual(claim(10, lease_seconds=300), [])
+        self.advance(2)
+        job, = claim(10, lease_seconds=300)
+        self.assertEqual((job.anomaly_event_id, job.attempts), (event.id, 2))
+
+    def test_retry_backoff(self):
+        event, = self.events(1)
+        with self.failing(event):
+            for attempt in (1, 2, 3):
+                job, = claim(10)
+                self.assertEqual(job.attempts, attempt)
+                self.assertEqual(process([job], max_attempts=5), (0, 1))
+                job.refresh_from_db()
+                self.assertEqual(job.status, 'pending')
+                self.assertEqual(job.available_at, self.clock + datetime.timedelta(seconds=2 ** attempt))
+                self.assertIn('bad event', job.last_error)
+                # Not before its backoff
+                self.advance(2 ** attempt - 1)
+                self.assertEqual(claim(10), [])
+                self.advance(1)
+
+        job, = claim(10)
+        self.assertEqual(process([job]), (1, 0))
+        self.assertFalse(RecommendationJob.objects.exists())
+        self.assertTrue(AgentRecommendation.objects.filter(anomaly_event=event).exists())
+
+    def test_gives_up_after_max_attempts(self):
+        event, = self.events(1)
+        with self.failing(event):
+            for _ in range(3):
+                process(claim(10), max_attempts=3)
+                self.advance(3600)
+        job = RecommendationJob.objects.get()
+        self.assertEqual((job.status, job.attempts), ('failed', 3))
+        self.advance(24 * 3600)
+        self.assertEqual(claim(10), [])
+        self.assertFalse(AgentRecommendation.objects.exists())
+
+    def test_one_bad_event_does_not_fail_the_batch(self):
+        events = self.events(3)
+        with self.failing(events[1]):
+            self.assertEqual(process(claim(10)), (2, 1))
+        self.assertEqual(set(AgentRecommendation.objects.values_list('anomaly_event_id', flat=True)),
+                         {events[0].id, events[2].id})
+        self.assertEqual(RecommendationJob.objects.get().anomaly_event_id, events[1].id)
+
+    def test_no_double_processing(self):
+        event, = self.events(1)
+        stale = claim(10, lease_seconds=60)    # A slow worker...
+        self.advance(61)
+        reclaimed = claim(10, lease_seconds=60)  # ...whose job another worker reclaims
+        self.assertEqual(process(reclaimed), (1, 0))
+        self.assertEqual(process(stale), (1, 0))  # The slow one finishes late
+        self.assertEqual(AgentRecommendation.objects.filter(anomaly_event=event).count(), 1)
+        self.assertFalse(RecommendationJob.objects.exists())
+        self.assertEqual(claim(10), [])
+
+    def test_late_failure_does_not_undo_a_reclaimed_job(self):
+        event, = self.events(1)
+        stale = claim(10, lease_seconds=60)
+        self.advance(61)
+        reclaimed = claim(10, lease_seconds=60)
+        with self.failing(event):
+            self.assertEqual(process(stale), (0, 1))  # Its lease is gone: no reset to pending
+        job = RecommendationJob.objects.get()
+        self.assertEqual((job.status, job.attempts, job.last_error), ('running', 2, ''))
+
+        self.assertEqual(process(reclaimed), (1, 0))
+        with self.failing(event):
+            process(stale)  # The job no longer exists: nothing is recreated
+        self.assertFalse(RecommendationJob.objects.exists())
+        self.assertEqual(AgentRecommendation.objects.filter(anomaly_event=event).count(), 1)
+
+    def test_run_worker_drains_the_queue(self):
+        events = self.events(5)
+        run_worker(threading.Event(), batch_size=2, once=True)
+        self.assertEqual(set(AgentRecommendation.objects.values_list('anomaly_event_id', flat=True)),
+                         {event.id for event in events})
+        self.assertFalse(RecommendationJob.objects.exists())
+
+
+def legacy_analyze(anomaly_event):
+    """The if/elif RuleEngine.analyze that the rule tables replaced, kept as the reference."""
+    anomaly_type = anomaly_event.anomaly_type.lower()
+    match = re.search(r"[-+]?\d*\.\d+|\d+", anomaly_event.description)
+    sensor_val = float(match.group()) if match else 0
+    current_conf = anomaly_event.model_confidence if anomaly_event.model_confidence else 0.8
+
+    recommendation = {
+        "action": "Investigate manually.",
+        "explanation": f"Unknown anomaly type: {anomaly_type}",
+        "confidence": 0.5
+    }
+    if "moisture" in anomaly_type or "drought" in anomaly_type or "waterlogging" in anomaly_type:
+        if sensor_val < 30:
+            recommendation = {
+                "action": "Check irrigation pump and increase water flow.",
+                "explanation": f"Soil moisture is critically low ({sensor_val}%). Potential pump failure.",
+                "confidence": current_conf
+            }
+        elif sensor_val > 80:
+            recommendation = {
+                "action": "Stop irrigation and check drainage.",
+                "explanation": f"Soil moisture is abnormally high ({sensor_val}%). Risk of root rot.",
+                "confidence": current_conf
+            }
+    elif "temp" in anomaly_type or "heat" in anomaly_type or "frost" in anomaly_type or "cold" in anomaly_type:
+        if sensor_val > 30:
+            recommendation = {
+                "action": "Activate misting system or install shade nets.",
+                "explanation": f"Temperature is high ({sensor_val}°C). Risk of heat stress.",
+                "confidence": current_conf
+            }
+        else:
+            recommendation = {
+                "action": "Deploy frost covers or heaters.",
+                "explanation": f"Temperature is low ({sensor_val}°C). Frost damage risk.",
+                "confidence": current_conf
+            }
+    elif "humidity" in anomaly_type or "dry" in anomaly_type:
+        if sensor_val < 40:
+            recommendation = {
+                "action": "Increase greenhouse humidity.",
+                "explanation": f"Humidity dropped to {sensor_val}%. Excessive transpiration risk.",
+                "confidence": current_conf
+            }
+        else:
+            recommendation = {
+                "action": "Increase ventilation and air circulation.",
+                "explanation": f"Humidity rose to {sensor_val}%. Fungal disease risk.",
+                "confidence": current_conf
+            }
+    return recommendation
+
+
+class RuleParityTests(SimpleTestCase):
+    """RuleEngine.analyze_many gives the same advice as the old per-event rules."""
+    # Values on, just below and just above every band edge, and far outside them
+    EDGES = (30.0, 40.0, 80.0)
+    VALUES = sorted({-12.5, 0.0, 5.0, 35.0, 55.0, 90.0, 120.0,
+                     *EDGES, *np.nextafter(EDGES, -np.inf), *np.nextafter(EDGES, np.inf)})
+
+    def event(self, anomaly_type, description, sensor_type='', value=None, reason_code=None, confidence=0.9):
+        return SimpleNamespace(anomaly_type=anomaly_type, description=description, sensor_type=sensor_type,
+                               value=value, reason_code=reason_code, model_confidence=confidence)
+
+    def assert_parity(self, events):
+        expected = [legacy_analyze(event) for event in events]
+        actual = RuleEngine().analyze_many(events)
+        for event, old, new in zip(events, expected, actual):
+            self.assertEqual(new, old, f"{event.anomaly_type!r} / {event.sensor_type!r} / {event.description!r}")
+
+    def test_detector_events(self):
+        events = []
+        for sensor_type, (_, lower_reason, _, upper_reason, ai_reason) in SAFETY_THRESHOLDS.items():
+            for reason_code in (lower_reason, upper_reason, ai_reason):
+                for value in self.VALUES:
+                    for confidence in (0, 0.55, 0.99):
+                        events.append(self.event(
+                            REASON_LABELS[reason_code], f"Abnormal {sensor_type} reading: {value}",
+                            sensor_type, value, reason_code, confidence,
+                        ))
+        self.assert_parity(events)
+
+    def test_legacy_events(self):
+        # No structured payload: sensor and value come from the text, as before
+        cases = [
+            ('Drought', 'Moisture at {value}'), ('Waterlogging', '{value}% water'), ('Soil moisture low', 'x {value}'),
+            ('Heat Stress', 'Temp {value}'), ('Frost Danger', '{value} C'), ('Cold snap', 'temp {value}'),
+            ('High Humidity', 'RH {value}'), ('Extremely Dry Air', '{value}'), ('Dry heat', '{value}'),
+            ('Pest outbreak', 'aphids at {value} per leaf'), ('Manual note', 'no number here'),
+        ]
+        events = [self.event(anomaly_type, description.format(value=value))
+                  for anomaly_type, description in cases for value in self.VALUES if value >= 0]
+        self.assert_parity(events)
+
+    def test_plot_relative_reasons_use_the_sensor_bands(self):
+        # Reasons the old keyword rules never saw: the advice follows the sensor and value
+        for reason_code in (REASON_UNUSUAL_FOR_PLOT, REASON_SUDDEN_CHANGE):
+            low, middle = RuleEngine().analyze_many([
+                self.event(REASON_LABELS[reason_code], '', 'moisture', value, reason_code) for value in (12.0, 55.0)
+            ])
+            self.assertEqual(low['action'], "Check irrigation pump and increase water flow.")
+            self.assertEqual(middle['action'], "Investigate manually.")
+
+    def test_batch_matches_one_by_one(self):
+        events = [self.event('Heat Stress', '', 'temperature', value) for value in self.VALUES]
+        events += [self.event('Pest outbreak', 'aphids')]
+        engine = RuleEngine()
+        self.assertEqual(engine.analyze_many(events), [engine.analyze(event) for event in events])
@@ -0,0 +1,143 @@
+import datetime
+import threading
+import traceback
+
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from api.changes import bump_plots
+from api.models import AgentRecommendation
+from .models import RecommendationJob
+from .rules import RuleEngine
+
+
+def enqueue(events):
+    """
+    Queues agent analysis for saved AnomalyEvents (one INSERT). Call inside the
+    transaction that created the events so a job exists iff its event does.
+    """
+    RecommendationJob.objects.bulk_create(
+        [RecommendationJob(anomaly_event=event) for event in events], ignore_conflicts=True
+    )
+
+
+def build_recommendations(events):
+    """
+    Runs the Rule Engine over AnomalyEvents in one batch.
+    Returns (unsaved recommendations, {event id: error text}).
+    """
+    # 1. Initialize the Brain
+    engine = RuleEngine()
+    recommendations, errors = [], {}
+
+    # 2. Ask for advice for the whole batch; if that fails, retry one by one to isolate the bad event
+    try:
+        analyses = engine.analyze_many(events)
+    except Exception:
+        analyses = []
+        for event in events:
+            try:
+                analyses.append(engine.analyze(event))
+            except Exception:
+                errors[event.id] = traceback.format_exc()
+                analyses.append(None)
+
+    for event, analysis in zip(events, analyses):
+        if analysis is None:
+            continue
+        recommendations.append(AgentRecommendation(
+            anomaly_event=event,
+            recommended_action=analysis['action'],
+            explanation_text=analysis['explanation'],
+            confidence=analysis['confidence']
+        ))
+
+    return recommendations, errors
+
+
+def claim(batch_size, lease_seconds=300):
+    """
+    Claims up to `batch_size` ready jobs. Jobs whose lease expired (crashed worker) are reclaimed.
+    SKIP LOCKED lets any number of workers claim concurrently without blocking each other.
+    """
+    now = timezone.now()
+    ready = (
+        Q(status='pending', available_at__lte=now) |
+        Q(status='running', locked_at__lt=now - datetime.timedelta(seconds=lease_seconds))
+    )
+    with transaction.atomic():
+        jobs = list(
+            RecommendationJob.objects.filter(ready)
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('anomaly_event')
+            .order_by('available_at', 'id')[:batch_size]
+        )
+        RecommendationJob.objects.filter(id__in=[job.id for job in jobs]).update(
+            status='running', locked_at=now, attempts=F('attempts') + 1
+        )
+    for job in jobs:
+        job.attempts += 1
+    return jobs
+
+
+def process(jobs, max_attempts=5):
+    """
+    Generates recommendations for claimed jobs and stores them in one INSERT.
+    Failed jobs are retried with exponential backoff until `max_attempts`.
+    Returns (succeeded, failed) counts.
+    """
+    recommendations, errors = build_recommendations([job.anomaly_event for job in jobs])
+
+    with transaction.atomic():
+        # ignore_conflicts: a retried job whose recommendation already exists is a no-op
+        AgentRecommendation.objects.bulk_create(recommendations, ignore_conflicts=True)
+        bump_plots(recommendation.anomaly_event.plot_id for recommendation in recommendations)
+        RecommendationJob.objects.filter(
+            id__in=[job.id for job in jobs if job.anomaly_event_id not in errors]
+        ).delete()
+
+        now = timezone.now()
+        for job in jobs:
+            if job.anomaly_event_id not in errors:
+                continue
+            job.last_error = errors[job.anomaly_event_id]
+            job.locked_at = None
+            if job.attempts >= max_attempts:
+                job.status = 'failed'
+                print(f"❌ AGENT ERROR: giving up on Anomaly {job.anomaly_event_id} after {job.attempts} attempts")
+            else:
+                job.status = 'pending'
+                job.available_at = now + datetime.timedelta(seconds=2 ** job.attempts)
+            # Only while the lease is still ours (`attempts` counts claims): a job reclaimed
+            # by another worker, or already completed by it, is left alone
+            RecommendationJob.objects.filter(id=job.id, attempts=job.attempts).update(
+                status=job.status, available_at=job.available_at, locked_at=None, last_error=job.last_error
+            )
+
+    return len(jobs) - len(errors), len(errors)
+
+
+def run_worker(stop, batch_size=100, poll_interval=1.0, max_attempts=5, lease_seconds=300, once=False):
+    """
+    Claim/process loop for one worker thread. Sleeps `poll_interval` when the queue is empty.
+    A DB error doesn't kill the thread: claimed jobs are picked up again once their lease expires.
+    """
+    name = threading.current_thread().name
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            try:
+                jobs = claim(batch_size, lease_seconds)
+                if jobs:
+                    done, failed = process(jobs, max_attempts)
+                    print(f"🤖 AGENT [{name}]: {done} recommendation(s) saved, {failed} failed")
+                    continue
+            except Exception as e:
+                # Safety net: print the error and back off instead of dying
+                print(f"❌ AGENT ERROR [{name}]: {e}")
+            if once:
+                return
+            stop.wait(poll_interval)
+    finally:
+        close_old_connections()
@@ -0,0 +1,59 @@
+"""
+Cached ownership: the set of plot ids each user may access.
+
+Replaces the plot__farm__user joins in every auth-scoped query with
+`plot_id IN (...)` and makes ownership checks on ingest a set lookup.
+The sets live in the shared cache under a per-user generation, which the
+FarmProfile/FieldPlot signals (api/signals.py) bump when ownership changes: a request
+that read the old ownership just before the change can only store it under the old
+generation, which nobody reads any more.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .authentication import DevicePrincipal
+from .changes import bump_keys, versions
+from .models import FieldPlot
+
+
+def generation_key(user_id):
+    return f'acl-generation:{user_id}'
+
+
+def acl_key(user_id, generation):
+    return f'acl-plots:{user_id}:{generation}'
+
+
+def allowed_plot_ids(user):
+    """frozenset of the plot ids `user` owns, or None for superusers (no restriction)."""
+    if user.is_superuser:
+        return None
+    # Devices carry their own scope (verified with the key)
+    if isinstance(user, DevicePrincipal):
+        return user.plot_ids
+    # Generation first: a set read from the database after it is current for that generation
+    generation = versions([generation_key(user.id)])[generation_key(user.id)]
+    plot_ids = cache.get(acl_key(user.id, generation))
+    if plot_ids is None:
+        plot_ids = frozenset(FieldPlot.objects.filter(farm__user_id=user.id).values_list('id', flat=True))
+        cache.set(acl_key(user.id, generation), plot_ids, settings.ACL_CACHE_SECONDS)
+    return plot_ids
+
+
+def can_access_plot(user, plot_id):
+    plot_ids = allowed_plot_ids(user)
+    return plot_ids is None or plot_id in plot_ids
+
+
+def restrict(queryset, user, field='plot_id'):
+    """Limits a queryset to the user's plots (no-op for superusers)."""
+    plot_ids = allowed_plot_ids(user)
+    if plot_ids is None:
+        return queryset
+    return queryset.filter(**{f'{field}__in': plot_ids})
+
+
+def invalidate(user_ids):
+    """Starts a new generation of the users' sets once the current transaction commits."""
+    bump_keys(generation_key(user_id) for user_id in set(user_ids) if user_id is not None)
@@ -1,29 +1,96 @@
 from django.contrib import admin
 
 # Register your models here.
-from django.contrib import admin
-from .models import FarmProfile, FieldPlot, SensorReading, AnomalyEvent, AgentRecommendation
+from django import forms
+from django.contrib import admin, messages
+from django.utils import timezone
+from .authentication import generate_key, key_plots
+from .models import FarmProfile, FieldPlot, SensorReading, SensorRollup, SensorSource, AnomalyEvent, AgentRecommendation
 
 @admin.register(FarmProfile)
 class FarmProfileAdmin(admin.ModelAdmin):
     list_display = ('name', 'owner_name', 'location', 'size_hectares')
 
+class FarmListFilter(admin.RelatedFieldListFilter):
+    # str(farm) shows the user: load them with the farms
+    def field_choices(self, field, request, model_admin):
+        return [(farm.pk, str(farm)) for farm in FarmProfile.objects.select_related('user').order_by('name')]
+
 @admin.register(FieldPlot)
 class FieldPlotAdmin(admin.ModelAdmin):
     list_display = ('plot_name', 'crop_variety', 'farm', 'area_sqm')
-    list_filter = ('farm',) # Adds a sidebar filter
+    list_filter = (('farm', FarmListFilter),) # Adds a sidebar filter
+    list_select_related = ('farm__user',)  # str(farm) shows the user
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'farm':
+            kwargs['queryset'] = FarmProfile.objects.select_related('user')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 @admin.register(SensorReading)
 class SensorReadingAdmin(admin.ModelAdmin):
     list_display = ('sensor_type', 'value', 'plot', 'timestamp')
     list_filter = ('sensor_type', 'plot') # Essential for filtering specific sensors
+    list_select_related = ('plot',)
     ordering = ('-timestamp',)
 
+class SensorSourceForm(forms.ModelForm):
+    class Meta:
+        model = SensorSource
+        exclude = ('key_prefix', 'key_hash', 'revoked_at')  # Generated / set by the revoke action
+
+    def clean(self):
+        # Same rule as the key check (api/authentication.key_plots): refuse what it would drop
+        cleaned_data = super().clean()
+        owner, plots = cleaned_data.get('owner'), cleaned_data.get('plots')
+        if owner is not None and plots is not None:
+            foreign = set(plots) - set(key_plots(owner, plots))
+            if foreign:
+                self.add_error('plots', f"Not owned by {owner.username}: "
+                                        f"{', '.join(sorted(plot.plot_name for plot in foreign))}")
+        return cleaned_data
+
+@admin.register(SensorSource)
+class SensorSourceAdmin(admin.ModelAdmin):
+    form = SensorSourceForm
+    list_display = ('name', 'owner', 'key_prefix', 'is_active', 'created_at', 'revoked_at')
+    list_filter = ('is_active',)
+    list_select_related = ('owner',)
+    filter_horizontal = ('plots',)
+    readonly_fields = ('key_prefix', 'key_hash', 'revoked_at')
+    actions = ['revoke']
+
+    def save_model(self, request, obj, form, change):
+        # New device: generate the key and show it once
+        if not change:
+            key, obj.key_prefix, obj.key_hash = generate_key()
+            messages.warning(request, f"API key for {obj.name} (store it now, it is not kept): {key}")
+        super().save_model(request, obj, form, change)
+
+    @admin.action(description="Revoke selected API keys")
+    def revoke(self, request, queryset):
+        # save() per row so the signals drop the key cache
+        for source in queryset.filter(is_active=True):
+            source.is_active = False
+            source.revoked_at = timezone.now()
+            source.save(update_fields=['is_active', 'revoked_at'])
+
+@admin.register(SensorRollup)
+class SensorRollupAdmin(admin.ModelAdmin):
+    list_display = ('sensor_type', 'granularity', 'bucket', 'plot', 'count', 'mean', 'min_value', 'max_value')
+    list_filter = ('granularity', 'sensor_type', 'plot')
+    list_select_related = ('plot',)
+    ordering = ('-bucket',)
+
 @admin.register(AnomalyEvent)
 class AnomalyEventAdmin(admin.ModelAdmin):
-    list_display = ('anomaly_type', 'severity', 'plot', 'timestamp', 'model_confidence')
+    list_display = ('anomaly_type', 'severity', 'plot', 'timestamp', 'occurrences', 'last_seen', 'closed_at',
+                    'model_confidence')
     list_filter = ('severity', 'anomaly_type')
+    list_select_related = ('plot',)
+    raw_id_fields = ('reading',)  # A <select> would list every reading
 
 @admin.register(AgentRecommendation)
 class AgentRecommendationAdmin(admin.ModelAdmin):
-    list_display = ('recommended_action', 'confidence', 'created_at')
\ No newline at end of file
+    list_display = ('recommended_action', 'confidence', 'created_at')
+    raw_id_fields = ('anomaly_event',)
\ No newline at end of file
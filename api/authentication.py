@@ -0,0 +1,120 @@
+"""
+API keys for field devices (SensorSource).
+
+    Authorization: Api-Key <prefix>.<secret>
+
+Keys are looked up by SHA-256 digest and the result (device or "no such key") is cached
+in process memory for DEVICE_KEY_CACHE_SECONDS, so a warm ingest request does no JWT
+decoding and no user/device query at all. A revoked key stops working everywhere
+within that TTL, without a restart.
+"""
+
+import hashlib
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from rest_framework import authentication, exceptions, permissions
+
+from .models import SensorSource
+
+KEYWORD = 'Api-Key'
+
+# digest -> (expires at, DevicePrincipal or None)
+_verified = {}
+_lock = threading.Lock()
+
+
+class DevicePrincipal:
+    """
+    request.user for a device. `id` is the owner's (ownership and version keys follow
+    the owner), `pk` identifies the device itself, `plot_ids` is its write scope.
+    """
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+    is_superuser = False
+    is_staff = False
+
+    def __init__(self, source_id, name, owner_id, plot_ids):
+        self.source_id = source_id
+        self.name = name
+        self.id = owner_id
+        self.pk = f'device-{source_id}'
+        self.username = f'device:{name}'
+        self.plot_ids = frozenset(plot_ids)
+
+    def __str__(self):
+        return self.username
+
+
+def hash_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def generate_key():
+    """Returns (key, prefix, digest). The prefix is the public, recognisable part of the key."""
+    prefix = secrets.token_hex(4)
+    key = f"{prefix}.{secrets.token_urlsafe(32)}"
+    return key, prefix, hash_key(key)
+
+
+def key_plots(owner, plots):
+    """The plots among `plots` a key owned by `owner` may write to: the owner's, any for a superuser."""
+    return plots if owner.is_superuser else plots.filter(farm__user_id=owner.id)
+
+
+def verify_key(key):
+    """DevicePrincipal for an active key, or None. Cached per process with a TTL."""
+    digest = hash_key(key)
+    now = time.monotonic()
+    cached = _verified.get(digest)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    principal = None
+    source = SensorSource.objects.select_related('owner').filter(key_hash=digest, is_active=True).first()
+    if source is not None:
+        # Only plots the owner still owns (the rule the key was created under)
+        plot_ids = key_plots(source.owner, source.plots.all()).values_list('id', flat=True)
+        principal = DevicePrincipal(source.id, source.name, source.owner_id, plot_ids)
+
+    with _lock:
+        if len(_verified) >= settings.DEVICE_KEY_CACHE_SIZE:
+            _verified.clear()  # Bounded: random keys can't grow it forever
+        _verified[digest] = (now + settings.DEVICE_KEY_CACHE_SECONDS, principal)
+    return principal
+
+
+def forget_keys():
+    """Drops this process's cache (the others expire within the TTL)."""
+    with _lock:
+        _verified.clear()
+
+
+class DeviceKeyAuthentication(authentication.BaseAuthentication):
+    def authenticate(self, request):
+        header = authentication.get_authorization_header(request).split()
+        if not header or header[0].decode().lower() != KEYWORD.lower():
+            return None  # Not ours: let JWT / session try
+        if len(header) != 2:
+            raise exceptions.AuthenticationFailed('Invalid API key header.')
+
+        principal = verify_key(header[1].decode())
+        if principal is None:
+            raise exceptions.AuthenticationFailed('Invalid or revoked API key.')
+        return principal, None
+
+    def authenticate_header(self, request):
+        return KEYWORD
+
+
+class DeviceMethodsOnly(permissions.BasePermission):
+    """Devices may only use the methods a view lists in `device_methods` (ingest, mostly)."""
+    message = 'API keys can only be used to send readings.'
+
+    def has_permission(self, request, view):
+        if not isinstance(request.user, DevicePrincipal):
+            return True
+        return request.method in getattr(view, 'device_methods', ())
@@ -0,0 +1,171 @@
+"""
+Bulk loading of historical readings (`manage.py import_readings`).
+
+Files are streamed row by row from a byte offset, so memory stays constant and a load
+can resume where its checkpoint (ReadingImport) stopped. Each chunk is written with
+PostgreSQL COPY (bulk_create elsewhere) together with its rollups, optional anomaly
+detection and the checkpoint, all in one transaction.
+
+Detection judges history against baselines and recent readings of the import's own
+(history_state), built from the file as it goes: old readings must not move the live
+per-plot baselines or the in-memory latest readings, and the live baselines must not be
+flushed over by them.
+"""
+
+import csv
+import datetime
+import io
+import json
+import math
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ml_module.baselines import BaselineStore
+from ml_module.ringbuffer import RecentReadings
+
+from .models import SensorReading, AnomalyEvent, AgentRecommendation
+from .rollups import update_rollups
+from .incidents import group_events
+
+SENSOR_TYPES = {choice for choice, _ in SensorReading.SENSOR_TYPES}
+COPY_COLUMNS = ('id', 'plot_id', 'sensor_type', 'value', 'timestamp', 'source')
+
+
+def iter_records(path, offset=0):
+    """
+    Yields (record, byte offset right after it) from a CSV file with a header row or a
+    JSON-lines file, starting at `offset`. Lines that aren't valid JSON yield None.
+    """
+    with open(path, 'rb') as f:
+        header = None
+        if path.endswith('.csv'):
+            header = next(csv.reader([f.readline().decode()]))
+            offset = max(offset, f.tell())
+        f.seek(offset)
+        for line in f:
+            offset += len(line)
+            text = line.decode(errors='replace').strip()
+            if not text:
+                continue
+            if header is not None:
+                yield dict(zip(header, next(csv.reader([text])))), offset
+                continue
+            try:
+                yield json.loads(text), offset
+            except ValueError:
+                yield None, offset
+
+
+def parse_timestamp(value):
+    if isinstance(value, (int, float)):
+        try:
+            return datetime.datetime.fromtimestamp(value, tz=datetime.timezone.utc)
+        except (OverflowError, OSError):  # Out of the platform's range (e.g. milliseconds, 1e300)
+            raise ValueError(f"timestamp out of range: {value}")
+    moment = datetime.datetime.fromisoformat(value)
+    if timezone.is_naive(moment):
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment
+
+
+def parse_record(record, known_plots, default_source):
+    """Unsaved SensorReading for one input record. Raises ValueError for bad rows."""
+    if not isinstance(record, dict):
+        raise ValueError("not a JSON object")
+    try:
+        plot_id = int(record.get('plot', record.get('plot_id')))
+        value = float(record['value'])
+        timestamp = parse_timestamp(record['timestamp'])
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"missing or bad field: {e}")
+    sensor_type = record.get('sensor_type')
+    if plot_id not in known_plots:
+        raise ValueError(f"unknown plot {plot_id}")
+    if sensor_type not in SENSOR_TYPES:
+        raise ValueError(f"unknown sensor_type {sensor_type!r}")
+    if not math.isfinite(value):
+        raise ValueError(f"bad value {value}")
+    source = (record.get('source') or default_source)[:50]
+    return SensorReading(plot_id=plot_id, sensor_type=sensor_type, value=value, timestamp=timestamp, source=source)
+
+
+def history_state():
+    """(BaselineStore, RecentReadings) for one import: empty, never loaded from or flushed to the DB."""
+    return (BaselineStore(alpha=settings.BASELINE_ALPHA, warmup=settings.BASELINE_WARMUP),
+            RecentReadings(size=settings.RECENT_READINGS_SIZE, window=settings.RECENT_READINGS_WINDOW))
+
+
+def copy_readings(readings):
+    """
+    PostgreSQL: reserves ids from the table's sequence, then loads the rows with COPY.
+    Unlike a plain COPY the readings get their ids, so anomalies can point at them.
+    """
+    table = SensorReading._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            [table, len(readings)],
+        )
+        for reading, (reading_id,) in zip(readings, cursor.fetchall()):
+            reading.id = reading_id
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for reading in readings:
+            writer.writerow([reading.id, reading.plot_id, reading.sensor_type, repr(reading.value),
+                             reading.timestamp.isoformat(), reading.source])
+        buffer.seek(0)
+
+        sql = (f"COPY {connection.ops.quote_name(table)} ({', '.join(COPY_COLUMNS)}) "
+               f"FROM STDIN WITH (FORMAT csv)")
+        raw = cursor.cursor  # The driver's cursor under Django's wrapper
+        if hasattr(raw, 'copy_expert'):
+            raw.copy_expert(sql, buffer)  # psycopg2
+        else:
+            with raw.copy(sql) as copy:  # psycopg 3
+                copy.write(buffer.getvalue())
+    return readings
+
+
+def store_readings(readings):
+    if connection.vendor == 'postgresql':
+        return copy_readings(readings)
+    return SensorReading.objects.bulk_create(readings)
+
+
+def load_chunk(readings, checkpoint, offset, rejected, rollups=True, detect=False, history=None):
+    """
+    Writes one chunk and advances the checkpoint in the same transaction.
+    With `detect`, runs the detector and the Rule Engine over the chunk too (recommendations
+    that fail are left to the agent worker), against `history` (from history_state(), kept
+    across the chunks of a file). Returns the number of anomalous readings.
+    """
+    # Imported lazily: the detector is only loaded when detection is asked for
+    from .ingest import anomaly_events
+    from agent_module.worker import build_recommendations, enqueue
+
+    anomalies = 0
+    with transaction.atomic():
+        if readings:
+            store_readings(readings)
+            if rollups:
+                update_rollups(readings)
+        if detect and readings:
+            # Repeats within the chunk are coalesced by reading time; history is not
+            # merged into live open incidents
+            store, recent = history or history_state()
+            events, _, _ = group_events(anomaly_events(readings, verbose=False, store=store, recent=recent))
+            AnomalyEvent.objects.bulk_create(events)
+            recommendations, errors = build_recommendations(events)
+            AgentRecommendation.objects.bulk_create(recommendations)
+            enqueue([event for event in events if event.id in errors])
+            anomalies = sum(event.occurrences for event in events)
+
+        checkpoint.offset = offset
+        checkpoint.rows += len(readings)
+        checkpoint.rejected += rejected
+        checkpoint.anomalies += anomalies
+        checkpoint.save()
+    return anomalies
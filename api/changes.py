@@ -0,0 +1,219 @@
+"""
+Change feed for the dashboard and the list endpoints.
+
+Every write path stamps version keys in the shared Django cache (see settings.CACHES)
+with the commit time in nanoseconds:
+
+    plot-version:<plot>        readings / anomalies / recommendations of one plot
+    user-version:<user|all>    the same, for every plot of a user (all: superusers)
+    catalog-version:<user|all> farms and plots of a user
+    data-epoch                 bulk rewrites (compaction, re-analysis): everything changed
+
+An open event stream only checks its plot's key each tick and list views derive their
+ETag from these keys, so unchanged data costs no queries on the main tables.
+
+Event streams are opened with a stream token (stream_token): signed, bound to one user and
+one plot, valid for SSE_TOKEN_SECONDS. EventSource can only put it in the URL, where access
+logs keep it, so it must be worth nothing elsewhere or later, unlike the user's JWT.
+"""
+
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+
+from .models import FieldPlot, SensorReading, AnomalyEvent, AgentRecommendation
+from .serializers import SensorReadingSerializer, AnomalyEventSerializer, AgentRecommendationSerializer
+
+EPOCH_KEY = 'data-epoch'
+STREAM_TOKEN_SALT = 'api.plot-events'
+
+
+def version_key(plot_id):
+    return f'plot-version:{plot_id}'
+
+
+def user_key(user):
+    return f"user-version:{'all' if user.is_superuser else user.id}"
+
+
+def catalog_key(user):
+    return f"catalog-version:{'all' if user.is_superuser else user.id}"
+
+
+def plot_owners(plot_ids):
+    """plot id -> owner user id, cached (plots rarely change hands)."""
+    keys = {f'plot-owner:{plot_id}': plot_id for plot_id in plot_ids}
+    owners = {keys[key]: user_id for key, user_id in cache.get_many(list(keys)).items()}
+    missing = [plot_id for plot_id in plot_ids if plot_id not in owners]
+    if missing:
+        found = dict(FieldPlot.objects.filter(id__in=missing).values_list('id', 'farm__user_id'))
+        cache.set_many({f'plot-owner:{plot_id}': user_id for plot_id, user_id in found.items()}, None)
+        owners.update(found)
+    return owners
+
+
+def bump_keys(keys):
+    """Stamps version keys with the current time once the current transaction commits."""
+    keys = set(keys)
+    if keys:
+        transaction.on_commit(lambda: cache.set_many(dict.fromkeys(keys, time.time_ns()), None))
+
+
+def bump_plots(plot_ids, then=None):
+    """
+    Marks plots (and their owners' data lists) as changed once the transaction commits.
+    `then(before, now)`: called right after, with plot id -> (version, data epoch) as found
+    just before the bump (None where missing) and the new version.
+    """
+    plot_ids = set(plot_ids)
+    if not plot_ids:
+        return
+
+    def bump():
+        plot_keys = {plot_id: version_key(plot_id) for plot_id in plot_ids}
+        before = cache.get_many(list(plot_keys.values()) + [EPOCH_KEY]) if then is not None else {}
+        now = time.time_ns()
+        keys = list(plot_keys.values())
+        keys += [f'user-version:{user_id}' for user_id in set(plot_owners(plot_ids).values())]
+        keys.append('user-version:all')
+        cache.set_many(dict.fromkeys(keys, now), None)
+        if then is not None:
+            epoch = before.get(EPOCH_KEY)
+            then({plot_id: (before.get(key), epoch) for plot_id, key in plot_keys.items()}, now)
+
+    transaction.on_commit(bump)
+
+
+def bump_everything():
+    bump_keys([EPOCH_KEY])
+
+
+def versions(keys):
+    """Current version of each key. Missing (never bumped or evicted) keys start at "now"."""
+    found = cache.get_many(keys)
+    now = time.time_ns()
+    for key in keys:
+        if key not in found:
+            cache.add(key, now, None)
+            found[key] = cache.get(key, now)
+    return found
+
+
+def plot_version(plot_id):
+    return versions([version_key(plot_id)])[version_key(plot_id)]
+
+
+def stream_token(user, plot_id):
+    """Short-lived token that only opens the event stream of `plot_id` for `user`."""
+    return signing.TimestampSigner(salt=STREAM_TOKEN_SALT).sign_object({'user': user.pk, 'plot': plot_id})
+
+
+def stream_user(token, plot_id):
+    """The active user a stream token was issued to, or None (bad, expired, other plot)."""
+    try:
+        claims = signing.TimestampSigner(salt=STREAM_TOKEN_SALT).unsign_object(
+            token, max_age=settings.SSE_TOKEN_SECONDS)
+    except signing.BadSignature:  # Includes SignatureExpired
+        return None
+    if not isinstance(claims, dict) or claims.get('plot') != plot_id:
+        return None
+    return get_user_model().objects.filter(pk=claims.get('user'), is_active=True).first()
+
+
+def parse_event_id(event_id):
+    """'reading:anomaly:recommendation' watermarks; missing or bad parts mean "from now"."""
+    parts = (event_id or '').split(':')
+    watermarks = []
+    for index in range(3):
+        try:
+            watermarks.append(int(parts[index]))
+        except (IndexError, ValueError):
+            watermarks.append(None)
+    return watermarks
+
+
+class PlotChangeStream:
+    """
+    Server-Sent Events for one plot: new readings, anomalies and recommendations.
+    Each event's id holds the three watermarks, so a reconnecting EventSource resumes
+    exactly where it left off (Last-Event-ID). Served as a long-lived stream under ASGI;
+    under WSGI each connection gets one tick (see __iter__).
+    """
+    FEEDS = (
+        ('readings', SensorReading, SensorReadingSerializer, 'plot_id'),
+        ('anomalies', AnomalyEvent, AnomalyEventSerializer, 'plot_id'),
+        ('recommendations', AgentRecommendation, AgentRecommendationSerializer, 'anomaly_event__plot_id'),
+    )
+
+    def __init__(self, plot_id, last_event_id=None):
+        self.plot_id = plot_id
+        self.watermarks = parse_event_id(last_event_id)
+        self.version = None
+        self.started = self.last_sent = time.monotonic()
+
+    def start(self):
+        """Fills missing watermarks with the current max ids (cheap: primary key index)."""
+        for index, (_, model, _, _) in enumerate(self.FEEDS):
+            if self.watermarks[index] is None:
+                self.watermarks[index] = model.objects.aggregate(last=Max('id'))['last'] or 0
+        # Browser reconnect delay; it sends the last event id back when reconnecting
+        return f"retry: {settings.SSE_RETRY_MS}\n\n"
+
+    def event_id(self):
+        return ':'.join(str(mark) for mark in self.watermarks)
+
+    def step(self):
+        """One tick: returns the SSE chunks to send (possibly none)."""
+        chunks = []
+        version = plot_version(self.plot_id)
+        if version != self.version:
+            caught_up = True
+            for index, (name, model, serializer_class, plot_field) in enumerate(self.FEEDS):
+                queryset = model.objects.filter(**{plot_field: self.plot_id, 'id__gt': self.watermarks[index]})
+                if model is AnomalyEvent:
+                    queryset = queryset.select_related('plot')
+                rows = list(queryset.order_by('id')[:settings.SSE_MAX_ROWS])
+                if not rows:
+                    continue
+                caught_up = caught_up and len(rows) < settings.SSE_MAX_ROWS
+                self.watermarks[index] = rows[-1].id
+                data = json.dumps(serializer_class(rows, many=True).data, default=str)
+                chunks.append(f"id: {self.event_id()}\nevent: {name}\ndata: {data}\n\n")
+            # Only remember the version once everything up to it was sent
+            if caught_up:
+                self.version = version
+
+        now = time.monotonic()
+        if chunks:
+            self.last_sent = now
+        elif now - self.last_sent >= settings.SSE_HEARTBEAT_SECONDS:
+            chunks.append(": keep-alive\n\n")
+            self.last_sent = now
+        return chunks
+
+    def expired(self):
+        return time.monotonic() - self.started >= settings.SSE_MAX_SECONDS
+
+    def __iter__(self):
+        """
+        WSGI: one tick only, a thread must not be held for the life of a stream. The browser
+        reconnects after `retry:` with the last event id, so this degrades to polling.
+        """
+        yield self.start()
+        yield from self.step()
+
+    async def __aiter__(self):
+        yield await sync_to_async(self.start)()
+        step = sync_to_async(self.step)
+        while not self.expired():
+            for chunk in await step():
+                yield chunk
+            await asyncio.sleep(settings.SSE_POLL_SECONDS)
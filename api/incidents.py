@@ -0,0 +1,148 @@
+"""
+Incident coalescing for detector anomalies.
+
+An AnomalyEvent is an incident: one row per (plot, sensor_type, anomaly_type) for as long as
+the problem goes on (the sensor is part of the key: "Unusual for this plot" and "Sudden
+change" are labels every sensor shares). Repeats only bump `occurrences` and `last_seen` on
+that row (an F() update), so a failed pump reporting every tick costs no new event, agent
+job or recommendation.
+An incident stays open until INCIDENT_QUIET_MINUTES pass without a repeat; after that the
+next anomaly opens a new one, and `manage.py close_incidents` stamps `closed_at`.
+
+Open incidents are looked up in the shared cache (incident:<plot>:<sensor>:<type> -> id,
+last seen), then in the database (partial index on open incidents, only those seen within
+the quiet period of the batch).
+"""
+
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, DateTimeField, F, PositiveIntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import AnomalyEvent
+
+
+def quiet_period():
+    return datetime.timedelta(minutes=settings.INCIDENT_QUIET_MINUTES)
+
+
+def incident_key(event):
+    return event.plot_id, event.sensor_type, event.anomaly_type
+
+
+def cache_key(plot_id, sensor_type, anomaly_type):
+    return f'incident:{plot_id}:{sensor_type}:{slugify(anomaly_type)}'
+
+
+def group_events(events, quiet=None):
+    """
+    Merges one batch's unsaved events (None entries are skipped) by incident_key, in
+    `last_seen` order: an event within `quiet` of its key's previous one joins that incident.
+    Returns (incidents, owners, first seen per incident id()), owners aligned with `events`.
+    """
+    quiet = quiet or quiet_period()
+    owners = [None] * len(events)
+    incidents, current, first_seen = [], {}, {}
+    order = sorted((index for index, event in enumerate(events) if event is not None),
+                   key=lambda index: events[index].last_seen)
+    for index in order:
+        event = events[index]
+        key = incident_key(event)
+        incident = current.get(key)
+        if incident is not None and event.last_seen - incident.last_seen <= quiet:
+            incident.occurrences += 1
+            incident.last_seen = event.last_seen
+        else:
+            incident = current[key] = event
+            incidents.append(incident)
+            first_seen[id(incident)] = event.last_seen
+        owners[index] = incident
+    return incidents, owners, first_seen
+
+
+def open_incidents(incidents, first_seen, quiet):
+    """
+    {incident_key: (id, last_seen)} of open incidents that the batch's incidents continue.
+    Cache first; keys missing there, or cached as too old (another process may have
+    extended them since), are checked in the database.
+    """
+    keys = {incident_key(incident): first_seen[id(incident)] for incident in incidents}
+    cached = cache.get_many([cache_key(*key) for key in keys])
+    found, missing = {}, []
+    for key, started in keys.items():
+        hit = cached.get(cache_key(*key))
+        if hit is not None and started - hit[1] <= quiet:
+            found[key] = hit
+        else:
+            missing.append(key)
+
+    if missing:
+        match = Q()
+        for plot_id, sensor_type, anomaly_type in missing:
+            match |= Q(plot_id=plot_id, sensor_type=sensor_type, anomaly_type=anomaly_type)
+        # Incidents quiet for longer than that can't continue any of them (not closed yet, or never)
+        since = min(keys[key] for key in missing) - quiet
+        rows = AnomalyEvent.objects.filter(match, closed_at__isnull=True, last_seen__gte=since).order_by('last_seen')
+        fields = ('id', 'plot_id', 'sensor_type', 'anomaly_type', 'last_seen')
+        for event_id, *key, last_seen in rows.values_list(*fields):
+            key = tuple(key)
+            if keys[key] - last_seen <= quiet:
+                found[key] = (event_id, last_seen)  # Newest wins
+    return found
+
+
+def record(events):
+    """
+    Stores one batch of detector events as incidents. Call inside a transaction.
+    Returns (newly created incidents, list aligned with `events` holding the incident each
+    event was counted in, or None).
+    """
+    quiet = quiet_period()
+    incidents, owners, first_seen = group_events(events, quiet)
+    if not incidents:
+        return [], owners
+
+    # 1. Repeats of open incidents: counters only, one UPDATE for all of them
+    found = open_incidents(incidents, first_seen, quiet)
+    created, repeats = [], []
+    for incident in incidents:
+        existing = found.get(incident_key(incident))
+        if existing is None:
+            created.append(incident)
+            continue
+        # The batch's event now stands for the stored incident (callers report its id)
+        incident.id = existing[0]
+        repeats.append((incident.id, incident.occurrences, incident.last_seen))
+        incident.last_seen = max(incident.last_seen, existing[1])
+    if repeats:
+        AnomalyEvent.objects.filter(id__in=[event_id for event_id, _, _ in repeats]).update(
+            occurrences=F('occurrences') + Case(
+                *[When(id=event_id, then=Value(count)) for event_id, count, _ in repeats],
+                output_field=PositiveIntegerField()),
+            last_seen=Greatest(F('last_seen'), Case(
+                *[When(id=event_id, then=Value(seen)) for event_id, _, seen in repeats],
+                output_field=DateTimeField())),
+        )
+
+    # 2. New incidents (agent jobs are the caller's, for these only)
+    AnomalyEvent.objects.bulk_create(created)
+
+    # 3. Remember them for the next batch, once committed
+    entries = {cache_key(*incident_key(incident)): (incident.id, incident.last_seen) for incident in incidents}
+    timeout = int(quiet.total_seconds()) + 60
+    transaction.on_commit(lambda: cache.set_many(entries, timeout))
+    return created, owners
+
+
+def close_quiet(now=None, quiet=None):
+    """Closes open incidents without a repeat for `quiet`. Returns (incidents closed, plot ids)."""
+    now = now or timezone.now()
+    expired = AnomalyEvent.objects.filter(closed_at__isnull=True, last_seen__lt=now - (quiet or quiet_period()))
+    plot_ids = set(expired.values_list('plot_id', flat=True).distinct())
+    closed = expired.update(closed_at=now) if plot_ids else 0
+    return closed, plot_ids
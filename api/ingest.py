@@ -0,0 +1,159 @@
+import logging
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .models import SensorReading, AnomalyEvent
+from .rollups import update_rollups
+from .changes import bump_plots
+from . import incidents
+from agent_module.worker import enqueue
+# Published, versioned ML models (memory-mapped, shared by every worker)
+from ml_module import registry
+from ml_module import baselines
+from ml_module import ringbuffer
+
+logger = logging.getLogger(__name__)
+
+# Loaded once per process, on first use (so manage.py commands don't pay for it)
+_detector = None
+_checked_at = 0.0
+
+
+def get_detector():
+    global _detector, _checked_at
+    if _detector is None:
+        _detector = registry.load_or_train()
+        _checked_at = time.monotonic()
+    elif time.monotonic() - _checked_at >= settings.ML_MODEL_CHECK_SECONDS:
+        # A retrained version may have been published: swap the reference (batches in flight keep theirs)
+        _checked_at = time.monotonic()
+        _detector = registry.refresh(_detector)
+    return _detector
+
+# Reasons that always escalate to 'critical' (Updated to match ml_module/logic.py)
+CRITICAL_KEYWORDS = [
+    'failure',       # Matches "Pump Failure"
+    'drought',       # Matches "Drought"
+    'waterlogging',  # Matches "Waterlogging"
+    'heat stress',   # Matches "Heat Stress"
+    'frost',         # Matches "Frost Danger"
+    'dry air'        # Matches "Extremely Dry Air"
+]
+
+
+def classify_severity(reason, conf_score):
+    """
+    Dynamic severity logic for a detected anomaly.
+    """
+    severity = 'medium' # Default
+
+    # Rule A: Confidence Impact
+    if conf_score > 0.90:
+        severity = 'high'
+    elif conf_score < 0.60:
+        severity = 'low'
+
+    # Rule B: Critical Keywords
+    if any(k in reason.lower() for k in CRITICAL_KEYWORDS) and conf_score > 0.8:
+        severity = 'critical'
+
+    # Rule C: Downgrade vague "Abnormal Patterns"
+    if 'abnormal' in reason.lower():
+        if severity == 'critical': severity = 'high'
+
+    return severity
+
+
+def anomaly_events(readings, verbose=True, store=None, recent=None):
+    """
+    Runs the ML check over already saved readings in one vectorized call.
+    `store` / `recent`: a BaselineStore and RecentReadings to judge against instead of the
+    live, process-wide ones (which are then left alone). The live baselines are flushed
+    after the request (api/signals.py), not here.
+    Returns a list aligned with `readings` holding an unsaved AnomalyEvent (or None).
+    """
+    events = [None] * len(readings)
+    sensor_types = [reading.sensor_type for reading in readings]
+    values = [reading.value for reading in readings]
+
+    # Each reading is judged against its plot's own history too (and then folded into it)
+    store = store or baselines.get_store()
+    deviation = store.observe([reading.plot_id for reading in readings], sensor_types, values)
+    # ...and against its last few readings (which also keeps the in-memory recent readings current)
+    window = ringbuffer.append(readings, recent)
+    result = get_detector().check_anomaly_batch(sensor_types, values, deviation=deviation,
+                                                window_deviation=window['window_z'])
+    reasons = result.reasons
+
+    for index in np.flatnonzero(result.is_anomaly):
+        reading = readings[index]
+        reason = reasons[index]
+        conf_score = float(result.confidence[index])
+
+        severity = classify_severity(reason, conf_score)
+        if verbose:
+            print(f"🚨 ANOMALY: {reason} (Val: {reading.value}, Conf: {conf_score}, Sev: {severity})")
+
+        events[index] = AnomalyEvent(
+            plot_id=reading.plot_id,
+            anomaly_type=reason,
+            description=f"Abnormal {reading.sensor_type} reading: {reading.value}",
+            severity=severity,
+            model_confidence=conf_score,
+            sensor_type=reading.sensor_type,
+            value=reading.value,
+            reason_code=int(result.reason_code[index]),
+            reading=reading,
+            last_seen=reading.timestamp,
+        )
+    return events
+
+
+def detect_anomalies(readings):
+    """
+    Stores the detector hits among saved readings as incidents: repeats of an open
+    (plot, anomaly type) incident only update its counters (api/incidents.py).
+    Call inside the transaction that stores the readings.
+    Returns a list aligned with `readings` holding the incident (or None).
+    """
+    # 1. Scoring: a detector failure must not lose the readings (savepoint: the baseline
+    #    and recent-reading loads query the DB, a failed query must not break the transaction)
+    try:
+        with transaction.atomic():
+            events = anomaly_events(readings)
+    except Exception:
+        logger.exception("Anomaly detection failed on %d readings", len(readings))
+        return [None] * len(readings)
+
+    # 2. Storing: with the readings. A failure here rolls them back too and reaches the
+    #    caller, so a retry stores nothing twice
+    if any(event is not None for event in events):
+        # bulk_create skips post_save, so the agent jobs are queued explicitly
+        # (the worker generates recommendations off the request path, once per incident)
+        created, events = incidents.record(events)
+        enqueue(created)
+        repeats = sum(event is not None for event in events) - len(created)
+        print(f"✅ {len(created)} anomalies saved, {repeats} repeats counted in open incidents.")
+
+    return events
+
+
+def ingest_readings(readings):
+    """
+    Stores unsaved SensorReading instances in one INSERT, folds them into the rollups
+    and runs detection once over the batch, all in one transaction.
+    Returns (readings, events) where events is aligned with readings.
+    """
+    with transaction.atomic():
+        readings = SensorReading.objects.bulk_create(readings)
+        # Hourly/daily aggregates move with the raw rows
+        update_rollups(readings)
+        events = detect_anomalies(readings)
+        # Wake the dashboards watching these plots (bulk_create sends no post_save);
+        # the recent-readings buffers that took this batch stay current for the new version
+        bump_plots((reading.plot_id for reading in readings),
+                   then=lambda before, now: ringbuffer.restamp(readings, before, now))
+    return readings, events
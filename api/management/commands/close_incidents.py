@@ -0,0 +1,22 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.changes import bump_plots
+from api.incidents import close_quiet
+
+
+class Command(BaseCommand):
+    help = "Closes anomaly incidents that had no repeat for INCIDENT_QUIET_MINUTES (run it periodically)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quiet-minutes', type=float, default=None,
+                            help="Override INCIDENT_QUIET_MINUTES for this run.")
+
+    def handle(self, *args, **options):
+        minutes = options['quiet_minutes'] or settings.INCIDENT_QUIET_MINUTES
+        closed, plot_ids = close_quiet(quiet=datetime.timedelta(minutes=minutes))
+        # Anomaly lists show closed_at
+        bump_plots(plot_ids)
+        self.stdout.write(self.style.SUCCESS(f"✅ Closed {closed} incidents on {len(plot_ids)} plots"))
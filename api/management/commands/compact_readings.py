@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from api.changes import bump_everything
+from api.retention import (
+    retention_rules, estimate_row_bytes, compact, expired_hourly_rollups
+)
+
+
+class Command(BaseCommand):
+    help = ("Applies settings.READING_RETENTION: deletes raw readings older than their policy window "
+            "(their history stays in the rollups) in small, bounded transactions.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Rows per DELETE transaction.")
+        parser.add_argument('--sleep', type=float, default=0.05, help="Pause (seconds) between chunks.")
+
+    def handle(self, *args, **options):
+        row_bytes = estimate_row_bytes()
+        total = 0
+
+        for label, cutoff, expired in retention_rules():
+            if options['dry_run']:
+                count = expired.count()
+                total += count
+                self.stdout.write(f"[{label}] {count} readings before {cutoff:%Y-%m-%d} "
+                                  f"(~{count * row_bytes / 1024 ** 2:.1f} MiB)")
+                continue
+
+            self.stdout.write(f"[{label}] compacting readings before {cutoff:%Y-%m-%d}...")
+            deleted, rebuilt, kept = compact(
+                expired, cutoff, chunk_size=options['chunk_size'], pause=options['sleep'],
+                progress=lambda n: self.stdout.write(f"   ... {n} deleted"),
+            )
+            total += deleted
+            if rebuilt:
+                self.stdout.write(f"   rebuilt the rollups of {rebuilt} plot/sensor days before deleting them")
+            for day in kept:
+                self.stdout.write(self.style.WARNING(f"   kept {day:%Y-%m-%d}: its rollups still don't match the raw readings"))
+
+        hourly = expired_hourly_rollups()
+        if options['dry_run']:
+            self.stdout.write(f"[rollups] {hourly.count()} hourly buckets past retention (daily buckets kept)")
+            self.stdout.write(self.style.SUCCESS(
+                f"Dry run: {total} readings, ~{total * row_bytes / 1024 ** 2:.1f} MiB would be reclaimed"
+            ))
+            return
+
+        dropped, _ = hourly.delete()
+        # Cached list responses may still contain the deleted rows
+        bump_everything()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {total} raw readings and {dropped} hourly rollups"))
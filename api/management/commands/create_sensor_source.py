@@ -0,0 +1,33 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api.authentication import generate_key, key_plots
+from api.models import FieldPlot, SensorSource
+
+
+class Command(BaseCommand):
+    help = "Registers a field device / gateway and prints its API key (shown only once)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help="Device name, also stored as the readings' source.")
+        parser.add_argument('--owner', required=True, help="Username the device sends data for.")
+        parser.add_argument('--plot', type=int, action='append', required=True, dest='plots',
+                            help="Plot the device may write to (repeatable).")
+
+    def handle(self, *args, **options):
+        owner = User.objects.filter(username=options['owner']).first()
+        if owner is None:
+            raise CommandError(f"No user named {options['owner']}")
+
+        plots = key_plots(owner, FieldPlot.objects.filter(id__in=options['plots']))
+        missing = set(options['plots']) - set(plots.values_list('id', flat=True))
+        if missing:
+            raise CommandError(f"Plots not found or not owned by {owner.username}: {sorted(missing)}")
+
+        key, prefix, digest = generate_key()
+        source = SensorSource.objects.create(name=options['name'], owner=owner, key_prefix=prefix, key_hash=digest)
+        source.plots.set(plots)
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Created {source} for plots {sorted(options['plots'])}"))
+        self.stdout.write(f"API key (store it now, it is not kept): {key}")
+        self.stdout.write(f"Use it as: Authorization: Api-Key {key}")
@@ -0,0 +1,95 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.backfill import history_state, iter_records, parse_record, load_chunk
+from api.changes import bump_everything
+from api.models import FieldPlot, ReadingImport
+
+
+class Command(BaseCommand):
+    help = ("Loads historical readings from CSV (with a header: plot, sensor_type, value, timestamp[, source]) "
+            "or JSON-lines files, in resumable chunks (COPY on PostgreSQL, bulk_create elsewhere).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help=".csv or .jsonl files")
+        parser.add_argument('--chunk-size', type=int, default=10000, help="Rows per transaction.")
+        parser.add_argument('--source', default='import', help="Source for rows that don't name one.")
+        parser.add_argument('--detect', action='store_true',
+                            help="Run anomaly detection and the Rule Engine over the imported rows.")
+        parser.add_argument('--no-rollups', action='store_true',
+                            help="Skip the rollup upserts (run `rebuild_rollups` for the range afterwards; "
+                                 "rows past the retention window are rolled up by `compact_readings`).")
+        parser.add_argument('--restart', action='store_true',
+                            help="Ignore the checkpoint and load the file from the start (duplicates rows already loaded).")
+        parser.add_argument('--max-errors', type=int, default=None,
+                            help="Abort a file after this many rejected rows (default: never).")
+
+    def handle(self, *args, **options):
+        known_plots = set(FieldPlot.objects.values_list('id', flat=True))
+        total = 0
+        for path in options['paths']:
+            if not os.path.isfile(path):
+                raise CommandError(f"No such file: {path}")
+            if not path.endswith(('.csv', '.jsonl', '.ndjson')):
+                raise CommandError(f"Unsupported format (use .csv or .jsonl): {path}")
+            total += self.import_file(path, known_plots, options)
+
+        if total:
+            # Cached list responses don't know about rows that skipped the ingest path
+            bump_everything()
+        self.stdout.write(self.style.SUCCESS(f"Imported {total} readings"))
+
+    def import_file(self, path, known_plots, options):
+        # 1. Checkpoint: resume after the last committed chunk
+        checkpoint, _ = ReadingImport.objects.get_or_create(name=os.path.abspath(path))
+        size = os.path.getsize(path)
+        if options['restart']:
+            checkpoint.offset = checkpoint.rows = checkpoint.rejected = checkpoint.anomalies = 0
+            checkpoint.finished_at = None
+            checkpoint.save()
+        elif checkpoint.finished_at is not None:
+            self.stdout.write(f"⏭️  {path}: already imported ({checkpoint.rows} rows), use --restart to load it again")
+            return 0
+        elif checkpoint.offset > size:
+            raise CommandError(f"{path} is smaller than its checkpoint: the file changed, use --restart")
+        elif checkpoint.offset:
+            self.stdout.write(f"↪️  {path}: resuming at byte {checkpoint.offset} ({checkpoint.rows} rows loaded)")
+
+        # 2. Stream, validate and load in chunks
+        chunk_size = options['chunk_size']
+        readings, rejected, offset = [], 0, checkpoint.offset
+        loaded, started = 0, time.monotonic()
+        # Detection learns each file's history on its own (a resumed load starts it over)
+        history = history_state() if options['detect'] else None
+
+        def flush():
+            nonlocal readings, rejected, loaded
+            load_chunk(readings, checkpoint, offset, rejected,
+                       rollups=not options['no_rollups'], detect=options['detect'], history=history)
+            loaded += len(readings)
+            readings, rejected = [], 0
+            rate = loaded / max(time.monotonic() - started, 1e-9)
+            self.stdout.write(f"   📥 {checkpoint.rows} rows ({offset / max(size, 1):.1%} of {path}), "
+                              f"{checkpoint.rejected} rejected, {checkpoint.anomalies} anomalies, {rate:.0f} rows/s")
+
+        for record, offset in iter_records(path, checkpoint.offset):
+            try:
+                readings.append(parse_record(record, known_plots, options['source']))
+            except ValueError as e:
+                rejected += 1
+                if checkpoint.rejected + rejected <= 10:
+                    self.stderr.write(f"   ⚠️  Rejected row before byte {offset}: {e}")
+                if options['max_errors'] is not None and checkpoint.rejected + rejected > options['max_errors']:
+                    raise CommandError(f"{path}: more than {options['max_errors']} rejected rows, stopping "
+                                       f"(the checkpoint keeps the committed chunks)")
+            if len(readings) >= chunk_size:
+                flush()
+        flush()
+
+        checkpoint.finished_at = timezone.now()
+        checkpoint.save(update_fields=['finished_at', 'updated_at'])
+        self.stdout.write(self.style.SUCCESS(f"✅ {path}: {loaded} readings loaded"))
+        return loaded
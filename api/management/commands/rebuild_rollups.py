@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import rollups
+from api.changes import bump_everything
+from api.retention import compacted_before
+
+
+def parse_moment(value):
+    moment = rollups.parse_moment(value)
+    if moment is None:
+        raise CommandError(f"Invalid date/datetime: {value}")
+    return moment
+
+
+class Command(BaseCommand):
+    help = "Regenerates hourly/daily SensorRollup rows from raw readings for a time range (widened to whole UTC days)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', required=True, help="Start date/datetime (inclusive), e.g. 2025-01-01")
+        parser.add_argument('--end', required=True, help="End date/datetime (exclusive), e.g. 2025-02-01")
+        parser.add_argument('--plot', type=int, nargs='*', dest='plots', help="Only these plot ids.")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        start, end = parse_moment(options['start']), parse_moment(options['end'])
+        if end <= start:
+            raise CommandError("--end must be after --start")
+
+        # Compacted days only live on in their rollups: rebuilding them from what's left would lose them
+        cutoff = compacted_before()
+        if cutoff is not None and start < cutoff:
+            if end <= cutoff:
+                raise CommandError(f"Raw readings before {cutoff:%Y-%m-%d} may be compacted (READING_RETENTION): "
+                                   f"their rollups can't be rebuilt")
+            self.stderr.write(f"⚠️  Starting at {cutoff:%Y-%m-%d}: earlier raw readings may be compacted")
+            start = cutoff
+
+        folded = rollups.rebuild_rollups(start, end, plot_ids=options['plots'], chunk_size=options['chunk_size'])
+        bump_everything()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups from {folded} readings ({start:%Y-%m-%d} -> {end:%Y-%m-%d})"))
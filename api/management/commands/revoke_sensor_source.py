@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from api.models import SensorSource
+
+
+class Command(BaseCommand):
+    help = "Revokes device API keys by key prefix (the part before the dot) or by name."
+
+    def add_arguments(self, parser):
+        parser.add_argument('keys', nargs='+', help="Key prefixes or device names.")
+
+    def handle(self, *args, **options):
+        keys = options['keys']
+        matched = list(SensorSource.objects.filter(Q(key_prefix__in=keys) | Q(name__in=keys), is_active=True))
+        if not matched:
+            raise CommandError("No active device matches.")
+
+        # save() (not update()) so the signals drop this process's key cache
+        for source in matched:
+            source.is_active = False
+            source.revoked_at = timezone.now()
+            source.save(update_fields=['is_active', 'revoked_at'])
+            self.stdout.write(f"🔒 Revoked {source}")
+        self.stdout.write(self.style.SUCCESS("Other processes reject the keys within DEVICE_KEY_CACHE_SECONDS."))
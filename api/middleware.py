@@ -0,0 +1,82 @@
+"""
+Per-request SQL accounting.
+
+Every query on every database connection is counted and timed through
+connection.execute_wrapper (works with DEBUG off, unlike connection.queries):
+
+  * debug: `X-DB-Queries`, `X-DB-Time-Ms` and a `Server-Timing` entry on each response
+    (settings.QUERY_COUNT_HEADERS, on when DEBUG is);
+  * metrics: one record per request on the `api.queries` logger (view, queries, ms),
+    a WARNING when the view ran more queries than its declared `query_budget`.
+
+API views declare `query_budget`: the most queries one request may run whatever the number
+of rows (class attribute, or @query_budget(n) on function views). api/tests.py holds every
+view to its budget. Streaming responses are only counted up to their first byte.
+"""
+
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('api.queries')
+
+
+def query_budget(count):
+    """Declares the query budget of a function view."""
+    def decorate(view):
+        view.query_budget = count
+        return view
+    return decorate
+
+
+class QueryStats:
+    """execute_wrapper callable: counts and times the queries run through it."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class QueryCountMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(stats))
+            response = self.get_response(request)
+
+        milliseconds = stats.seconds * 1000
+        if settings.QUERY_COUNT_HEADERS:
+            response['X-DB-Queries'] = str(stats.count)
+            response['X-DB-Time-Ms'] = f'{milliseconds:.2f}'
+            response['Server-Timing'] = f'db;dur={milliseconds:.2f};desc="{stats.count} queries"'
+
+        view = getattr(request, 'query_view', None)
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None and stats.count > budget:
+            logger.warning("%s %s ran %d queries (budget %d, %.1f ms)",
+                           request.method, view, stats.count, budget, milliseconds)
+        else:
+            logger.info("%s %s ran %d queries (%.1f ms)", request.method, view or request.path,
+                        stats.count, milliseconds)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # DRF / class-based views: as_view() keeps the class on the function
+        view = getattr(view_func, 'view_class', None) or view_func
+        request.query_view = getattr(view, '__name__', None)
+        request.query_budget = getattr(view, 'query_budget', None)
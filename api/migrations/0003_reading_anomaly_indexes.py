@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:04
+
+from django.db import migrations, models
+
+
+# BRIN is PostgreSQL-only; readings are appended in (roughly) timestamp order,
+# so a BRIN index makes time-range scans cheap at a tiny fraction of a B-tree's size.
+def create_brin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS reading_timestamp_brin '
+            'ON api_sensorreading USING brin ("timestamp")'
+        )
+
+
+def drop_brin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS reading_timestamp_brin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_farmprofile_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agentrecommendation',
+            index=models.Index(fields=['-created_at'], name='recommendation_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='anomalyevent',
+            index=models.Index(fields=['plot', '-timestamp'], name='anomaly_plot_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='anomalyevent',
+            index=models.Index(fields=['-timestamp'], name='anomaly_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sensorreading',
+            index=models.Index(fields=['plot', 'sensor_type', '-timestamp'], name='reading_plot_type_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sensorreading',
+            index=models.Index(fields=['plot', 'timestamp'], name='reading_plot_ts_idx'),
+        ),
+        migrations.RunPython(create_brin_index, drop_brin_index),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:08
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copy of ml_module.logic.REASON_LABELS at the time of this migration
+REASON_LABELS = [
+    "Normal", "Unknown", "Heat Stress", "Frost Danger", "Drought / Pump Failure", "Waterlogging",
+    "Extremely Dry Air", "High Humidity", "Abnormal temperature pattern",
+    "Abnormal humidity pattern", "Abnormal moisture pattern",
+]
+DESCRIPTION = re.compile(r"Abnormal (\w+) reading: ([-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)")
+
+
+def backfill_payload(apps, schema_editor):
+    """Parses the legacy description text once, so nothing has to parse it again."""
+    AnomalyEvent = apps.get_model('api', 'AnomalyEvent')
+    codes = {label: code for code, label in enumerate(REASON_LABELS)}
+
+    batch = []
+    events = AnomalyEvent.objects.filter(value__isnull=True).only('id', 'anomaly_type', 'description')
+    for event in events.iterator(chunk_size=2000):
+        match = DESCRIPTION.search(event.description)
+        if match:
+            event.sensor_type, event.value = match.group(1), float(match.group(2))
+        event.reason_code = codes.get(event.anomaly_type)
+        batch.append(event)
+        if len(batch) >= 2000:
+            AnomalyEvent.objects.bulk_update(batch, ['sensor_type', 'value', 'reason_code'])
+            batch = []
+    AnomalyEvent.objects.bulk_update(batch, ['sensor_type', 'value', 'reason_code'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_sensorrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='anomalyevent',
+            name='reading',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='anomalies', to='api.sensorreading'),
+        ),
+        migrations.AddField(
+            model_name='anomalyevent',
+            name='reason_code',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='anomalyevent',
+            name='sensor_type',
+            field=models.CharField(blank=True, choices=[('moisture', 'Soil Moisture'), ('temperature', 'Air Temperature'), ('humidity', 'Humidity')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='anomalyevent',
+            name='value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_payload, migrations.RunPython.noop),
+    ]
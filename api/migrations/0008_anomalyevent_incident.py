@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:49
+
+import datetime
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_last_seen(apps, schema_editor):
+    """
+    Existing events become one-occurrence incidents, last seen when they were detected.
+    Those already quiet for INCIDENT_QUIET_MINUTES are closed, so they stay out of the
+    open-incident index.
+    """
+    AnomalyEvent = apps.get_model('api', 'AnomalyEvent')
+    AnomalyEvent.objects.update(last_seen=models.F('timestamp'))
+    now = django.utils.timezone.now()
+    quiet = datetime.timedelta(minutes=settings.INCIDENT_QUIET_MINUTES)
+    AnomalyEvent.objects.filter(last_seen__lt=now - quiet).update(closed_at=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_readingimport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='anomalyevent',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='anomalyevent',
+            name='last_seen',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='anomalyevent',
+            name='occurrences',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(backfill_last_seen, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='anomalyevent',
+            index=models.Index(condition=models.Q(('closed_at__isnull', True)), fields=['plot', 'sensor_type', 'anomaly_type'], name='anomaly_open_incident_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 class FarmProfile(models.Model):
@@ -20,6 +21,24 @@ class FieldPlot(models.Model):
     def __str__(self):
         return f"{self.plot_name} ({self.crop_variety})"
 
+class SensorSource(models.Model):
+    """
+    A field device or gateway with its own long-lived API key, allowed to push readings
+    to specific plots only. Only a SHA-256 digest of the key is stored; the key itself
+    is shown once, by `manage.py create_sensor_source`.
+    """
+    name = models.CharField(max_length=50)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sensor_sources')
+    plots = models.ManyToManyField(FieldPlot, related_name='sensor_sources', blank=True)
+    key_prefix = models.CharField(max_length=8, unique=True)  # Public part of the key, to recognise it
+    key_hash = models.CharField(max_length=64, unique=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.key_prefix})"
+
 class SensorReading(models.Model):
     SENSOR_TYPES = [
         ('moisture', 'Soil Moisture'),
@@ -32,6 +51,52 @@ class SensorReading(models.Model):
     timestamp = models.DateTimeField()
     source = models.CharField(max_length=50, default='simulator')
 
+    class Meta:
+        indexes = [
+            # Dashboard "latest per sensor" + per-sensor history of a plot
+            models.Index(fields=['plot', 'sensor_type', '-timestamp'], name='reading_plot_type_ts_idx'),
+            # Plot history ordered by time (list endpoint, keyset pages)
+            models.Index(fields=['plot', 'timestamp'], name='reading_plot_ts_idx'),
+        ]
+        # + BRIN on timestamp (PostgreSQL only), see migration 0003
+
+class SensorRollup(models.Model):
+    """
+    Pre-aggregated readings per (plot, sensor_type, hour/day bucket).
+    Maintained incrementally on ingest (api/rollups.py); rebuild with `manage.py rebuild_rollups`.
+    """
+    GRANULARITIES = [('hour', 'Hourly'), ('day', 'Daily')]
+
+    plot = models.ForeignKey(FieldPlot, on_delete=models.CASCADE, related_name='rollups')
+    sensor_type = models.CharField(max_length=20, choices=SensorReading.SENSOR_TYPES)
+    granularity = models.CharField(max_length=4, choices=GRANULARITIES)
+    bucket = models.DateTimeField()
+    count = models.IntegerField()
+    total = models.FloatField()  # Running sum, so the mean stays exact across upserts
+    mean = models.FloatField()
+    min_value = models.FloatField()
+    max_value = models.FloatField()
+    last_value = models.FloatField()
+    last_timestamp = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['plot', 'sensor_type', 'granularity', 'bucket'], name='unique_rollup_bucket'),
+        ]
+
+class ReadingImport(models.Model):
+    """
+    Checkpoint of a `manage.py import_readings` load. Saved in the same transaction as
+    each chunk, so a rerun resumes right after the last committed row.
+    """
+    name = models.CharField(max_length=255, unique=True)  # Absolute path of the file, by default
+    offset = models.BigIntegerField(default=0)  # Bytes of the file already loaded
+    rows = models.BigIntegerField(default=0)
+    rejected = models.BigIntegerField(default=0)
+    anomalies = models.BigIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
 class AnomalyEvent(models.Model):
     SEVERITY = [('low', 'Low'), ('medium', 'Medium'), ('high', 'High'), ('critical', 'Critical')]
     
@@ -42,9 +107,33 @@ class AnomalyEvent(models.Model):
     model_confidence = models.FloatField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    # Structured payload, so the agent never has to parse `description`
+    sensor_type = models.CharField(max_length=20, choices=SensorReading.SENSOR_TYPES, blank=True)
+    value = models.FloatField(null=True, blank=True)
+    reason_code = models.PositiveSmallIntegerField(null=True, blank=True)  # ml_module.logic.REASON_LABELS index
+    reading = models.ForeignKey(SensorReading, on_delete=models.SET_NULL, null=True, blank=True, related_name='anomalies')
+
+    # Incident: repeats of the same (plot, sensor_type, anomaly_type) are counted here, not stored (api/incidents.py)
+    occurrences = models.PositiveIntegerField(default=1)
+    last_seen = models.DateTimeField(default=timezone.now)
+    closed_at = models.DateTimeField(null=True, blank=True)  # Set once quiet for INCIDENT_QUIET_MINUTES
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['plot', '-timestamp'], name='anomaly_plot_ts_idx'),
+            models.Index(fields=['-timestamp'], name='anomaly_ts_idx'),
+            models.Index(fields=['plot', 'sensor_type', 'anomaly_type'], condition=models.Q(closed_at__isnull=True),
+                         name='anomaly_open_incident_idx'),
+        ]
+
 class AgentRecommendation(models.Model):
     anomaly_event = models.OneToOneField(AnomalyEvent, on_delete=models.CASCADE, related_name='recommendation')
     recommended_action = models.CharField(max_length=255)
     explanation_text = models.TextField()
     confidence = models.FloatField()
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at'], name='recommendation_created_idx'),
+        ]
\ No newline at end of file
@@ -0,0 +1,160 @@
+"""
+Retention for raw readings.
+
+Raw rows older than their policy's window are deleted; their history survives in the
+hourly/daily SensorRollup buckets, which are maintained on every ingest path.
+Hourly buckets can themselves be dropped after `hourly_rollup_days`, leaving daily ones.
+Cutoffs are aligned to UTC midnight so a day is never half raw / half compacted.
+
+Compaction goes one UTC day at a time and never trusts the rollups blindly: before a day's
+rows are deleted, every (plot, sensor type) whose daily rollup counts fewer readings than
+are stored raw is rebuilt from them (api/rollups.rebuild_rollups). A day that still doesn't
+match afterwards is kept.
+"""
+
+import datetime
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .models import SensorReading, SensorRollup
+from .rollups import rebuild_rollups
+
+# Used by dry runs when the database can't tell us the real average row size
+FALLBACK_ROW_BYTES = 120
+
+
+def day_floor(moment):
+    return moment.astimezone(datetime.timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def retention_rules(now=None):
+    """
+    Resolves settings.READING_RETENTION into (label, cutoff, queryset of expired readings).
+    Most specific wins: a farm override beats a sensor type override, which beats the default.
+    """
+    now = now or timezone.now()
+    policy = settings.READING_RETENTION
+    farms = policy.get('farms', {})
+    sensor_types = policy.get('sensor_types', {})
+
+    not_overridden_farm = ~Q(plot__farm_id__in=list(farms))
+    rules = [(f"farm {farm_id}", Q(plot__farm_id=farm_id), days) for farm_id, days in farms.items()]
+    rules += [
+        (f"sensor {sensor_type}", Q(sensor_type=sensor_type) & not_overridden_farm, days)
+        for sensor_type, days in sensor_types.items()
+    ]
+    rules.append(("default", ~Q(sensor_type__in=list(sensor_types)) & not_overridden_farm, policy.get('default_days')))
+
+    for label, condition, days in rules:
+        if days is None:
+            continue  # Keep forever
+        cutoff = day_floor(now - datetime.timedelta(days=days))
+        yield label, cutoff, SensorReading.objects.filter(condition, timestamp__lt=cutoff)
+
+
+def compacted_before(now=None):
+    """
+    Latest raw cutoff of any rule, or None when every rule keeps forever. Before it some raw
+    readings may be gone and the rollups are the only full copy: they must not be rebuilt.
+    """
+    cutoffs = [cutoff for _, cutoff, _ in retention_rules(now)]
+    return max(cutoffs) if cutoffs else None
+
+
+def estimate_row_bytes():
+    """Average on-disk bytes per reading (heap + indexes), from PostgreSQL statistics."""
+    if connection.vendor != 'postgresql':
+        return FALLBACK_ROW_BYTES
+    table = SensorReading._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_total_relation_size(%s::regclass), reltuples FROM pg_class WHERE oid = %s::regclass",
+            [table, table],
+        )
+        total_bytes, tuples = cursor.fetchone()
+    if not tuples or tuples <= 0:
+        return FALLBACK_ROW_BYTES
+    return total_bytes / tuples
+
+
+def delete_in_chunks(queryset, chunk_size=5000, pause=0.0, progress=None):
+    """
+    Deletes the queryset's rows in short transactions of at most `chunk_size` rows,
+    so no long lock is held and autovacuum can keep up between chunks.
+    """
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            count, _ = SensorReading.objects.filter(id__in=ids).delete()
+        deleted += count
+        if progress:
+            progress(deleted)
+        if pause:
+            time.sleep(pause)
+
+
+def rollup_gaps(readings, day):
+    """
+    {sensor_type: [plot ids]} whose daily rollup for `day` counts fewer of the readings than
+    are stored raw. More in the rollup is fine: the day was partly compacted already.
+    """
+    raw = (readings.filter(timestamp__gte=day, timestamp__lt=day + datetime.timedelta(days=1))
+           .order_by().values('plot_id', 'sensor_type').annotate(count=Count('id'))
+           .values_list('plot_id', 'sensor_type', 'count'))
+    rolled = dict(((plot_id, sensor_type), count) for plot_id, sensor_type, count in SensorRollup.objects.filter(
+        granularity='day', bucket=day).values_list('plot_id', 'sensor_type', 'count'))
+
+    gaps = {}
+    for plot_id, sensor_type, count in raw:
+        if rolled.get((plot_id, sensor_type), 0) < count:
+            gaps.setdefault(sensor_type, []).append(plot_id)
+    return gaps
+
+
+def compact(expired, cutoff, chunk_size=5000, pause=0.0, progress=None):
+    """
+    Deletes the expired readings day by day, oldest first, rebuilding a day's rollups from
+    its raw rows first where they don't hold all of them.
+    Returns (readings deleted, (plot, sensor type) days rebuilt, days kept because they didn't match).
+    """
+    first = expired.aggregate(first=Min('timestamp'))['first']
+    deleted = rebuilt = 0
+    kept = []
+    day = day_floor(first) if first is not None else cutoff
+    while day < cutoff:
+        next_day = day + datetime.timedelta(days=1)
+
+        # 1. The rollups must hold every reading about to go
+        gaps = rollup_gaps(expired, day)
+        for sensor_type, plot_ids in gaps.items():
+            # Per sensor type: another (plot, sensor type) of these plots may already be compacted
+            rebuild_rollups(day, next_day, plot_ids=plot_ids, chunk_size=chunk_size, sensor_types=[sensor_type])
+            rebuilt += len(plot_ids)
+        if gaps and rollup_gaps(expired, day):
+            kept.append(day)  # Written to while we rebuilt: leave it for the next run
+            day = next_day
+            continue
+
+        # 2. Then the raw rows
+        report = None
+        if progress:
+            report = lambda count, done=deleted: progress(done + count)
+        deleted += delete_in_chunks(expired.filter(timestamp__gte=day, timestamp__lt=next_day),
+                                    chunk_size=chunk_size, pause=pause, progress=report)
+        day = next_day
+    return deleted, rebuilt, kept
+
+
+def expired_hourly_rollups(now=None):
+    days = settings.READING_RETENTION.get('hourly_rollup_days')
+    if days is None:
+        return SensorRollup.objects.none()
+    cutoff = day_floor((now or timezone.now()) - datetime.timedelta(days=days))
+    return SensorRollup.objects.filter(granularity='hour', bucket__lt=cutoff)
@@ -0,0 +1,141 @@
+import datetime
+
+from django.db import connection, transaction
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import SensorReading, SensorRollup
+
+GRANULARITIES = ('hour', 'day')
+
+# Rows per INSERT ... ON CONFLICT statement
+UPSERT_CHUNK = 500
+
+
+def bucket_start(timestamp, granularity):
+    """Start of the UTC hour/day the timestamp falls into."""
+    timestamp = timestamp.astimezone(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        timestamp = timestamp.replace(hour=0)
+    return timestamp
+
+
+def parse_moment(value):
+    """ISO 8601 datetime or date (naive values are UTC), or None when `value` isn't one."""
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                return None
+            moment = datetime.datetime.combine(day, datetime.time())
+    except ValueError:  # Well formed but out of range, e.g. month 13
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment
+
+
+def aggregate(readings):
+    """
+    Folds readings into partial rollups: key -> [count, total, min, max, last_value, last_timestamp]
+    with key = (plot_id, sensor_type, granularity, bucket).
+    """
+    rows = {}
+    for reading in readings:
+        for granularity in GRANULARITIES:
+            key = (reading.plot_id, reading.sensor_type, granularity, bucket_start(reading.timestamp, granularity))
+            row = rows.get(key)
+            if row is None:
+                rows[key] = [1, reading.value, reading.value, reading.value, reading.value, reading.timestamp]
+                continue
+            row[0] += 1
+            row[1] += reading.value
+            row[2] = min(row[2], reading.value)
+            row[3] = max(row[3], reading.value)
+            if reading.timestamp >= row[5]:
+                row[4], row[5] = reading.value, reading.timestamp
+    return rows
+
+
+def _upsert_sql(rows):
+    table = connection.ops.quote_name(SensorRollup._meta.db_table)
+    # PostgreSQL has LEAST/GREATEST; SQLite's scalar min()/max() do the same
+    least, greatest = ('LEAST', 'GREATEST') if connection.vendor == 'postgresql' else ('MIN', 'MAX')
+    values = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'] * rows)
+    return f"""
+        INSERT INTO {table}
+            (plot_id, sensor_type, granularity, bucket, count, total, mean,
+             min_value, max_value, last_value, last_timestamp)
+        VALUES {values}
+        ON CONFLICT (plot_id, sensor_type, granularity, bucket) DO UPDATE SET
+            count = {table}.count + EXCLUDED.count,
+            total = {table}.total + EXCLUDED.total,
+            mean = ({table}.total + EXCLUDED.total) / ({table}.count + EXCLUDED.count),
+            min_value = {least}({table}.min_value, EXCLUDED.min_value),
+            max_value = {greatest}({table}.max_value, EXCLUDED.max_value),
+            last_value = CASE WHEN EXCLUDED.last_timestamp >= {table}.last_timestamp
+                              THEN EXCLUDED.last_value ELSE {table}.last_value END,
+            last_timestamp = {greatest}({table}.last_timestamp, EXCLUDED.last_timestamp)
+    """
+
+
+def update_rollups(readings):
+    """
+    Merges a batch of readings into the hourly and daily rollups with INSERT ... ON CONFLICT.
+    Keys are upserted in sorted order so concurrent batches can't deadlock each other.
+    """
+    rows = aggregate(readings)
+    if not rows:
+        return 0
+
+    adapt = connection.ops.adapt_datetimefield_value
+    params = []
+    for key in sorted(rows):
+        plot_id, sensor_type, granularity, bucket = key
+        count, total, low, high, last_value, last_timestamp = rows[key]
+        params.append([plot_id, sensor_type, granularity, adapt(bucket), count, total, total / count,
+                       low, high, last_value, adapt(last_timestamp)])
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(params), UPSERT_CHUNK):
+            chunk = params[start:start + UPSERT_CHUNK]
+            cursor.execute(_upsert_sql(len(chunk)), [value for row in chunk for value in row])
+    return len(rows)
+
+
+def rebuild_rollups(start, end, plot_ids=None, chunk_size=5000, sensor_types=None):
+    """
+    Regenerates rollups from raw readings for [start, end), widened to whole UTC days
+    so no bucket is left half-counted. Streams readings in constant memory.
+    The rollups in the range are replaced: only use it for days whose raw readings are all
+    still stored (not before api/retention.compacted_before(), compaction aside).
+    `plot_ids` / `sensor_types` limit it to those plots / sensor types.
+    Returns the number of readings folded in.
+    """
+    start = bucket_start(start, 'day')
+    day_end = bucket_start(end, 'day')
+    end = day_end if day_end == end else day_end + datetime.timedelta(days=1)
+    end = max(end, start + datetime.timedelta(days=1))
+
+    rollups = SensorRollup.objects.filter(bucket__gte=start, bucket__lt=end)
+    readings = SensorReading.objects.filter(timestamp__gte=start, timestamp__lt=end)
+    if plot_ids:
+        rollups = rollups.filter(plot_id__in=plot_ids)
+        readings = readings.filter(plot_id__in=plot_ids)
+    if sensor_types:
+        rollups = rollups.filter(sensor_type__in=sensor_types)
+        readings = readings.filter(sensor_type__in=sensor_types)
+
+    folded = 0
+    with transaction.atomic():
+        rollups.delete()
+        batch = []
+        for reading in readings.only('plot_id', 'sensor_type', 'value', 'timestamp').iterator(chunk_size=chunk_size):
+            batch.append(reading)
+            if len(batch) >= chunk_size:
+                update_rollups(batch)
+                folded += len(batch)
+                batch = []
+        update_rollups(batch)
+        folded += len(batch)
+    return folded
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import FarmProfile, FieldPlot, SensorReading, AnomalyEvent, AgentRecommendation
+from .models import FarmProfile, FieldPlot, SensorReading, SensorRollup, AnomalyEvent, AgentRecommendation
 
 class FarmProfileSerializer(serializers.ModelSerializer):
     class Meta:
@@ -16,6 +16,25 @@ class SensorReadingSerializer(serializers.ModelSerializer):
         model = SensorReading
         fields = '__all__'
 
+class SensorReadingBatchItemSerializer(serializers.ModelSerializer):
+    # Plot existence is checked against ids preloaded by the batch view (context['plot_ids'])
+    # instead of one SELECT per item.
+    plot = serializers.IntegerField(source='plot_id')
+
+    class Meta:
+        model = SensorReading
+        fields = ['plot', 'sensor_type', 'value', 'timestamp', 'source']
+
+    def validate_plot(self, value):
+        if value not in self.context['plot_ids']:
+            raise serializers.ValidationError(f'Invalid pk "{value}" - object does not exist.')
+        return value
+
+class SensorRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SensorRollup
+        exclude = ['total']
+
 class AnomalyEventSerializer(serializers.ModelSerializer):
     # We want to see the plot name, not just the ID, when looking at anomalies
     plot_name = serializers.ReadOnlyField(source='plot.plot_name')
@@ -23,6 +42,7 @@ class AnomalyEventSerializer(serializers.ModelSerializer):
     class Meta:
         model = AnomalyEvent
         fields = '__all__'
+        read_only_fields = ['reading']
 
 class AgentRecommendationSerializer(serializers.ModelSerializer):
     class Meta:
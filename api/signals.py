@@ -0,0 +1,96 @@
+import logging
+
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import DatabaseError
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from ml_module import baselines
+
+from .acl import invalidate
+from .authentication import forget_keys
+from .changes import bump_plots, bump_keys
+from .models import FarmProfile, FieldPlot, SensorReading, SensorSource, AnomalyEvent, AgentRecommendation
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=SensorReading)
+@receiver(post_save, sender=AnomalyEvent)
+def bump_plot_on_save(sender, instance, created, **kwargs):
+    """
+    Wakes the plot's event streams for single-object saves (admin, anomaly POST).
+    Bulk paths (ingest, agent worker) skip post_save and bump explicitly.
+    """
+    if created:
+        bump_plots([instance.plot_id])
+
+
+@receiver(post_save, sender=AgentRecommendation)
+def bump_plot_on_recommendation(sender, instance, created, **kwargs):
+    if created:
+        bump_plots([instance.anomaly_event.plot_id])
+
+
+@receiver(pre_save, sender=FarmProfile)
+def remember_farm_owner(sender, instance, **kwargs):
+    # Reassigning a farm changes two users' plot sets
+    instance._previous_user_id = (
+        FarmProfile.objects.filter(pk=instance.pk).values_list('user_id', flat=True).first() if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=FarmProfile)
+@receiver(post_delete, sender=FarmProfile)
+def farm_changed(sender, instance, **kwargs):
+    owners = {instance.user_id, getattr(instance, '_previous_user_id', None)} - {None}
+    invalidate(owners)
+    keys = [f'catalog-version:{owner_id}' for owner_id in owners] + ['catalog-version:all']
+    if owners != {instance.user_id}:
+        # The farm's plots (and their data) moved from one user's lists to the other's
+        plot_ids = list(FieldPlot.objects.filter(farm_id=instance.id).values_list('id', flat=True))
+        cache.delete_many([f'plot-owner:{plot_id}' for plot_id in plot_ids])
+        keys += [f'plot-version:{plot_id}' for plot_id in plot_ids]
+        keys += [f'user-version:{owner_id}' for owner_id in owners] + ['user-version:all']
+    bump_keys(keys)
+
+
+@receiver(pre_save, sender=FieldPlot)
+def remember_plot_farm(sender, instance, **kwargs):
+    # Moving a plot to another farm can change its owner
+    instance._previous_farm_id = (
+        FieldPlot.objects.filter(pk=instance.pk).values_list('farm_id', flat=True).first() if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=FieldPlot)
+@receiver(post_delete, sender=FieldPlot)
+def plot_changed(sender, instance, **kwargs):
+    farm_ids = {instance.farm_id, getattr(instance, '_previous_farm_id', None)} - {None}
+    owners = set(FarmProfile.objects.filter(id__in=farm_ids).values_list('user_id', flat=True))
+    invalidate(owners)
+    cache.delete(f'plot-owner:{instance.id}')
+    # Data lists show the plot's name, and a deleted plot takes its readings with it
+    keys = [f'plot-version:{instance.id}', 'catalog-version:all', 'user-version:all']
+    for owner_id in owners:
+        keys += [f'catalog-version:{owner_id}', f'user-version:{owner_id}']
+    bump_keys(keys)
+
+
+@receiver(post_save, sender=SensorSource)
+@receiver(post_delete, sender=SensorSource)
+@receiver(m2m_changed, sender=SensorSource.plots.through)
+def device_changed(sender, **kwargs):
+    # Revocation / new scope applies at once in this process, within the TTL elsewhere
+    forget_keys()
+
+
+@receiver(request_finished)
+def flush_baselines(sender, **kwargs):
+    # Once the response is out: the periodic baseline write is no request's latency or queries
+    try:
+        baselines.maybe_flush()
+    except DatabaseError:
+        logger.exception("Baseline flush failed")
+
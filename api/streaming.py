@@ -0,0 +1,366 @@
+"""
+Streaming ingest for field gateways: one long-lived, authenticated connection
+instead of one POST (and one JWT check) per reading.
+
+    POST /api/stream/ingest/        chunked request body, one JSON reading per line
+    ws://<host>/api/stream/ingest/  text frames holding one or more JSON lines
+
+Authenticated on connect with `Authorization: Bearer <jwt>` or `Api-Key <key>`. An API key
+is verified again before each batch (cached for DEVICE_KEY_CACHE_SECONDS, see
+api/authentication.py): once it is revoked the stream stops, WebSocket close code 4401.
+
+Each reading may carry an integer "seq" (otherwise its position in the stream is used).
+Lines are parsed as they arrive and written in micro-batches (bulk insert + one
+detector call), and every batch is answered with one NDJSON ack:
+
+    {"ack": 1042, "created": 498, "anomalies": 3, "errors": [{"seq": 1001, "errors": {...}}]}
+
+"ack" is the seq of the last reading handled; the gateway can drop everything up to it.
+When the writer falls behind, the bounded queue fills up and the server stops reading
+from the socket, so TCP pushes back on the gateway instead of memory growing.
+If the gateway disconnects, the readings it already sent are still stored (without acks);
+a gateway that resends everything after its last ack may therefore send some twice.
+WebSocket frames that are not UTF-8 close the connection with 1007.
+Only served through ASGI (see backend/asgi.py); runserver does not route it.
+"""
+
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .acl import allowed_plot_ids
+from .authentication import KEYWORD, DevicePrincipal, verify_key
+from .ingest import ingest_readings
+from .models import FieldPlot, SensorReading
+from .serializers import SensorReadingBatchItemSerializer
+from .signals import flush_baselines
+
+STREAM_PATH = '/api/stream/ingest/'
+
+# Queue marker: the client finished sending
+END = object()
+
+
+class StreamClosed(Exception):
+    close_code = 1011  # WebSocket: internal error
+
+
+class KeyRevoked(StreamClosed):
+    close_code = 4401
+
+
+def api_key(headers):
+    """The key of an `Api-Key` Authorization header, or None."""
+    header = headers.get(b'authorization', b'').split()
+    if len(header) == 2 and header[0].decode().lower() == KEYWORD.lower():
+        return header[1].decode()
+    return None
+
+
+def authenticate(headers):
+    """User (or device) for the Authorization header, checked when the connection opens."""
+    close_old_connections()
+    try:
+        key = api_key(headers)
+        if key is not None:
+            return verify_key(key)
+
+        auth = JWTAuthentication()
+        raw_token = auth.get_raw_token(headers.get(b'authorization', b''))
+        if raw_token is None:
+            return None
+        return auth.get_user(auth.get_validated_token(raw_token))
+    except AuthenticationFailed:
+        return None
+    finally:
+        close_old_connections()
+
+
+def write_batch(entries, user, known_plots, key=None):
+    """
+    Validates and stores one micro-batch of (seq, item, parse error) entries.
+    Runs in a worker thread. Returns the ack for the batch.
+    """
+    close_old_connections()
+    try:
+        # 1. Devices: the key again (cached with a TTL), for its current state and plots
+        if key is not None:
+            user = verify_key(key)
+            if user is None:
+                raise KeyRevoked("API key revoked")
+
+        # 2. Plots the user may write to: a device's scope, or the cached ownership set
+        #    (re-read each batch, so ownership changes apply mid-stream); admins may use
+        #    any existing plot
+        plot_ids = allowed_plot_ids(user)
+        if plot_ids is None:
+            requested = {item.get('plot') for _, item, _ in entries if isinstance(item, dict)}
+            requested = {int(pk) for pk in requested if isinstance(pk, int) or (isinstance(pk, str) and pk.isdigit())}
+            requested -= known_plots
+            if requested:
+                known_plots.update(FieldPlot.objects.filter(id__in=requested).values_list('id', flat=True))
+            plot_ids = known_plots
+
+        # 3. Validate each reading on its own so one bad line doesn't reject the batch
+        readings, errors = [], []
+        for seq, item, error in entries:
+            if error is None:
+                serializer = SensorReadingBatchItemSerializer(data=item, context={'plot_ids': plot_ids})
+                if serializer.is_valid():
+                    readings.append(SensorReading(**serializer.validated_data))
+                    if isinstance(user, DevicePrincipal) and 'source' not in serializer.validated_data:
+                        readings[-1].source = user.name
+                    continue
+                error = serializer.errors
+            errors.append({"seq": seq, "errors": error})
+
+        # 4. Bulk insert + batched detection
+        events = []
+        if readings:
+            readings, events = ingest_readings(readings)
+            # No request ends on a stream: the baseline flush runs after each batch instead
+            flush_baselines(sender=None)
+
+        return {
+            "ack": entries[-1][0],
+            "created": len(readings),
+            "anomalies": sum(event is not None for event in events),
+            "errors": errors,
+        }
+    finally:
+        close_old_connections()
+
+
+class IngestStream:
+    """
+    One gateway connection: the receive loop parses lines into a bounded queue,
+    the writer task drains it in micro-batches and sends the acks.
+    """
+
+    def __init__(self, user, send_ack, key=None):
+        self.user = user
+        self.send_ack = send_ack
+        self.key = key
+        self.queue = asyncio.Queue(maxsize=settings.STREAM_INGEST_QUEUE_SIZE)
+        self.known_plots = set()
+        self.seq = 0
+        self.last_ack = None
+        self.created = 0
+        self.failed = 0
+        self.error = None
+        self.close_code = StreamClosed.close_code
+        self.connected = True
+        self._pending_get = None
+
+    async def feed_line(self, line):
+        """Queues one NDJSON line. Waits while the queue is full (backpressure)."""
+        line = line.strip()
+        if not line:
+            return
+        if self.error is not None:
+            raise StreamClosed(self.error)
+
+        self.seq += 1
+        try:
+            item = json.loads(line)
+        except ValueError:
+            await self.queue.put((self.seq, None, {"non_field_errors": ["Invalid JSON."]}))
+            return
+
+        if isinstance(item, dict) and 'seq' in item:
+            seq = item.pop('seq')
+            if not isinstance(seq, int):
+                await self.queue.put((self.seq, None, {"seq": ["Must be an integer."]}))
+                return
+            self.seq = seq
+        await self.queue.put((self.seq, item, None))
+
+    async def finish(self):
+        await self.queue.put(END)
+
+    async def get(self, timeout=None):
+        """Next queue entry, or None on timeout. The pending get is kept, so no entry is lost."""
+        if self._pending_get is None:
+            self._pending_get = asyncio.ensure_future(self.queue.get())
+        done, _ = await asyncio.wait({self._pending_get}, timeout=timeout)
+        if not done:
+            return None
+        entry, self._pending_get = self._pending_get.result(), None
+        return entry
+
+    async def next_batch(self):
+        """
+        Up to STREAM_INGEST_BATCH_SIZE entries, waiting at most STREAM_INGEST_FLUSH_SECONDS
+        after the first one. Returns (batch, finished).
+        """
+        loop = asyncio.get_running_loop()
+        entry = await self.get()
+        deadline = loop.time() + settings.STREAM_INGEST_FLUSH_SECONDS
+        batch = []
+        while entry is not END:
+            batch.append(entry)
+            if len(batch) >= settings.STREAM_INGEST_BATCH_SIZE:
+                return batch, False
+            remaining = deadline - loop.time()
+            entry = await self.get(timeout=max(remaining, 0))
+            if entry is None:
+                return batch, False
+        return batch, True
+
+    async def run_writer(self):
+        write = sync_to_async(write_batch, thread_sensitive=False)
+        try:
+            finished = False
+            while not finished:
+                batch, finished = await self.next_batch()
+                if not batch:
+                    continue
+                ack = await write(batch, self.user, self.known_plots, self.key)
+                self.last_ack = ack['ack']
+                self.created += ack['created']
+                self.failed += len(ack['errors'])
+                if self.connected:
+                    await self.send_ack(ack)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Nothing after last_ack was stored: tell the gateway where to resume, then stop reading
+            print(f"❌ STREAM ERROR: {e}")
+            self.error = str(e)
+            self.close_code = getattr(e, 'close_code', self.close_code)
+            try:
+                if self.connected:
+                    await self.send_ack({"error": self.error, "ack": self.last_ack})
+            except Exception:
+                pass
+            # Unblock a receive loop waiting on a full queue
+            while not self.queue.empty():
+                self.queue.get_nowait()
+        finally:
+            if self._pending_get is not None:
+                self._pending_get.cancel()
+
+    async def receive(self, receive, writer):
+        """Next ASGI message. Raises StreamClosed as soon as the writer stops on an error."""
+        receiving = asyncio.ensure_future(receive())
+        await asyncio.wait({receiving, writer}, return_when=asyncio.FIRST_COMPLETED)
+        if not receiving.done():
+            # The writer only ends early on an error (e.g. a revoked key): don't wait for the gateway
+            receiving.cancel()
+            raise StreamClosed(self.error)
+        return receiving.result()
+
+    async def drain(self, writer):
+        """The client went away: store what it already sent (no more acks), then stop."""
+        self.connected = False
+        await self.finish()
+        await writer
+
+    def summary(self):
+        summary = {"done": self.error is None, "ack": self.last_ack, "created": self.created, "failed": self.failed}
+        if self.error is not None:
+            summary["error"] = self.error
+        return summary
+
+
+async def http_response(send, status, body):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': json.dumps(body).encode()})
+
+
+async def http_stream(scope, receive, send):
+    if scope['method'] != 'POST':
+        return await http_response(send, 405, {"detail": f'Method "{scope["method"]}" not allowed.'})
+
+    headers = dict(scope['headers'])
+    user = await sync_to_async(authenticate, thread_sensitive=False)(headers)
+    if user is None:
+        return await http_response(send, 401, {"detail": "Authentication credentials were not provided or are invalid."})
+
+    # Acks are streamed back while the request body is still coming in
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'application/x-ndjson')]})
+
+    async def send_ack(ack):
+        await send({'type': 'http.response.body', 'body': json.dumps(ack).encode() + b'\n', 'more_body': True})
+
+    stream = IngestStream(user, send_ack, api_key(headers))
+    writer = asyncio.create_task(stream.run_writer())
+    print(f"📡 STREAM OPENED: {user.username} (HTTP)")
+
+    buffer = b''
+    try:
+        while True:
+            message = await stream.receive(receive, writer)
+            if message['type'] == 'http.disconnect':
+                await stream.drain(writer)
+                print(f"📡 STREAM DROPPED: {user.username}, {stream.created} readings stored")
+                return
+            *lines, buffer = (buffer + message.get('body', b'')).split(b'\n')
+            for line in lines:
+                await stream.feed_line(line)
+            if len(buffer) > settings.STREAM_INGEST_MAX_LINE_BYTES:
+                raise StreamClosed(f"Line longer than {settings.STREAM_INGEST_MAX_LINE_BYTES} bytes")
+            if not message.get('more_body', False):
+                break
+        await stream.feed_line(buffer)
+    except StreamClosed as e:
+        stream.error = stream.error or str(e)
+
+    await stream.finish()
+    await writer
+    print(f"📡 STREAM CLOSED: {user.username}, {stream.created} readings stored")
+    await send({'type': 'http.response.body', 'body': json.dumps(stream.summary()).encode() + b'\n'})
+
+
+async def websocket_stream(scope, receive, send):
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    headers = dict(scope['headers'])
+    user = await sync_to_async(authenticate, thread_sensitive=False)(headers)
+    if user is None:
+        return await send({'type': 'websocket.close', 'code': 4401})
+    await send({'type': 'websocket.accept'})
+
+    async def send_ack(ack):
+        await send({'type': 'websocket.send', 'text': json.dumps(ack)})
+
+    stream = IngestStream(user, send_ack, api_key(headers))
+    writer = asyncio.create_task(stream.run_writer())
+    print(f"📡 STREAM OPENED: {user.username} (WebSocket)")
+
+    try:
+        while True:
+            message = await stream.receive(receive, writer)
+            if message['type'] == 'websocket.disconnect':
+                await stream.drain(writer)
+                print(f"📡 STREAM DROPPED: {user.username}, {stream.created} readings stored")
+                return
+            try:
+                text = message.get('text') or (message.get('bytes') or b'').decode()
+            except UnicodeDecodeError:
+                stream.close_code = 1007  # Invalid frame payload data
+                raise StreamClosed("Frames must hold UTF-8 JSON lines")
+            for line in text.split('\n'):
+                await stream.feed_line(line)
+    except StreamClosed as e:
+        # Everything queued before the failure is still written and acked
+        stream.error = stream.error or str(e)
+        await stream.finish()
+        await writer
+        await send_ack(stream.summary())
+        await send({'type': 'websocket.close', 'code': stream.close_code})
+
+
+async def ingest_stream(scope, receive, send):
+    if scope['type'] == 'websocket':
+        return await websocket_stream(scope, receive, send)
+    return await http_stream(scope, receive, send)
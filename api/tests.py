@@ -1,3 +1,1162 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import importlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import (
+    FarmProfile, FieldPlot, SensorReading, SensorRollup, SensorSource, AnomalyEvent, AgentRecommendation,
+    ReadingImport,
+)
+from agent_module.models import RecommendationJob
+from ml_module import baselines, ringbuffer
+from ml_module.models import PlotBaseline
+from .rollups import rebuild_rollups, update_rollups
+from . import incidents, streaming
+from .management.commands import import_readings
+from .admin import SensorSourceForm
+from .authentication import forget_keys, generate_key, verify_key
+from .backfill import parse_record
+from .acl import acl_key, allowed_plot_ids, can_access_plot, generation_key
+from .views import (
+    SensorReadingListCreateView, SensorReadingLatestView, AnomalyListCreateView, RecommendationListView
+)
+
+
+def fresh_process_state(test):
+    """
+    Empty process-wide baselines and recent readings for one test: ids are reused once a
+    test's rows are rolled back, so state kept from an earlier test would leak into this one.
+    """
+    for target in (mock.patch.object(baselines, '_store', None), mock.patch.object(ringbuffer, '_recent', None)):
+        target.start()
+        test.addCleanup(target.stop)
+
+
+def build_view(view_class, user, query=''):
+    request = Request(APIRequestFactory().get('/' + query))
+    request.user = user
+    view = view_class()
+    view.request, view.args, view.kwargs, view.format_kwarg = request, (), {}, None
+    return view
+
+
+def first_page(view_class, user, query=''):
+    """The queryset a list view runs for its first keyset page."""
+    view = build_view(view_class, user, query)
+    return view.get_queryset().order_by(*view.keyset_ordering)[:101]
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'api-tests'}},
+    ALLOWED_HOSTS=['testserver'], RECENT_READINGS_WARM=False,
+)
+class ApiTestCase(TestCase):
+    """Base of the API tests: an empty local cache and fresh process state per test, plus fixtures."""
+
+    def setUp(self):
+        cache.clear()
+        fresh_process_state(self)
+
+    def make_farm(self, user, name='Farm'):
+        return FarmProfile.objects.create(user=user, name=name, owner_name='F', location='X', size_hectares=1)
+
+    def make_plot(self, farm, plot_name='P', crop_variety='Wheat'):
+        return FieldPlot.objects.create(farm=farm, plot_name=plot_name, crop_variety=crop_variety, area_sqm=100)
+
+    def make_owner(self, username, plot_name='P'):
+        """A new user with one farm and one plot. Returns (user, plot)."""
+        user = User.objects.create_user(username, password='pw')
+        return user, self.make_plot(self.make_farm(user), plot_name)
+
+    def log_in(self, user):
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(user)}'
+
+
+@skipUnless(connection.vendor == 'postgresql', "EXPLAIN plans are PostgreSQL-specific")
+class QueryPlanTests(TestCase):
+    """
+    With enable_seqscan off, PostgreSQL only falls back to a sequential scan when no
+    index can serve the query, so a "Seq Scan" on a large table means a missing index.
+    Each hot query must also be served by the index added for it (migration 0003), not
+    just any index (e.g. the plain foreign key one).
+    """
+    LARGE_TABLES = ('api_sensorreading', 'api_anomalyevent', 'api_agentrecommendation')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('farmer', password='pw')
+        farm = FarmProfile.objects.create(user=cls.user, name='Farm', owner_name='F', location='X', size_hectares=1)
+        cls.plot = FieldPlot.objects.create(farm=farm, plot_name='P1', crop_variety='Wheat', area_sqm=100)
+
+        start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        SensorReading.objects.bulk_create([
+            SensorReading(plot=cls.plot, sensor_type=sensor_type, value=50,
+                          timestamp=start + datetime.timedelta(minutes=i))
+            for i in range(200) for sensor_type in ('temperature', 'humidity', 'moisture')
+        ])
+        events = AnomalyEvent.objects.bulk_create([
+            AnomalyEvent(plot=cls.plot, anomaly_type='Heat Stress', description='Abnormal temperature reading: 40',
+                         severity='high', model_confidence=0.9)
+            for _ in range(50)
+        ])
+        AgentRecommendation.objects.bulk_create([
+            AgentRecommendation(anomaly_event=event, recommended_action='A', explanation_text='E', confidence=0.9)
+            for event in events
+        ])
+        with connection.cursor() as cursor:
+            for table in cls.LARGE_TABLES:
+                cursor.execute(f'ANALYZE {table}')
+
+    def assert_uses_index(self, queryset, *indexes):
+        """No sequential scan on a large table, and at least one of `indexes` in the plan."""
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        for table in self.LARGE_TABLES:
+            self.assertNotIn(f'Seq Scan on {table}', plan, msg=plan)
+        self.assertTrue(any(index in plan for index in indexes), msg=f"none of {indexes} used:\n{plan}")
+
+    def test_reading_history_for_plot(self):
+        self.assert_uses_index(first_page(SensorReadingListCreateView, self.user, f'?plot={self.plot.id}'),
+                               'reading_plot_ts_idx')
+
+    def test_reading_history_for_user(self):
+        self.assert_uses_index(first_page(SensorReadingListCreateView, self.user),
+                               'reading_plot_ts_idx', 'reading_plot_type_ts_idx')
+
+    def test_latest_per_sensor_type(self):
+        view = build_view(SensorReadingLatestView, self.user)
+        self.assert_uses_index(view.latest_queryset(self.plot.id, 15), 'reading_plot_type_ts_idx')
+        self.assert_uses_index(view.latest_queryset(self.plot.id, 15, after=100), 'reading_plot_type_ts_idx')
+
+    def test_time_range_scan(self):
+        # Retention, rollup rebuilds and retraining scan readings by time only: the BRIN index
+        start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        in_range = SensorReading.objects.filter(timestamp__gte=start, timestamp__lt=start + datetime.timedelta(hours=1))
+        self.assert_uses_index(in_range, 'reading_timestamp_brin')
+
+    def test_anomaly_list(self):
+        self.assert_uses_index(first_page(AnomalyListCreateView, self.user), 'anomaly_plot_ts_idx', 'anomaly_ts_idx')
+
+    def test_recommendations_for_plot(self):
+        self.assert_uses_index(first_page(RecommendationListView, self.user, f'?plot={self.plot.id}'),
+                               'recommendation_created_idx', 'anomaly_plot_ts_idx')
+
+
+@override_settings(
+    QUERY_COUNT_HEADERS=True,
+    BASELINE_FLUSH_SECONDS=0,  # A baseline flush after every request: it must stay out of the counts
+)
+class QueryBudgetTests(ApiTestCase):
+    """
+    Every API view declares `query_budget` (api/middleware.py). Each endpoint is called with a
+    small and a larger data set: the query count (X-DB-Queries) must stay within the budget
+    and must not grow with the number of rows.
+    """
+    GET_URLS = (
+        'farm-list', 'plot-list', 'sensor-readings', 'sensor-rollup-list', 'anomaly-list', 'recommendation-list',
+    )
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('budget', password='pw')
+        self.log_in(self.user)
+        self.plots = []
+
+    def add_rows(self, count):
+        """`count` more plots, each with readings, rollups, an anomaly and its recommendation."""
+        farm = self.make_farm(self.user)
+        start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        for index in range(count):
+            plot = self.make_plot(farm, f'P{index}')
+            readings = SensorReading.objects.bulk_create([
+                SensorReading(plot=plot, sensor_type=sensor_type, value=50, timestamp=start)
+                for sensor_type in ('temperature', 'humidity', 'moisture')
+            ])
+            update_rollups(readings)
+            event = AnomalyEvent.objects.create(
+                plot=plot, anomaly_type='Heat Stress', description='Abnormal temperature reading: 40',
+                severity='high', model_confidence=0.9, sensor_type='temperature', value=40, reading=readings[0],
+            )
+            AgentRecommendation.objects.create(anomaly_event=event, recommended_action='A', explanation_text='E',
+                                               confidence=0.9)
+            self.plots.append(plot)
+
+    def queries(self, response):
+        self.assertLess(response.status_code, 300, getattr(response, 'content', b'')[:500])
+        return int(response['X-DB-Queries'])
+
+    def request(self, method, name, data=None, query=''):
+        cache.clear()  # No response cache / cached ownership: the worst case
+        url = reverse(name) + query
+        if method == 'get':
+            return self.client.get(url)
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def assert_budget(self, name, counts, args=()):
+        """`counts`: one tuple of query counts per data size, each the same sequence of calls."""
+        view = resolve(reverse(name, args=args)).func
+        budget = getattr(view, 'view_class', view).query_budget
+        self.assertLessEqual(max(max(found) for found in counts), budget, f"{name}: {counts} queries, budget {budget}")
+        self.assertEqual(len(set(counts)), 1, f"{name}: query count grows with rows: {counts}")
+
+    def test_list_endpoints(self):
+        names = self.GET_URLS + ('sensor-readings-latest', 'dashboard', 'login')
+        counts = {name: [] for name in names}
+        for size in (2, 10):
+            self.add_rows(size)
+            for name in names:
+                query = f'?plot={self.plots[-1].id}&limit=100' if name == 'sensor-readings-latest' else ''
+                counts[name].append((self.queries(self.request('get', name, query=query)),))
+        for name, found in counts.items():
+            self.assert_budget(name, found)
+
+    def test_event_stream(self):
+        counts, token_counts = [], []
+        for size in (2, 10):
+            self.add_rows(size)
+            cache.clear()
+            plot_id = self.plots[-1].id
+            response = self.client.post(reverse('plot-events-token', args=[plot_id]))
+            token_counts.append((self.queries(response),))
+            cache.clear()
+            response = self.client.get(reverse('plot-events', args=[plot_id]) + f"?token={response.json()['token']}")
+            counts.append((self.queries(response),))
+            response.close()
+        self.assert_budget('plot-events-token', token_counts, args=[self.plots[-1].id])
+        self.assert_budget('plot-events', counts, args=[self.plots[-1].id])
+
+    def test_ingest_endpoints(self):
+        names = ('farm-list', 'plot-list', 'sensor-readings', 'sensor-readings-batch', 'anomaly-list')
+        counts = {name: [] for name in names}
+        start = datetime.datetime(2025, 1, 2, tzinfo=datetime.timezone.utc)
+        for size in (2, 10):
+            self.add_rows(size)
+            found = {name: [] for name in names}
+            farm = {'user': self.user.id, 'name': 'New', 'owner_name': 'F', 'location': 'X', 'size_hectares': 2}
+            found['farm-list'].append(self.queries(self.request('post', 'farm-list', farm)))
+            plot = {'farm': self.plots[-1].farm_id, 'plot_name': 'New', 'crop_variety': 'Corn', 'area_sqm': 10}
+            found['plot-list'].append(self.queries(self.request('post', 'plot-list', plot)))
+            reading = {'plot': self.plots[-1].id, 'sensor_type': 'moisture', 'value': 5, 'timestamp': start.isoformat()}
+            found['sensor-readings'].append(self.queries(self.request('post', 'sensor-readings', reading)))
+            # Normal and anomalous readings across plots; twice, so the second batch extends open incidents
+            batch = [
+                {'plot': plot.id, 'sensor_type': sensor_type, 'value': value,
+                 'timestamp': (start + datetime.timedelta(minutes=minute)).isoformat()}
+                for minute in range(2) for plot in self.plots
+                for sensor_type, value in (('moisture', 5), ('temperature', 25))
+            ]
+            for _ in range(2):
+                found['sensor-readings-batch'].append(self.queries(self.request('post', 'sensor-readings-batch', batch)))
+            anomaly = {'plot': self.plots[-1].id, 'anomaly_type': 'Frost Danger', 'description': 'Manual',
+                       'severity': 'low', 'model_confidence': 0.5}
+            found['anomaly-list'].append(self.queries(self.request('post', 'anomaly-list', anomaly)))
+            for name in names:
+                counts[name].append(tuple(found[name]))
+        for name, found in counts.items():
+            self.assert_budget(name, found)
+        self.assertTrue(PlotBaseline.objects.exists())  # Flushed, after the responses
+
+    def test_headers(self):
+        response = self.client.get(reverse('farm-list'))
+        self.assertIn('X-DB-Queries', response)
+        self.assertIn('X-DB-Time-Ms', response)
+        self.assertTrue(response['Server-Timing'].startswith('db;dur='))
+        with override_settings(QUERY_COUNT_HEADERS=False):
+            self.assertNotIn('X-DB-Queries', self.client.get(reverse('farm-list')))
+
+
+class AclTests(ApiTestCase):
+    """Cached plot ownership (api/acl.py): foreign plots stay out, ownership changes apply at once."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', password='pw')
+        self.log_in(self.user)
+        self.farm = self.make_farm(self.user)
+        self.plot = self.make_plot(self.farm)
+        self.other, self.foreign = self.make_owner('other', 'F')
+        SensorReading.objects.create(plot=self.foreign, sensor_type='moisture', value=40,
+                                     timestamp=datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc))
+
+    def post_reading(self, plot):
+        reading = {'plot': plot.id, 'sensor_type': 'moisture', 'value': 40, 'timestamp': '2025-01-01T00:00:00Z'}
+        return self.client.post(reverse('sensor-readings'), json.dumps(reading), content_type='application/json')
+
+    def test_foreign_plot_is_not_readable(self):
+        response = self.client.get(reverse('sensor-readings'), {'plot': self.foreign.id})
+        self.assertEqual(response.json()['results'], [])
+        self.assertFalse(can_access_plot(self.user, self.foreign.id))
+
+    def test_foreign_plot_is_not_writable(self):
+        self.assertEqual(self.post_reading(self.foreign).status_code, 403)
+        self.assertEqual(SensorReading.objects.filter(plot=self.foreign).count(), 1)
+
+    def test_ownership_transfer(self):
+        self.assertEqual(allowed_plot_ids(self.user), {self.plot.id})  # Cached now
+        self.assertEqual(allowed_plot_ids(self.other), {self.foreign.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.farm.user = self.other
+            self.farm.save()
+        self.assertEqual(allowed_plot_ids(self.user), frozenset())
+        self.assertEqual(allowed_plot_ids(self.other), {self.plot.id, self.foreign.id})
+        self.assertEqual(self.post_reading(self.plot).status_code, 403)
+
+    def test_plot_moved_to_another_farm(self):
+        self.assertTrue(can_access_plot(self.user, self.plot.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plot.farm = self.foreign.farm
+            self.plot.save()
+        self.assertFalse(can_access_plot(self.user, self.plot.id))
+        self.assertTrue(can_access_plot(self.other, self.plot.id))
+
+    def test_late_write_of_the_old_set_is_ignored(self):
+        # A request reads the generation and the old ownership, the transfer commits, then it caches what it read
+        allowed_plot_ids(self.user)
+        generation = cache.get(generation_key(self.user.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.farm.user = self.other
+            self.farm.save()
+        cache.set(acl_key(self.user.id, generation), frozenset({self.plot.id}))
+        self.assertFalse(can_access_plot(self.user, self.plot.id))
+
+    def test_superuser_is_not_restricted(self):
+        admin = User.objects.create_superuser('admin', password='pw')
+        self.assertIsNone(allowed_plot_ids(admin))
+        self.assertTrue(can_access_plot(admin, self.foreign.id))
+
+
+class ConditionalGetTests(ApiTestCase):
+    """ETag revalidation on list views: 304 until the data changes, then 200 again."""
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.plot = self.make_owner('conditional')
+        self.farm = self.plot.farm
+        self.log_in(self.user)
+        self.url = reverse('sensor-readings') + f'?plot={self.plot.id}'
+
+    def add_reading(self, value):
+        reading = {'plot': self.plot.id, 'sensor_type': 'temperature', 'value': value,
+                   'timestamp': '2025-01-01T00:00:00Z'}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('sensor-readings'), json.dumps(reading),
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_revalidation_after_a_write(self):
+        self.add_reading(20)
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.add_reading(21)  # Within the same second: an ETag still tells the versions apart
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], etag)
+        self.assertEqual(len(second.json()['results']), 2)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=second['ETag']).status_code, 304)
+
+    def test_if_modified_since_is_not_trusted(self):
+        response = self.client.get(self.url)
+        self.assertNotIn('Last-Modified', response)
+        self.add_reading(20)
+        later = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(later.status_code, 200)
+        self.assertEqual(len(later.json()['results']), 1)
+
+    def test_farm_transfer(self):
+        self.add_reading(20)
+        urls = (self.url, reverse('sensor-readings'))
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        buyer = User.objects.create_user('buyer', password='pw')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.farm.user = buyer
+            self.farm.save()
+        # The old owner's cached lists and plot data are stale, not 304
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertNotEqual(response.status_code, 304)
+            self.assertEqual(response.json().get('results', []), [])
+
+    def test_catalog_changes(self):
+        etag = self.client.get(reverse('plot-list'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_plot(self.farm, 'Q', 'Corn')
+        response = self.client.get(reverse('plot-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+class StreamTokenTests(ApiTestCase):
+    """The event stream only opens with a fresh token minted for that plot, never the JWT."""
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.plot = self.make_owner('stream')
+        self.second = self.make_plot(self.make_farm(self.user))
+        _, self.foreign = self.make_owner('stranger')
+        self.log_in(self.user)
+
+    def token(self, plot):
+        response = self.client.post(reverse('plot-events-token', args=[plot.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['expires_in'], settings.SSE_TOKEN_SECONDS)
+        return response.json()['token']
+
+    def open(self, plot, token):
+        return self.client.get(reverse('plot-events', args=[plot.id]), {'token': token}, HTTP_AUTHORIZATION='')
+
+    def test_stream_opens_with_a_plot_token(self):
+        response = self.open(self.plot, self.token(self.plot))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        response.close()
+
+    def test_jwt_is_not_a_stream_token(self):
+        self.assertEqual(self.open(self.plot, str(AccessToken.for_user(self.user))).status_code, 401)
+        self.assertEqual(self.open(self.plot, '').status_code, 401)
+
+    def test_token_is_for_one_plot(self):
+        self.assertEqual(self.open(self.second, self.token(self.plot)).status_code, 401)
+
+    def test_token_expires(self):
+        token = self.token(self.plot)
+        later = time.time() + settings.SSE_TOKEN_SECONDS + 1
+        with mock.patch('django.core.signing.time.time', return_value=later):
+            self.assertEqual(self.open(self.plot, token).status_code, 401)
+
+    def test_no_token_for_a_foreign_plot(self):
+        response = self.client.post(reverse('plot-events-token', args=[self.foreign.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_wsgi_stream_is_finite(self):
+        # A WSGI worker thread serves one tick: the client's EventSource reconnects for the next
+        response = self.open(self.plot, self.token(self.plot))
+        chunks = list(response.streaming_content)  # Returns: no 300 s loop
+        response.close()
+        self.assertTrue(chunks[0].startswith(b'retry:'))
+
+
+class BatchIngestTests(ApiTestCase):
+    """POST /sensor-readings/batch/: per-item status, ownership, results aligned with the incidents."""
+    START = datetime.datetime(2025, 3, 1, tzinfo=datetime.timezone.utc)
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.plot = self.make_owner('batch')
+        _, self.foreign = self.make_owner('neighbour')
+        self.log_in(self.user)
+
+    def item(self, plot, sensor_type, value, minute=0):
+        return {'plot': plot.id, 'sensor_type': sensor_type, 'value': value,
+                'timestamp': (self.START + datetime.timedelta(minutes=minute)).isoformat()}
+
+    def post(self, items):
+        return self.client.post(reverse('sensor-readings-batch'), json.dumps(items), content_type='application/json')
+
+    def test_mixed_items(self):
+        response = self.post([
+            self.item(self.plot, 'temperature', 22),
+            self.item(self.foreign, 'temperature', 22),          # Not this user's plot
+            {'plot': self.plot.id, 'sensor_type': 'temperature'},  # No value
+            self.item(self.plot, 'humidity', 60, minute=1),
+        ])
+        self.assertEqual(response.status_code, 207)
+        body = response.json()
+        self.assertEqual((body['created'], body['failed']), (2, 2))
+        self.assertEqual([result['status'] for result in body['results']], ['created', 'invalid', 'invalid', 'created'])
+        self.assertIn('plot', body['results'][1]['errors'])
+        self.assertIn('value', body['results'][2]['errors'])
+        self.assertFalse(SensorReading.objects.filter(plot=self.foreign).exists())
+        self.assertEqual(sorted(SensorReading.objects.values_list('id', flat=True)),
+                         sorted(body['results'][index]['id'] for index in (0, 3)))
+
+    def test_all_foreign_is_rejected(self):
+        response = self.post([self.item(self.foreign, 'moisture', 5)])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(SensorReading.objects.exists())
+        self.assertFalse(AnomalyEvent.objects.exists())
+
+    def test_results_aligned_with_incidents(self):
+        # A dry plot: every moisture reading is a repeat of one incident, the others are normal
+        items = [self.item(self.plot, sensor_type, value, minute)
+                 for minute in range(3) for sensor_type, value in (('moisture', 5), ('temperature', 22))]
+        response = self.post(items)
+        self.assertEqual(response.status_code, 201)
+        results = response.json()['results']
+
+        incident = AnomalyEvent.objects.get()
+        self.assertEqual(incident.occurrences, 3)
+        for item, result in zip(items, results):
+            reading = SensorReading.objects.get(id=result['id'])
+            self.assertEqual((reading.sensor_type, reading.value), (item['sensor_type'], item['value']))
+            if item['sensor_type'] == 'moisture':
+                self.assertEqual((result['anomaly_id'], result['anomaly']), (incident.id, incident.anomaly_type))
+            else:
+                self.assertEqual((result['anomaly_id'], result['anomaly']), (None, None))
+        self.assertEqual(RecommendationJob.objects.filter(anomaly_event=incident).count(), 1)
+
+    def test_detector_failure_keeps_readings(self):
+        with mock.patch('api.ingest.get_detector', side_effect=RuntimeError('broken model')), \
+                self.assertLogs('api.ingest', 'ERROR'):
+            response = self.post([self.item(self.plot, 'moisture', 5)])
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(response.json()['results'][0]['anomaly_id'])
+        self.assertEqual(SensorReading.objects.count(), 1)
+
+    def test_storage_failure_rolls_back_and_surfaces(self):
+        # The incident row is inserted, then queueing its job fails: nothing of it may remain,
+        # the readings included (the client retries the whole batch)
+        with mock.patch('api.ingest.enqueue', side_effect=DatabaseError('queue down')), \
+                self.assertRaises(DatabaseError):
+            self.post([self.item(self.plot, 'moisture', 5), self.item(self.plot, 'temperature', 22)])
+        self.assertFalse(SensorReading.objects.exists())
+        self.assertFalse(SensorRollup.objects.exists())
+        self.assertFalse(AnomalyEvent.objects.exists())
+        self.assertFalse(RecommendationJob.objects.exists())
+
+        # The retry stores each reading once
+        self.assertEqual(self.post([self.item(self.plot, 'moisture', 5)]).status_code, 201)
+        self.assertEqual(SensorReading.objects.count(), 1)
+        self.assertEqual(AnomalyEvent.objects.count(), 1)
+
+
+def raw_rollups(plot_ids=None):
+    """{(plot, sensor_type, granularity, bucket): (count, total, min, max, last value)} from the raw readings."""
+    from django.db.models import Count, Max, Min, Sum
+    from django.db.models.functions import TruncDay, TruncHour
+
+    readings = SensorReading.objects.all()
+    if plot_ids is not None:
+        readings = readings.filter(plot_id__in=plot_ids)
+    rows = {}
+    for granularity, trunc in (('hour', TruncHour), ('day', TruncDay)):
+        buckets = readings.annotate(bucket=trunc('timestamp', tzinfo=datetime.timezone.utc)).values(
+            'plot_id', 'sensor_type', 'bucket').annotate(
+            count=Count('id'), total=Sum('value'), low=Min('value'), high=Max('value'), last=Max('timestamp'))
+        for row in buckets:
+            last_value = readings.filter(plot_id=row['plot_id'], sensor_type=row['sensor_type'],
+                                         timestamp=row['last']).order_by('-id').values_list('value', flat=True)[0]
+            rows[(row['plot_id'], row['sensor_type'], granularity, row['bucket'])] = (
+                row['count'], round(row['total'], 6), row['low'], row['high'], last_value)
+    return rows
+
+
+def stored_rollups(plot_ids=None):
+    rollups = SensorRollup.objects.all()
+    if plot_ids is not None:
+        rollups = rollups.filter(plot_id__in=plot_ids)
+    return {
+        (rollup.plot_id, rollup.sensor_type, rollup.granularity, rollup.bucket):
+            (rollup.count, round(rollup.total, 6), rollup.min_value, rollup.max_value, rollup.last_value)
+        for rollup in rollups
+    }
+
+
+class RollupTests(ApiTestCase):
+    """Hourly/daily rollups always equal the aggregates of the raw readings."""
+    START = datetime.datetime(2025, 5, 1, 22, 30, tzinfo=datetime.timezone.utc)
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('rollups', password='pw')
+        farm = self.make_farm(self.user)
+        self.plots = [self.make_plot(farm, f'P{index}') for index in range(2)]
+
+    def readings(self, minutes, value):
+        """Readings every `minutes` over 3 hours across midnight, for every plot and two sensor types."""
+        return [
+            SensorReading(plot=plot, sensor_type=sensor_type, value=value(step, plot.id),
+                          timestamp=self.START + datetime.timedelta(minutes=step * minutes))
+            for step in range(180 // minutes) for plot in self.plots for sensor_type in ('temperature', 'moisture')
+        ]
+
+    def test_incremental_upserts_match_raw_aggregates(self):
+        # Several batches landing in the same buckets, one of them out of order
+        batches = [
+            self.readings(20, lambda step, plot: 20 + step + plot),
+            self.readings(30, lambda step, plot: 15 - step * 1.5),
+            list(reversed(self.readings(45, lambda step, plot: 40 - plot))),
+        ]
+        for batch in batches:
+            update_rollups(SensorReading.objects.bulk_create(batch))
+        self.assertEqual(stored_rollups(), raw_rollups())
+        self.assertEqual({key[2] for key in raw_rollups()}, {'hour', 'day'})
+
+    def test_rebuild_matches_raw_aggregates(self):
+        SensorReading.objects.bulk_create(self.readings(15, lambda step, plot: step * 0.7))  # No rollups yet
+        SensorRollup.objects.create(plot=self.plots[0], sensor_type='temperature', granularity='hour',
+                                    bucket=self.START.replace(minute=0), count=99, total=1, mean=1,
+                                    min_value=1, max_value=1, last_value=1, last_timestamp=self.START)
+        rebuild_rollups(self.START, self.START + datetime.timedelta(hours=3), chunk_size=7)
+        self.assertEqual(stored_rollups(), raw_rollups())
+
+    def test_rebuild_one_plot(self):
+        update_rollups(SensorReading.objects.bulk_create(self.readings(10, lambda step, plot: step)))
+        SensorRollup.objects.filter(plot=self.plots[1]).update(count=0)
+        rebuild_rollups(self.START, self.START + datetime.timedelta(hours=3), plot_ids=[self.plots[1].id])
+        self.assertEqual(stored_rollups(), raw_rollups())
+
+    def test_invalid_filters_are_rejected(self):
+        self.log_in(self.user)
+        url = reverse('sensor-rollup-list')
+        for query, field in (('?plot=abc', 'plot'), ('?start=yesterday', 'start'), ('?end=2025-13-01', 'end'),
+                             ('?granularity=week', 'granularity')):
+            response = self.client.get(url + query)
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn(field, response.json())
+
+        update_rollups(SensorReading.objects.bulk_create(self.readings(60, lambda step, plot: step)))
+        query = f'?plot={self.plots[0].id}&granularity=day&start=2025-05-02&end=2025-05-03T00:00:00Z'
+        response = self.client.get(url + query)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['bucket'] for row in response.json()['results']], ['2025-05-02T00:00:00Z'] * 2)
+
+
+@override_settings(
+    READING_RETENTION={'default_days': 30, 'sensor_types': {}, 'farms': {}, 'hourly_rollup_days': None},
+)
+class CompactionTests(ApiTestCase):
+    """Compacted days keep their full history in the rollups."""
+
+    def setUp(self):
+        super().setUp()
+        farm = self.make_farm(User.objects.create_user('retention', password='pw'))
+        self.plots = [self.make_plot(farm, f'P{index}') for index in range(3)]
+        self.start = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=40)).replace(
+            hour=0, minute=0, second=0, microsecond=0)
+
+    def readings(self, plot, sensor_type='moisture', days=3):
+        return SensorReading.objects.bulk_create([
+            SensorReading(plot=plot, sensor_type=sensor_type, value=(step * 7) % 50,
+                          timestamp=self.start + datetime.timedelta(minutes=step * 45))
+            for step in range(days * 32)
+        ])
+
+    def compact(self):
+        call_command('compact_readings', '--sleep', '0', '--chunk-size', '10', stdout=io.StringIO())
+
+    def test_compacted_rollups_equal_raw_aggregates(self):
+        update_rollups(self.readings(self.plots[0]))          # Rollups up to date
+        self.readings(self.plots[1])                           # Imported without rollups
+        stale = self.readings(self.plots[2])                   # Rollups missing one day's tail
+        update_rollups(stale[:40])
+        expected = raw_rollups()
+        recent = SensorReading.objects.create(plot=self.plots[0], sensor_type='moisture', value=1,
+                                              timestamp=datetime.datetime.now(datetime.timezone.utc))
+
+        self.compact()
+        self.assertEqual(list(SensorReading.objects.values_list('id', flat=True)), [recent.id])
+        self.assertEqual(stored_rollups(), expected)
+
+    def test_partly_compacted_day_keeps_its_rollups(self):
+        update_rollups(self.readings(self.plots[0]))
+        expected = stored_rollups()
+        # An earlier run was interrupted half way through the first day
+        SensorReading.objects.filter(id__in=SensorReading.objects.order_by('timestamp').values('id')[:10]).delete()
+        self.compact()
+        self.assertFalse(SensorReading.objects.exists())
+        self.assertEqual(stored_rollups(), expected)
+
+    def test_compacted_days_are_not_rebuilt(self):
+        update_rollups(self.readings(self.plots[0]))
+        self.compact()
+        expected = stored_rollups()
+        self.assertTrue(expected)
+        day = self.start.date()
+        with self.assertRaisesMessage(CommandError, "can't be rebuilt"):
+            call_command('rebuild_rollups', '--start', str(day), '--end', str(day + datetime.timedelta(days=1)),
+                         stdout=io.StringIO())
+        self.assertEqual(stored_rollups(), expected)
+
+        # A range reaching past the cutoff only rebuilds the days still stored raw
+        recent = SensorReading.objects.create(plot=self.plots[0], sensor_type='moisture', value=1,
+                                              timestamp=datetime.datetime.now(datetime.timezone.utc))
+        end = recent.timestamp.date() + datetime.timedelta(days=1)
+        err = io.StringIO()
+        call_command('rebuild_rollups', '--start', str(day), '--end', str(end), stdout=io.StringIO(), stderr=err)
+        self.assertIn('Starting at', err.getvalue())
+        self.assertEqual(stored_rollups(), {**expected, **raw_rollups()})
+
+    def test_days_that_cannot_be_rolled_up_are_kept(self):
+        self.readings(self.plots[1], days=1)
+        with mock.patch('api.retention.rebuild_rollups'):
+            self.compact()
+        self.assertEqual(SensorReading.objects.count(), 32)
+        self.assertFalse(SensorRollup.objects.exists())
+
+
+class DeviceKeyTests(ApiTestCase):
+    """API keys (api/authentication.py): scope, allowed methods, revocation and its TTL, mid-stream too."""
+
+    def setUp(self):
+        super().setUp()
+        forget_keys()
+        self.addCleanup(forget_keys)
+        self.user, self.plot = self.make_owner('farmer')
+        self.unlisted = self.make_plot(self.plot.farm, 'Q', 'Corn')
+        self.key, prefix, digest = generate_key()
+        self.source = SensorSource.objects.create(name='gateway', owner=self.user, key_prefix=prefix, key_hash=digest)
+        self.source.plots.add(self.plot)
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Api-Key {self.key}'
+
+    def post_reading(self, plot):
+        reading = {'plot': plot.id, 'sensor_type': 'moisture', 'value': 40, 'timestamp': '2025-01-01T00:00:00Z'}
+        return self.client.post(reverse('sensor-readings'), json.dumps(reading), content_type='application/json')
+
+    def revoke_elsewhere(self):
+        """Revoked by another process: no signal reaches this one's cache."""
+        SensorSource.objects.filter(id=self.source.id).update(is_active=False)
+
+    def test_device_methods_only(self):
+        self.assertEqual(self.post_reading(self.plot).status_code, 201)
+        self.assertEqual(SensorReading.objects.get().source, 'gateway')
+        self.assertEqual(self.client.get(reverse('plot-list')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('sensor-readings')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('anomaly-list')).status_code, 401)  # Doesn't take keys at all
+
+    def test_key_is_limited_to_its_plots(self):
+        self.assertEqual(self.post_reading(self.unlisted).status_code, 403)
+        self.assertEqual(verify_key(self.key).plot_ids, {self.plot.id})
+
+    def test_revocation_applies_at_once_in_this_process(self):
+        self.assertEqual(self.post_reading(self.plot).status_code, 201)
+        self.source.is_active = False
+        self.source.save()  # The signal drops this process's cache
+        self.assertEqual(self.post_reading(self.plot).status_code, 401)
+
+    def test_revocation_elsewhere_applies_within_the_ttl(self):
+        self.assertIsNotNone(verify_key(self.key))
+        self.revoke_elsewhere()
+        now = time.monotonic()
+        with mock.patch('api.authentication.time.monotonic', return_value=now + settings.DEVICE_KEY_CACHE_SECONDS - 1):
+            self.assertIsNotNone(verify_key(self.key))  # Cached
+        with mock.patch('api.authentication.time.monotonic', return_value=now + settings.DEVICE_KEY_CACHE_SECONDS + 1):
+            self.assertIsNone(verify_key(self.key))
+
+    def test_unknown_key(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Api-Key nope.nope'
+        self.assertEqual(self.post_reading(self.plot).status_code, 401)
+
+    def test_superuser_key_keeps_every_plot(self):
+        # A gateway or simulator key owned by an admin writes to anyone's plots
+        admin = User.objects.create_superuser('admin', password='pw')
+        _, foreign = self.make_owner('neighbour', 'F')
+        out = io.StringIO()
+        call_command('create_sensor_source', 'simulator', '--owner', 'admin', '--plot', str(self.plot.id),
+                     '--plot', str(foreign.id), stdout=out)
+        key = out.getvalue().split('Api-Key ')[-1].strip()
+        self.assertEqual(verify_key(key).plot_ids, {self.plot.id, foreign.id})
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Api-Key {key}'
+        self.assertEqual(self.post_reading(foreign).status_code, 201)
+
+        form = SensorSourceForm({'name': 'gw', 'owner': admin.id, 'plots': [foreign.id], 'is_active': True})
+        self.assertTrue(form.is_valid(), form.errors)
+
+    def test_plots_the_owner_does_not_own_are_refused(self):
+        _, foreign = self.make_owner('neighbour', 'F')
+        with self.assertRaisesMessage(CommandError, 'not owned by farmer'):
+            call_command('create_sensor_source', 'gw', '--owner', 'farmer', '--plot', str(foreign.id),
+                         stdout=io.StringIO())
+        form = SensorSourceForm({'name': 'gw', 'owner': self.user.id, 'plots': [self.plot.id, foreign.id],
+                                 'is_active': True})
+        self.assertFalse(form.is_valid())
+        self.assertIn('plots', form.errors)
+
+    def test_open_stream_is_reverified(self):
+        entry = (1, {'plot': self.plot.id, 'sensor_type': 'moisture', 'value': 40,
+                     'timestamp': '2025-01-01T00:00:00Z'}, None)
+        principal = streaming.authenticate({b'authorization': f'Api-Key {self.key}'.encode()})
+        with mock.patch.object(streaming, 'close_old_connections'):  # Not inside a test transaction
+            self.assertEqual(streaming.write_batch([entry], principal, set(), self.key)['created'], 1)
+            # The plot is taken off the key: the next batch can't use it any more
+            self.source.plots.remove(self.plot)
+            ack = streaming.write_batch([entry], principal, set(), self.key)
+            self.assertEqual((ack['created'], len(ack['errors'])), (0, 1))
+            # Revoked: the stream stops
+            self.revoke_elsewhere()
+            forget_keys()
+            with self.assertRaises(streaming.KeyRevoked):
+                streaming.write_batch([entry], principal, set(), self.key)
+        self.assertEqual(SensorReading.objects.count(), 1)
+
+
+@override_settings(INCIDENT_QUIET_MINUTES=30)
+class IncidentTests(ApiTestCase):
+    """Repeats of an anomaly coalesce into one open incident until it has been quiet (api/incidents.py)."""
+    START = datetime.datetime(2025, 5, 1, tzinfo=datetime.timezone.utc)
+
+    def setUp(self):
+        super().setUp()
+        _, self.plot = self.make_owner('incidents')
+        self.other = self.make_plot(self.plot.farm, 'Q', 'Corn')
+
+    def event(self, minute, anomaly_type='Drought / Pump Failure', plot=None):
+        return AnomalyEvent(plot=plot or self.plot, anomaly_type=anomaly_type, severity='critical',
+                            description='Abnormal moisture reading: 5', model_confidence=0.95,
+                            sensor_type='moisture', value=5, last_seen=self.at(minute))
+
+    def at(self, minute):
+        return self.START + datetime.timedelta(minutes=minute)
+
+    def record(self, events):
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            return incidents.record(events)
+
+    def test_repeats_in_one_batch(self):
+        events = [self.event(2), None, self.event(0), self.event(1, 'Heat Stress'), self.event(1),
+                  self.event(1, plot=self.other)]
+        created, owners = self.record(events)
+        self.assertEqual(len(created), 3)
+        drought = AnomalyEvent.objects.get(plot=self.plot, anomaly_type='Drought / Pump Failure')
+        self.assertEqual((drought.occurrences, drought.last_seen), (3, self.at(2)))
+        self.assertIsNone(owners[1])
+        self.assertEqual({owners[index].id for index in (0, 2, 4)}, {drought.id})
+        self.assertEqual(len({owner.id for owner in owners if owner is not None}), 3)
+
+    def test_repeats_extend_the_open_incident(self):
+        (incident,), _ = self.record([self.event(0)])
+        for cached in (True, False):
+            if not cached:
+                cache.clear()  # Evicted, or written by another process: found in the database
+            created, owners = self.record([self.event(10 if cached else 20), self.event(5)])
+            self.assertEqual(created, [])
+            self.assertEqual({owner.id for owner in owners}, {incident.id})
+        incident.refresh_from_db()
+        self.assertEqual((incident.occurrences, incident.last_seen), (5, self.at(20)))
+        self.assertEqual(AnomalyEvent.objects.count(), 1)
+
+    def test_quiet_period_opens_a_new_incident(self):
+        (first,), _ = self.record([self.event(0)])
+        self.record([self.event(30)])  # Just within the quiet period
+        (second,), _ = self.record([self.event(61)])
+        self.assertNotEqual(second.id, first.id)
+        first.refresh_from_db()
+        self.assertEqual((first.occurrences, first.last_seen), (2, self.at(30)))
+        # A gap inside one batch splits it the same way
+        created, _ = self.record([self.event(100), self.event(140), self.event(145)])
+        self.assertEqual([incident.occurrences for incident in created], [1, 2])
+
+    def test_shared_labels_are_kept_per_sensor(self):
+        temperature = self.event(0, 'Sudden change')
+        temperature.sensor_type = 'temperature'
+        (first,), _ = self.record([temperature])
+        # A humidity jump during the open temperature incident is a separate problem
+        created, owners = self.record([self.event(5, 'Sudden change'), self.event(6, 'Sudden change')])
+        self.assertEqual(len(created), 1)
+        self.assertNotEqual(owners[0].id, first.id)
+        first.refresh_from_db()
+        self.assertEqual(first.occurrences, 1)
+        self.assertEqual(AnomalyEvent.objects.filter(closed_at__isnull=True).count(), 2)
+
+    def test_long_quiet_incidents_are_not_scanned(self):
+        (stale,), _ = self.record([self.event(0)])
+        cache.clear()
+        # Still open (close_incidents hasn't run), but quiet for longer than the quiet period
+        with CaptureQueriesContext(connection) as queries:
+            (fresh,), _ = self.record([self.event(120)])
+        self.assertNotEqual(fresh.id, stale.id)
+        lookup = next(query['sql'] for query in queries if 'closed_at' in query['sql'])
+        self.assertIn('last_seen', lookup)
+
+    def test_close_quiet(self):
+        (old,), _ = self.record([self.event(0)])
+        (recent,), _ = self.record([self.event(50, plot=self.other)])
+        closed, plot_ids = incidents.close_quiet(now=self.at(60))
+        self.assertEqual((closed, plot_ids), (1, {self.plot.id}))
+        old.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual((old.closed_at, recent.closed_at), (self.at(60), None))
+        self.assertEqual(incidents.close_quiet(now=self.at(60)), (0, set()))
+
+        # The next hit on the closed one opens a new incident
+        (reopened,), _ = self.record([self.event(61)])
+        self.assertNotEqual(reopened.id, old.id)
+        self.assertEqual(AnomalyEvent.objects.filter(closed_at__isnull=True).count(), 2)
+
+    def test_migration_closes_quiet_events(self):
+        migration = importlib.import_module('api.migrations.0008_anomalyevent_incident')
+        old, recent = self.event(0), self.event(0, plot=self.other)
+        AnomalyEvent.objects.bulk_create([old, recent])
+        AnomalyEvent.objects.filter(id=old.id).update(timestamp=self.at(0))  # Detected long ago
+        migration.backfill_last_seen(django_apps, None)
+        old.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual((old.last_seen, recent.closed_at), (self.at(0), None))
+        self.assertIsNotNone(old.closed_at)
+
+    def test_close_incidents_command(self):
+        self.record([self.event(0)])
+        out = io.StringIO()
+        call_command('close_incidents', stdout=out)
+        self.assertIn('Closed 1 incidents on 1 plots', out.getvalue())
+        self.assertFalse(AnomalyEvent.objects.filter(closed_at__isnull=True).exists())
+
+
+class ImportReadingsTests(ApiTestCase):
+    """`manage.py import_readings`: resumable chunks, and history kept out of the live detector state."""
+    START = datetime.datetime(2024, 6, 1, tzinfo=datetime.timezone.utc)
+
+    def setUp(self):
+        super().setUp()
+        _, self.plot = self.make_owner('importer')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'history.jsonl')
+        with open(self.path, 'w') as f:
+            for minute in range(23):
+                value = 5 if minute == 20 else 50  # One pump failure
+                f.write(json.dumps({'plot': self.plot.id, 'sensor_type': 'moisture', 'value': value,
+                                    'timestamp': (self.START + datetime.timedelta(minutes=minute)).isoformat()}) + '\n')
+            f.write('{not json\n')
+
+    def run_import(self, *args):
+        call_command('import_readings', self.path, '--chunk-size', '5', *args, stdout=io.StringIO(),
+                     stderr=io.StringIO())
+
+    def test_resume_after_interruption(self):
+        load_chunk = import_readings.load_chunk
+        calls = []
+
+        def crashing(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 3:
+                raise DatabaseError("connection lost")
+            return load_chunk(*args, **kwargs)
+
+        with mock.patch.object(import_readings, 'load_chunk', crashing):
+            with self.assertRaises(DatabaseError):
+                self.run_import()
+        checkpoint = ReadingImport.objects.get()
+        self.assertEqual((checkpoint.rows, checkpoint.finished_at), (10, None))
+        with open(self.path, 'rb') as f:
+            self.assertEqual(checkpoint.offset, sum(len(f.readline()) for _ in range(10)))
+        self.assertEqual(SensorReading.objects.count(), 10)
+
+        self.run_import()
+        checkpoint.refresh_from_db()
+        self.assertEqual((checkpoint.rows, checkpoint.rejected), (23, 1))
+        self.assertEqual(checkpoint.offset, os.path.getsize(self.path))
+        self.assertIsNotNone(checkpoint.finished_at)
+        timestamps = list(SensorReading.objects.order_by('timestamp').values_list('timestamp', flat=True))
+        self.assertEqual(timestamps, [self.START + datetime.timedelta(minutes=minute) for minute in range(23)])
+
+        self.run_import()  # Finished: nothing loaded twice
+        self.assertEqual(SensorReading.objects.count(), 23)
+
+    def test_out_of_range_timestamps_are_bad_rows(self):
+        for timestamp in (1e300, -1e300, 10 ** 20, float('nan'), float('inf'), '99999-01-01'):
+            record = {'plot': self.plot.id, 'sensor_type': 'moisture', 'value': 50, 'timestamp': timestamp}
+            with self.subTest(timestamp=timestamp), self.assertRaises(ValueError):
+                parse_record(record, {self.plot.id}, 'import')
+        reading = parse_record({'plot': self.plot.id, 'sensor_type': 'moisture', 'value': 50,
+                                'timestamp': self.START.timestamp()}, {self.plot.id}, 'import')
+        self.assertEqual(reading.timestamp, self.START)
+
+    def test_detection_leaves_the_live_state_alone(self):
+        self.run_import('--detect')
+        self.assertEqual(AnomalyEvent.objects.get().value, 5)
+        self.assertEqual(ReadingImport.objects.get().anomalies, 1)
+        # Neither the process-wide baselines / recent readings nor the stored baselines saw the history
+        self.assertIsNone(baselines._store)
+        self.assertIsNone(ringbuffer._recent)
+        self.assertFalse(PlotBaseline.objects.exists())
+
+
+class FakeWrites:
+    """Stands in for streaming.write_batch: records the batches, optionally holds them up."""
+
+    def __init__(self):
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, entries, user, known_plots, key=None):
+        self.release.wait(5)
+        self.batches.append([seq for seq, _, _ in entries])
+        errors = [{"seq": seq, "errors": error} for seq, _, error in entries if error is not None]
+        return {"ack": entries[-1][0], "created": len(entries) - len(errors), "anomalies": 0, "errors": errors}
+
+    @property
+    def stored(self):
+        return [seq for batch in self.batches for seq in batch]
+
+
+@override_settings(STREAM_INGEST_BATCH_SIZE=3, STREAM_INGEST_FLUSH_SECONDS=0.05, STREAM_INGEST_QUEUE_SIZE=4)
+class StreamingTests(SimpleTestCase):
+    """Line parsing, micro-batching, backpressure and disconnects of the streaming ingest endpoint."""
+    USER = SimpleNamespace(username='gateway')
+
+    def setUp(self):
+        self.writes = FakeWrites()
+        for target in (mock.patch.object(streaming, 'write_batch', self.writes),
+                       mock.patch.object(streaming, 'authenticate', return_value=self.USER)):
+            target.start()
+            self.addCleanup(target.stop)
+
+    def line(self, seq=None, value=50):
+        item = {'plot': 1, 'sensor_type': 'humidity', 'value': value, 'timestamp': '2025-01-01T00:00:00Z'}
+        if seq is not None:
+            item['seq'] = seq
+        return json.dumps(item)
+
+    def run_asgi(self, scope, messages, disconnect=True):
+        """Feeds `messages` to the streaming app, then (optionally) disconnects. Returns what it sent."""
+        sent = []
+
+        async def main():
+            queue = asyncio.Queue()
+            for message in messages:
+                queue.put_nowait(message)
+
+            async def receive():
+                if queue.empty():
+                    if not disconnect:
+                        await asyncio.Event().wait()
+                    return {'type': 'websocket.disconnect' if scope['type'] == 'websocket' else 'http.disconnect'}
+                return queue.get_nowait()
+
+            async def send(message):
+                sent.append(message)
+
+            await asyncio.wait_for(streaming.ingest_stream(scope, receive, send), 5)
+
+        asyncio.run(main())
+        return sent
+
+    def websocket(self, frames, disconnect=True):
+        messages = [{'type': 'websocket.connect'}] + [
+            {'type': 'websocket.receive', **({'bytes': frame} if isinstance(frame, bytes) else {'text': frame})}
+            for frame in frames
+        ]
+        return self.run_asgi({'type': 'websocket', 'path': streaming.STREAM_PATH, 'headers': []}, messages,
+                             disconnect=disconnect)
+
+    def test_line_parsing(self):
+        async def parse(lines):
+            stream = streaming.IngestStream(self.USER, None)
+            for line in lines:
+                await stream.feed_line(line)
+            return [stream.queue.get_nowait() for _ in range(stream.queue.qsize())]
+
+        with override_settings(STREAM_INGEST_QUEUE_SIZE=100):
+            entries = asyncio.run(parse([
+                self.line(), '', '   ', '{not json', self.line(seq=10), self.line(), '{"seq": "x"}', self.line(seq=3),
+            ]))
+        self.assertEqual([(seq, error) for seq, _, error in entries], [
+            (1, None), (2, {"non_field_errors": ["Invalid JSON."]}), (10, None), (11, None),
+            (12, {"seq": ["Must be an integer."]}), (3, None),
+        ])
+        self.assertNotIn('seq', entries[2][1])
+
+    def test_http_lines_split_across_chunks(self):
+        body = ('\n'.join(self.line() for _ in range(7)) + '\n').encode()
+        chunks = [body[start:start + 50] for start in range(0, len(body), 50)]
+        messages = [{'type': 'http.request', 'body': chunk, 'more_body': True} for chunk in chunks]
+        messages.append({'type': 'http.request', 'body': b'', 'more_body': False})
+        sent = self.run_asgi({'type': 'http', 'method': 'POST', 'path': streaming.STREAM_PATH, 'headers': []},
+                             messages, disconnect=False)
+
+        self.assertEqual(self.writes.stored, list(range(1, 8)))
+        self.assertTrue(all(len(batch) <= 3 for batch in self.writes.batches))
+        lines = [json.loads(line) for message in sent[1:] for line in message.get('body', b'').splitlines()]
+        self.assertEqual(lines[-1], {"done": True, "ack": 7, "created": 7, "failed": 0})
+        self.assertEqual([line['ack'] for line in lines[:-1]], [batch[-1] for batch in self.writes.batches])
+
+    def test_batches_flush_on_size_and_time(self):
+        acks = []
+
+        async def send_ack(ack):
+            acks.append(ack)
+
+        async def main():
+            stream = streaming.IngestStream(self.USER, send_ack)
+            writer = asyncio.create_task(stream.run_writer())
+            for _ in range(7):
+                await stream.feed_line(self.line())
+            await asyncio.sleep(0.3)  # Longer than STREAM_INGEST_FLUSH_SECONDS: the tail goes out alone
+            flushed = list(self.writes.batches)
+            await stream.finish()
+            await writer
+            return flushed
+
+        self.assertEqual(asyncio.run(main()), [[1, 2, 3], [4, 5, 6], [7]])
+        self.assertEqual([ack['ack'] for ack in acks], [3, 6, 7])
+
+    def test_backpressure(self):
+        async def main():
+            stream = streaming.IngestStream(self.USER, lambda ack: asyncio.sleep(0))
+            writer = asyncio.create_task(stream.run_writer())
+            self.writes.release.clear()  # The database is slow
+            fed = 0
+            try:
+                for _ in range(20):
+                    await asyncio.wait_for(stream.feed_line(self.line()), 0.5)
+                    fed += 1
+            except asyncio.TimeoutError:
+                pass
+            blocked_at = fed
+            self.writes.release.set()
+            for _ in range(20 - fed - 1):
+                await stream.feed_line(self.line())
+            await stream.finish()
+            await writer
+            return blocked_at, stream
+
+        blocked_at, stream = asyncio.run(main())
+        # One batch in flight plus a full queue, then reading stops
+        self.assertEqual(blocked_at, 3 + 4)
+        self.assertEqual(len(self.writes.stored), 19)  # The line that timed out was never queued
+        self.assertEqual(stream.summary()['created'], 19)
+
+    def test_disconnect_stores_what_was_sent(self):
+        frames = ['\n'.join(self.line() for _ in range(5)) for _ in range(3)]
+        sent = self.websocket(frames)
+        self.assertEqual(self.writes.stored, list(range(1, 16)))
+        self.assertNotIn('websocket.close', [message['type'] for message in sent])
+
+    def test_revoked_key_closes_the_socket(self):
+        writes = self.writes
+
+        def write(entries, user, known_plots, key=None):
+            if writes.batches:
+                raise streaming.KeyRevoked("API key revoked")
+            return writes(entries, user, known_plots, key)
+
+        with mock.patch.object(streaming, 'write_batch', write):
+            # The gateway sends six readings, then stays connected without sending more
+            sent = self.websocket([self.line() for _ in range(6)], disconnect=False)
+        self.assertEqual(self.writes.stored, [1, 2, 3])
+        self.assertEqual(sent[-1], {'type': 'websocket.close', 'code': 4401})
+        summary = json.loads(sent[-2]['text'])
+        self.assertEqual((summary['done'], summary['ack'], summary['error']), (False, 3, "API key revoked"))
+
+    def test_binary_frames(self):
+        sent = self.websocket([self.line().encode(), b'\xff\xfe not utf-8', self.line()])
+        self.assertEqual(self.writes.stored, [1])
+        self.assertEqual(sent[-1], {'type': 'websocket.close', 'code': 1007})
+        summary = json.loads(sent[-2]['text'])
+        self.assertEqual((summary['done'], summary['ack'], summary['created']), (False, 1, 1))
+        self.assertIn('UTF-8', summary['error'])
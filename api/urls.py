@@ -1,12 +1,13 @@
 from django.urls import path
-from .views import login_view, dashboard_view
+from .views import login_view, dashboard_view, plot_events_view
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
 from .views import (
     FarmListCreateView, PlotListCreateView, 
-    SensorReadingListCreateView, AnomalyListCreateView, RecommendationListView
+    SensorReadingListCreateView, SensorReadingBatchView, SensorReadingLatestView,
+    SensorRollupListView, AnomalyListCreateView, RecommendationListView, PlotEventsTokenView
 )
 
 urlpatterns = [
@@ -17,7 +18,12 @@ urlpatterns = [
     # Your data URLs
     path('farms/', FarmListCreateView.as_view(), name='farm-list'),
     path('plots/', PlotListCreateView.as_view(), name='plot-list'),
+    path('plots/<int:plot_id>/events/', plot_events_view, name='plot-events'),
+    path('plots/<int:plot_id>/events/token/', PlotEventsTokenView.as_view(), name='plot-events-token'),
     path('sensor-readings/', SensorReadingListCreateView.as_view(), name='sensor-readings'),
+    path('sensor-readings/batch/', SensorReadingBatchView.as_view(), name='sensor-readings-batch'),
+    path('sensor-readings/latest/', SensorReadingLatestView.as_view(), name='sensor-readings-latest'),
+    path('sensor-rollups/', SensorRollupListView.as_view(), name='sensor-rollup-list'),
     path('anomalies/', AnomalyListCreateView.as_view(), name='anomaly-list'),
     path('recommendations/', RecommendationListView.as_view(), name='recommendation-list'),
     
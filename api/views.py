@@ -1,24 +1,46 @@
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
-from rest_framework import generics
+from rest_framework import generics, status
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.settings import api_settings
 
 # Import your models and serializers
-from .models import FarmProfile, FieldPlot, SensorReading, AnomalyEvent, AgentRecommendation
+from .models import FarmProfile, FieldPlot, SensorReading, SensorRollup, AnomalyEvent, AgentRecommendation
 from .serializers import (
     FarmProfileSerializer, FieldPlotSerializer, SensorReadingSerializer, 
-    AnomalyEventSerializer, AgentRecommendationSerializer
+    AnomalyEventSerializer, AgentRecommendationSerializer, SensorReadingBatchItemSerializer,
+    SensorRollupSerializer
 )
-# Import the new ML logic
-from ml_module.logic import AnomalyDetector
+# Batch-aware ingest pipeline (bulk insert + ML detection)
+from .ingest import ingest_readings
+from .rollups import GRANULARITIES, parse_moment
+from .changes import PlotChangeStream, stream_token, stream_user
+# ETag / 304 / response cache for GET lists
+from .conditional import ConditionalGetMixin
+# Cached per-user plot ownership (no plot -> farm -> user joins)
+from .acl import allowed_plot_ids, can_access_plot, restrict
+# Field devices: `Authorization: Api-Key ...`, only where a view opts in
+from .authentication import DeviceKeyAuthentication, DeviceMethodsOnly, DevicePrincipal
+# Queries per request: views declare `query_budget`, api/tests.py enforces it
+from .middleware import query_budget
+# Recent readings per plot kept in memory (latest endpoint without a DB round trip)
+from ml_module import ringbuffer
 
-# Initialize the detector once when the server starts
-detector = AnomalyDetector()
+DEVICE_AUTHENTICATION = [DeviceKeyAuthentication, *api_settings.DEFAULT_AUTHENTICATION_CLASSES]
 
 # 1. Farm View (Only owner sees their farms)
-class FarmListCreateView(generics.ListCreateAPIView):
+class FarmListCreateView(ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = FarmProfileSerializer
     permission_classes = [IsAuthenticated]
+    version_scope = 'catalog'
+    keyset_ordering = ('id',)
+    query_budget = 3
 
     def perform_create(self, serializer):
         # Automatically assign the logged-in user as the owner
@@ -31,31 +53,35 @@ class FarmListCreateView(generics.ListCreateAPIView):
         return FarmProfile.objects.filter(user=self.request.user)
 
 # 2. Plot View (Only owner sees their plots)
-class PlotListCreateView(generics.ListCreateAPIView):
+class PlotListCreateView(ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = FieldPlotSerializer
-    permission_classes = [IsAuthenticated]
+    authentication_classes = DEVICE_AUTHENTICATION
+    permission_classes = [IsAuthenticated, DeviceMethodsOnly]
+    device_methods = ('GET',)  # A device may list the plots it can write to
+    version_scope = 'catalog'
+    keyset_ordering = ('id',)
+    query_budget = 4
 
     def get_queryset(self):
         # 1. Admin sees everything
         if self.request.user.is_superuser:
             return FieldPlot.objects.all()
         
-        # 2. Farmer sees only plots linked to their farms
-        # Logic: Look for plots where the 'farm' owner is the current user
-        return FieldPlot.objects.filter(farm__user=self.request.user)
+        # 2. Farmer sees only plots linked to their farms (cached ownership set)
+        return restrict(FieldPlot.objects.all(), self.request.user, field='id')
 
 # 3. Sensor Data Ingestion & Retrieval (Secure + ML Integration)
-class SensorReadingListCreateView(generics.ListCreateAPIView):
+class SensorReadingListCreateView(ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = SensorReadingSerializer
-    permission_classes = [IsAuthenticated]
+    authentication_classes = DEVICE_AUTHENTICATION
+    permission_classes = [IsAuthenticated, DeviceMethodsOnly]
+    device_methods = ('POST',)
+    keyset_ordering = ('-timestamp', '-id')
+    query_budget = 16  # POST, cold caches; the baseline flush runs after the response
 
     def get_queryset(self):
         # 1. Security Filter: Only show readings from the user's own plots
-        if self.request.user.is_superuser:
-            queryset = SensorReading.objects.all()
-        else:
-            # Logic: Reading -> Plot -> Farm -> User matches current user
-            queryset = SensorReading.objects.filter(plot__farm__user=self.request.user)
+        queryset = restrict(SensorReading.objects.all(), self.request.user)
 
         # 2. URL Filter: ?plot=1 (For dashboard)
         plot_id = self.request.query_params.get('plot')
@@ -65,78 +91,230 @@ class SensorReadingListCreateView(generics.ListCreateAPIView):
         return queryset
 
     def perform_create(self, serializer):
-        # 1. Save the sensor reading
-        reading = serializer.save()
-        
+        if not can_access_plot(self.request.user, serializer.validated_data['plot'].id):
+            raise PermissionDenied("You do not own this plot.")
+
+        reading = SensorReading(**serializer.validated_data)
+        if isinstance(self.request.user, DevicePrincipal) and 'source' not in serializer.validated_data:
+            reading.source = self.request.user.name  # Default attribution: the device
+
+        # Same pipeline as the batch endpoint, with a batch of one:
+        # 1. Save the sensor reading (+ rollups)  2. Run ML Check
+        readings, _ = ingest_readings([reading])
+        serializer.instance = readings[0]
+
+# 3c. Dashboard Chart: latest N readings per sensor type, only what's new since ?after=
+class SensorReadingLatestView(ConditionalGetMixin, generics.GenericAPIView):
+    serializer_class = SensorReadingSerializer
+    permission_classes = [IsAuthenticated]
+    query_budget = 3
+
+    def latest_queryset(self, plot_id, limit, after=0):
+        # 1. Security Filter: Only the user's own plots
+        if not can_access_plot(self.request.user, plot_id):
+            return SensorReading.objects.none()
+        queryset = SensorReading.objects.filter(plot_id=plot_id)
+
+        # 2. Watermark: ids are assigned on insert, so id > after == "arrived since the last poll"
+        if after:
+            queryset = queryset.filter(id__gt=after)
+
+        # 3. One query: number rows per sensor type (newest first) and keep the first N of each
+        queryset = queryset.annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=[F('sensor_type')],
+                order_by=[F('timestamp').desc(), F('id').desc()],
+            )
+        ).filter(row_number__lte=limit).order_by('sensor_type', '-timestamp', '-id')
+
+        return queryset
+
+    def list(self, request, *args, **kwargs):
         try:
-            # 2. Run ML Check (Unpack 3 values: anomaly bool, text reason, confidence float)
-            is_anomaly, reason, conf_score = detector.check_anomaly(reading.sensor_type, reading.value)
-            
-            if is_anomaly:
-                # --- DYNAMIC SEVERITY LOGIC ---
-                severity = 'medium' # Default
-
-                # Rule A: Confidence Impact
-                if conf_score > 0.90:
-                    severity = 'high'
-                elif conf_score < 0.60:
-                    severity = 'low'
-
-                # Rule B: Critical Keywords (Updated to match ml_module/logic.py)
-                critical_keywords = [
-                    'failure',       # Matches "Pump Failure"
-                    'drought',       # Matches "Drought"
-                    'waterlogging',  # Matches "Waterlogging"
-                    'heat stress',   # Matches "Heat Stress"
-                    'frost',         # Matches "Frost Danger"
-                    'dry air'        # Matches "Extremely Dry Air"
-                ]
-                
-                if any(k in reason.lower() for k in critical_keywords) and conf_score > 0.8:
-                    severity = 'critical'
-
-                # Rule C: Downgrade vague "Abnormal Patterns"
-                if 'abnormal' in reason.lower():
-                    if severity == 'critical': severity = 'high'
-                # -------------------------------
-
-                print(f"🚨 ANOMALY: {reason} (Val: {reading.value}, Conf: {conf_score}, Sev: {severity})")
-                
-                # 3. Save the event using the CALCULATED variables
-                AnomalyEvent.objects.create(
-                    plot=reading.plot,
-                    anomaly_type=reason,
-                    description=f"Abnormal {reading.sensor_type} reading: {reading.value}",
-                    severity=severity, 
-                    model_confidence=conf_score,
-                    # related_reading=reading (REMOVED to prevent crash)
-                )
-                print("✅ Anomaly saved.")
-
-        except Exception as e:
-            print(f"❌ CRASH IN ML: {e}")
-                
+            plot_id = int(request.query_params['plot'])
+            limit = min(int(request.query_params.get('limit', 15)), settings.SENSOR_READING_LATEST_MAX)
+            after = int(request.query_params.get('after', 0))
+        except (KeyError, ValueError):
+            return Response({"detail": "?plot=<id> is required; ?limit and ?after must be integers."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        readings = None
+        if can_access_plot(request.user, plot_id):
+            # Served from the in-memory recent readings when they can answer exactly
+            rows = ringbuffer.latest(plot_id, limit, after)
+            if rows is not None:
+                readings = [SensorReading(id=reading_id, plot_id=plot_id, sensor_type=sensor_type, value=value,
+                                          timestamp=timestamp, source=source)
+                            for reading_id, sensor_type, value, timestamp, source in rows]
+        if readings is None:
+            readings = list(self.latest_queryset(plot_id, limit, after))
+        watermark = max([after] + [reading.id for reading in readings])
+        return Response({
+            "watermark": watermark,
+            "results": self.get_serializer(readings, many=True).data,
+        })
+
+# 3b. Batch Ingestion: many readings per request, one INSERT, one detection pass
+class SensorReadingBatchView(generics.GenericAPIView):
+    serializer_class = SensorReadingBatchItemSerializer
+    authentication_classes = DEVICE_AUTHENTICATION
+    permission_classes = [IsAuthenticated, DeviceMethodsOnly]
+    device_methods = ('POST',)
+    query_budget = 16  # Cold caches; the baseline flush runs after the response
+
+    def post(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({"detail": "Expected a JSON list of readings."}, status=status.HTTP_400_BAD_REQUEST)
+
+        limit = settings.SENSOR_READING_BATCH_LIMIT
+        if len(items) > limit:
+            return Response({"detail": f"Batch too large: {len(items)} readings (max {limit})."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # 1. Plots this user may write to: cached ownership set, or ONE query for admins
+        plot_ids = allowed_plot_ids(request.user)
+        if plot_ids is None:
+            requested = {item.get('plot') for item in items if isinstance(item, dict)}
+            requested = {pk for pk in requested if isinstance(pk, int) or (isinstance(pk, str) and pk.isdigit())}
+            plot_ids = set(FieldPlot.objects.filter(id__in=requested).values_list('id', flat=True))
+
+        # 2. Validate each item on its own so one bad reading doesn't reject the batch
+        results = [None] * len(items)
+        valid_indexes, readings = [], []
+        for index, item in enumerate(items):
+            serializer = self.get_serializer(data=item, context={'plot_ids': plot_ids})
+            if serializer.is_valid():
+                valid_indexes.append(index)
+                readings.append(SensorReading(**serializer.validated_data))
+                if isinstance(request.user, DevicePrincipal) and 'source' not in serializer.validated_data:
+                    readings[-1].source = request.user.name
+            else:
+                results[index] = {"index": index, "status": "invalid", "errors": serializer.errors}
+
+        # 3. Bulk insert + batched detection
+        if readings:
+            readings, events = ingest_readings(readings)
+            for index, reading, event in zip(valid_indexes, readings, events):
+                results[index] = {
+                    "index": index,
+                    "status": "created",
+                    "id": reading.id,
+                    "anomaly": event.anomaly_type if event is not None else None,
+                    # The incident this reading was counted in (repeats share one)
+                    "anomaly_id": event.id if event is not None else None,
+                }
+
+        created = len(readings)
+        if created == len(items):
+            code = status.HTTP_201_CREATED
+        elif created:
+            code = status.HTTP_207_MULTI_STATUS
+        else:
+            code = status.HTTP_400_BAD_REQUEST
+
+        return Response({"created": created, "failed": len(items) - created, "results": results}, status=code)
+
+# 3d. Pre-aggregated history (hourly/daily buckets) for charts and reports
+class SensorRollupListView(ConditionalGetMixin, generics.ListAPIView):
+    serializer_class = SensorRollupSerializer
+    permission_classes = [IsAuthenticated]
+    keyset_ordering = ('-bucket', '-id')
+    query_budget = 3
+
+    def get_queryset(self):
+        queryset = restrict(SensorRollup.objects.all(), self.request.user)
+
+        # URL Filters: ?plot=1&sensor_type=temperature&granularity=day&start=...&end=...
+        params = self.request.query_params
+        granularity = params.get('granularity', 'hour')
+        if granularity not in GRANULARITIES:
+            raise ValidationError({'granularity': f"Expected one of {', '.join(GRANULARITIES)}."})
+        queryset = queryset.filter(granularity=granularity)
+        if params.get('plot') is not None:
+            try:
+                queryset = queryset.filter(plot__id=int(params['plot']))
+            except ValueError:
+                raise ValidationError({'plot': "Expected a plot id."})
+        if params.get('sensor_type') is not None:
+            queryset = queryset.filter(sensor_type=params['sensor_type'])
+        if params.get('start') is not None:
+            queryset = queryset.filter(bucket__gte=self.parse_moment('start'))
+        if params.get('end') is not None:
+            queryset = queryset.filter(bucket__lt=self.parse_moment('end'))
+        return queryset
+
+    def parse_moment(self, name):
+        moment = parse_moment(self.request.query_params[name])
+        if moment is None:
+            raise ValidationError({name: "Expected an ISO 8601 date or datetime."})
+        return moment
+
+# 3e. Dashboard push channel: Server-Sent Events for one plot (replaces polling)
+class PlotEventsTokenView(generics.GenericAPIView):
+    """
+    EventSource can't send headers, so the stream is opened with ?token=: a short-lived
+    token for this plot only (the JWT would end up in access logs).
+    """
+    permission_classes = [IsAuthenticated]
+    query_budget = 3
+
+    def post(self, request, plot_id):
+        if not can_access_plot(request.user, plot_id) or not FieldPlot.objects.filter(id=plot_id).exists():
+            return Response({"detail": "No FieldPlot matches the given query."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"token": stream_token(request.user, plot_id), "expires_in": settings.SSE_TOKEN_SECONDS})
+
+@query_budget(3)  # Until the stream starts
+def plot_events_view(request, plot_id):
+    """
+    ?token= comes from PlotEventsTokenView and is checked on every (re)connect.
+    Resumes from the Last-Event-ID header (or ?last_event_id= on the first connect).
+    """
+    user = stream_user(request.GET.get('token', ''), plot_id)
+    if user is None:
+        return JsonResponse({"detail": "Stream token missing, expired or not for this plot."}, status=401)
+
+    # Ownership check (the plot may have changed hands since the token was issued)
+    if not can_access_plot(user, plot_id) or not FieldPlot.objects.filter(id=plot_id).exists():
+        return JsonResponse({"detail": "No FieldPlot matches the given query."}, status=404)
+
+    stream = PlotChangeStream(plot_id, request.headers.get('Last-Event-ID') or request.GET.get('last_event_id'))
+    # Long-lived under ASGI; a WSGI worker thread only serves one tick (PlotChangeStream.__iter__)
+    content = aiter(stream) if isinstance(request, ASGIRequest) else iter(stream)
+    response = StreamingHttpResponse(content, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+    return response
+
 # 4. Anomaly & Recommendation Views
-class AnomalyListCreateView(generics.ListCreateAPIView):
+class AnomalyListCreateView(ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = AnomalyEventSerializer
     permission_classes = [IsAuthenticated]
+    plot_param = None  # Not filtered by plot
+    keyset_ordering = ('-timestamp', '-id')
+    query_budget = 5
 
     def get_queryset(self):
-        # Filter anomalies by ownership
-        if self.request.user.is_superuser:
-            return AnomalyEvent.objects.all().order_by('-timestamp')
-        return AnomalyEvent.objects.filter(plot__farm__user=self.request.user).order_by('-timestamp')
+        # Filter anomalies by ownership (plot joined in: the serializer shows plot_name)
+        return restrict(AnomalyEvent.objects.select_related('plot'), self.request.user).order_by('-timestamp')
+
+    def perform_create(self, serializer):
+        if not can_access_plot(self.request.user, serializer.validated_data['plot'].id):
+            raise PermissionDenied("You do not own this plot.")
+        serializer.save()
 
-class RecommendationListView(generics.ListAPIView):
+class RecommendationListView(ConditionalGetMixin, generics.ListAPIView):
     serializer_class = AgentRecommendationSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('-created_at', '-id')
+    query_budget = 3
 
     def get_queryset(self):
-        # 1. Filter recommendations by ownership (via Anomaly -> Plot -> Farm -> User)
-        if self.request.user.is_superuser:
-            queryset = AgentRecommendation.objects.all().order_by('-created_at')
-        else:
-            queryset = AgentRecommendation.objects.filter(anomaly_event__plot__farm__user=self.request.user).order_by('-created_at')
+        # 1. Filter recommendations by ownership (via Anomaly -> cached plot set)
+        queryset = restrict(
+            AgentRecommendation.objects.all(), self.request.user, field='anomaly_event__plot_id'
+        ).order_by('-created_at')
         
         # 2. Filter by specific plot (?plot=1)
         plot_id = self.request.query_params.get('plot')
@@ -146,8 +324,10 @@ class RecommendationListView(generics.ListAPIView):
         return queryset
 
 # 5. Frontend Template Views
+@query_budget(0)
 def login_view(request):
     return render(request, 'api/login.html')
 
+@query_budget(0)
 def dashboard_view(request):
     return render(request, 'api/dashboard.html')
\ No newline at end of file
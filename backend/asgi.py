@@ -13,4 +13,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after setup: needs the app registry
+from api.streaming import STREAM_PATH, ingest_stream  # noqa: E402
+from ml_module.ringbuffer import warm_in_background  # noqa: E402
+
+warm_in_background()
+
+
+async def application(scope, receive, send):
+    # Long-lived streaming ingest bypasses Django's request/response cycle
+    if scope['type'] in ('http', 'websocket') and scope['path'] == STREAM_PATH:
+        return await ingest_stream(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.QueryCountMiddleware',  # Queries / DB time per request (headers in DEBUG, `api.queries` log)
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -153,4 +154,76 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
-}
\ No newline at end of file
+    # Keyset (cursor) pagination on every list endpoint; override per request with ?page_size=
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    'PAGE_SIZE': 100,
+}
+
+# Max number of readings accepted by POST /api/sensor-readings/batch/
+SENSOR_READING_BATCH_LIMIT = int(os.environ.get('SENSOR_READING_BATCH_LIMIT', '1000'))
+
+# Max ?limit for GET /api/sensor-readings/latest/ (readings per sensor type)
+SENSOR_READING_LATEST_MAX = 500
+
+# Streaming ingest (ASGI only, see api/streaming.py)
+STREAM_INGEST_BATCH_SIZE = int(os.environ.get('STREAM_INGEST_BATCH_SIZE', '500'))        # Readings per DB write
+STREAM_INGEST_FLUSH_SECONDS = float(os.environ.get('STREAM_INGEST_FLUSH_SECONDS', '0.2'))  # Max wait to fill a batch
+STREAM_INGEST_QUEUE_SIZE = int(os.environ.get('STREAM_INGEST_QUEUE_SIZE', '5000'))       # Parsed readings buffered before reads pause
+STREAM_INGEST_MAX_LINE_BYTES = 64 * 1024
+
+# Raw reading retention (manage.py compact_readings). Values are days; None keeps forever.
+# Deleted raw rows stay summarised in the hourly/daily SensorRollup buckets.
+READING_RETENTION = {
+    'default_days': 90,
+    'sensor_types': {},          # e.g. {'temperature': 30}
+    'farms': {},                 # farm id -> days, wins over sensor_types
+    'hourly_rollup_days': 365,   # Older hourly buckets are dropped; daily ones are kept
+}
+
+# Shared by every process (web, ASGI, agent worker): per-plot change versions for the event streams.
+# Point CACHE_BACKEND/CACHE_LOCATION at Memcached or Redis in production.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / '.cache')),
+    }
+}
+
+# Device API keys (api/authentication.py): verified keys are cached in process memory.
+# A revoked key is rejected by every process within DEVICE_KEY_CACHE_SECONDS.
+DEVICE_KEY_CACHE_SECONDS = 60
+DEVICE_KEY_CACHE_SIZE = 10000
+
+# Cached per-user plot ownership (api/acl.py); signals invalidate it, this is only a safety net
+ACL_CACHE_SECONDS = 3600
+
+# GET list responses are cached per (user, endpoint, query, data version) for this long
+RESPONSE_CACHE_SECONDS = 300
+
+# Dashboard event stream (GET /api/plots/<id>/events/)
+SSE_POLL_SECONDS = 1.0          # How often an open stream checks its plot's version
+SSE_HEARTBEAT_SECONDS = 15      # Comment line sent when idle, keeps proxies from closing the connection
+SSE_MAX_SECONDS = 300           # Streams end after this; the browser reconnects with Last-Event-ID
+SSE_RETRY_MS = 2000
+SSE_TOKEN_SECONDS = 60          # Lifetime of a stream token (checked when a stream opens or reconnects)
+SSE_MAX_ROWS = 500              # Rows per event; the rest follows on the next tick
+
+# Published anomaly detector versions (see ml_module/registry.py)
+ML_MODEL_DIR = os.environ.get('ML_MODEL_DIR', BASE_DIR / 'ml_models')
+ML_MODEL_CHECK_SECONDS = float(os.environ.get('ML_MODEL_CHECK_SECONDS', '10'))  # How often workers look for a new CURRENT
+
+# Per-plot online baselines (see ml_module/baselines.py)
+BASELINE_ALPHA = float(os.environ.get('BASELINE_ALPHA', '0.01'))              # EWMA weight of a new reading (~100-reading memory)
+BASELINE_WARMUP = int(os.environ.get('BASELINE_WARMUP', '30'))                # Readings before a baseline is trusted
+BASELINE_FLUSH_SECONDS = float(os.environ.get('BASELINE_FLUSH_SECONDS', '30'))  # How often baselines are written to the DB
+
+# Recent readings kept in memory per plot and sensor type (see ml_module/ringbuffer.py)
+RECENT_READINGS_SIZE = int(os.environ.get('RECENT_READINGS_SIZE', '64'))      # Ring size: ~28 bytes x size x 3 per plot
+RECENT_READINGS_WINDOW = int(os.environ.get('RECENT_READINGS_WINDOW', '12'))  # Readings behind the detector's window features
+RECENT_READINGS_WARM = os.environ.get('RECENT_READINGS_WARM', 'True') == 'True'  # Preload every plot when a server starts
+
+# Repeated anomalies of one (plot, anomaly type) update a single open incident (see api/incidents.py)
+INCIDENT_QUIET_MINUTES = float(os.environ.get('INCIDENT_QUIET_MINUTES', '30'))  # Closed after this long without a repeat
+
+# X-DB-Queries / X-DB-Time-Ms / Server-Timing headers on every response (see api/middleware.py)
+QUERY_COUNT_HEADERS = os.environ.get('QUERY_COUNT_HEADERS', str(DEBUG)) == 'True'
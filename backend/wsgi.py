@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Imported after setup: needs the app registry
+from ml_module.ringbuffer import warm_in_background  # noqa: E402
+
+warm_in_background()
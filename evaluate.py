@@ -1,84 +1,349 @@
-import random
+import argparse
+import json
+import os
+import pickle
+import platform
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from datetime import datetime, timezone
+
 import numpy as np
+import sklearn
 from sklearn.metrics import precision_score, recall_score, f1_score, confusion_matrix, accuracy_score
 # Import your actual ML logic to test the real system
-from ml_module.logic import AnomalyDetector
+from ml_module.logic import AnomalyDetector, SAFETY_THRESHOLDS
+
+# Normal ranges match the detector's training data (ml_module/logic.py)
+NORMAL_DISTRIBUTIONS = {
+    'temperature': (25, 2),
+    'humidity': (60, 5),
+    'moisture': (55, 5),
+}
+# Anomalies land this far beyond the safety limits, on either side
+ANOMALY_MARGIN = (5, 25)
+BATCH_SIZES = (1, 100, 10_000, 100_000)
+
+def regression_checks(sensor_types):
+    """
+    Metrics compared against the baseline: (path in the report, kind).
+    'time' = lower is better (relative), 'rate' = higher is better (relative),
+    'score' = higher is better (absolute drop).
+    """
+    checks = [('training.seconds', 'time'), ('load.seconds', 'time'),
+              ('overall.precision', 'score'), ('overall.recall', 'score'), ('overall.f1', 'score'),
+              ('overall.with_baselines.precision', 'score'), ('overall.with_baselines.recall', 'score'),
+              ('overall.with_windows.precision', 'score'), ('overall.with_windows.recall', 'score')]
+    for size in BATCH_SIZES:
+        checks.append((f'batch.{size}.readings_per_s', 'rate'))
+    for sensor_type in sensor_types:
+        checks += [(f'sensors.{sensor_type}.single_us_p50', 'time'),
+                   (f'sensors.{sensor_type}.batch_readings_per_s', 'rate'),
+                   (f'sensors.{sensor_type}.precision', 'score'),
+                   (f'sensors.{sensor_type}.recall', 'score')]
+    return checks
 
-def generate_test_dataset(n_samples=1000):
+def generate_test_dataset(n_samples=2000, seed=42, anomaly_rate=0.15):
     """
-    Generates synthetic data with KNOWN labels (Ground Truth).
+    Generates seeded synthetic data with KNOWN labels (Ground Truth), for every sensor type.
     0 = Normal
     1 = Anomaly
+    Returns parallel arrays: sensor_types, values, y_true.
+    """
+    rng = np.random.default_rng(seed)
+    sensor_types, values, y_true = [], [], []
+
+    print(f"🧪 Generating {n_samples} test samples per sensor type (seed {seed})...")
+
+    for sensor_type, (mean, std) in NORMAL_DISTRIBUTIONS.items():
+        labels = (rng.random(n_samples) < anomaly_rate).astype(int)
+        sample = rng.normal(mean, std, n_samples)
+
+        # Anomalies: beyond the lower or the upper safety limit (e.g. frost / heat wave)
+        low, _, high, _, _ = SAFETY_THRESHOLDS[sensor_type]
+        n_anomalies = labels.sum()
+        offset = rng.uniform(*ANOMALY_MARGIN, n_anomalies)
+        below = rng.random(n_anomalies) < 0.5
+        sample[labels == 1] = np.where(below, low - offset, high + offset)
+
+        sensor_types += [sensor_type] * n_samples
+        values.append(sample)
+        y_true.append(labels)
+
+    return np.array(sensor_types, dtype=object), np.concatenate(values), np.concatenate(y_true)
+
+def load_test_dataset(path, limit):
+    """Labelled dataset written by `simulator.py generate` (first `limit` rows), plus its plot and timestamp columns."""
+    from simulator import load_dataset, SENSOR_TYPES
+    columns = load_dataset(path)
+    sensor_types = np.asarray(SENSOR_TYPES, dtype=object)[columns['sensor'][:limit]]
+    return (sensor_types, columns['value'][:limit].astype(float), columns['label'][:limit].astype(int),
+            columns['plot'][:limit], columns['timestamp'][:limit])
+
+def plot_deviations(plots, sensor_types, values, timestamps, chunk_size=5000):
+    """
+    Replays the (time-ordered) dataset through fresh per-plot baselines and recent-reading
+    windows, like ingest does. Returns (baseline z-scores, window z-scores).
+    """
+    from ml_module.baselines import BaselineStore
+    from ml_module.ringbuffer import RecentReadings
+    store, recent = BaselineStore(), RecentReadings()
+    seconds = timestamps.astype('datetime64[s]').astype(np.int64).tolist()
+    deviation, window = np.empty(len(values)), np.empty(len(values))
+    for start in range(0, len(values), chunk_size):
+        end = start + chunk_size
+        plot_ids, types = plots[start:end].tolist(), sensor_types[start:end].tolist()
+        deviation[start:end] = store.observe(plot_ids, types, values[start:end])
+        moments = [datetime.fromtimestamp(second, timezone.utc) for second in seconds[start:end]]
+        features = recent.observe(plot_ids, types, range(start, end), moments, values[start:end],
+                                  ['evaluate'] * (end - start))
+        window[start:end] = features['window_z']
+    return deviation, window
+
+def timed(function, repeats=5):
+    """
+    Seconds per call, timeit-style: each round loops long enough (~0.2s) to be measurable,
+    and the best round is kept (the least disturbed by other processes).
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeats, number=number)) / number
+
+def benchmark_training(seed):
+    # 1. Training (fit + compile the lookup tables), then again traced for the allocation peak
+    started = time.perf_counter()
+    detector = AnomalyDetector(seed=seed)
+    seconds = time.perf_counter() - started
+    tracemalloc.start()
+    AnomalyDetector(seed=seed)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    memory = {
+        'tables_bytes': {st: int(np.asarray(t.breakpoints).nbytes + np.asarray(t.scores).nbytes)
+                         for st, t in detector.tables.items()},
+        'forests_bytes': {st: len(pickle.dumps(model)) for st, model in detector.models.items()},
+        'training_peak_mb': round(peak / 1024 ** 2, 2),
+    }
+    return detector, {'seconds': round(seconds, 4)}, memory
+
+def benchmark_load(detector):
+    """
+    Publishes the tables to a throwaway registry and times loading them back the way
+    the server does (memory-mapped), plus the first call on the fresh detector.
     """
-    X_test = [] 
-    y_true = [] 
-    
-    print(f"🧪 Generating {n_samples} test samples...")
-
-    for _ in range(n_samples):
-        # 85% Normal Data (Gaussian Distribution matched to your training)
-        if random.random() > 0.15:
-            # Normal temp is around 25, with small variance
-            val = random.normalvariate(25, 2) 
-            X_test.append({'type': 'temperature', 'value': val})
-            y_true.append(0) # Label: Normal
-        else:
-            # 15% Anomalies (Extreme Values)
-            # We force values outside the trained "Normal" range
-            if random.random() > 0.5:
-                val = random.uniform(40, 60) # Heat wave
-            else:
-                val = random.uniform(-10, 5) # Frost / Cold
-            
-            X_test.append({'type': 'temperature', 'value': val})
-            y_true.append(1) # Label: Anomaly
-        
-    return X_test, y_true
-
-def run_evaluation():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+    django.setup()
+    from django.test.utils import override_settings
+    from ml_module import registry
+
+    with tempfile.TemporaryDirectory() as root, override_settings(ML_MODEL_DIR=root):
+        registry.publish(detector)
+        seconds = timed(registry.load)
+        loaded = registry.load()
+        sensor_type = next(iter(loaded.tables))
+        started = time.perf_counter()
+        loaded.check_anomaly(sensor_type, NORMAL_DISTRIBUTIONS.get(sensor_type, (0, 1))[0])
+        first_call = time.perf_counter() - started
+    return {'seconds': round(seconds, 6), 'first_call_us': round(first_call * 1e6, 1)}
+
+def benchmark_latency(detector, sensor_types, values, single_calls=2000):
+    """Per-call and batch latency/throughput for every sensor type, then mixed batches."""
+    rng = np.random.default_rng(0)
+    sensors = {}
+    for sensor_type in detector.tables:
+        sample = values[sensor_types == sensor_type]
+        if not sample.size:
+            sample = rng.normal(*NORMAL_DISTRIBUTIONS.get(sensor_type, (0, 1)), 1000)
+
+        # 2. One reading per call (the single-reading POST path)
+        calls = sample[np.arange(single_calls) % sample.size].tolist()
+        for value in calls[:100]:
+            detector.check_anomaly(sensor_type, value)  # Warm-up
+        durations = np.empty(len(calls))
+        for index, value in enumerate(calls):
+            started = time.perf_counter_ns()
+            detector.check_anomaly(sensor_type, value)
+            durations[index] = time.perf_counter_ns() - started
+        durations /= 1000
+
+        # 3. The whole sample in one vectorized call (the batch / stream paths)
+        batch = sample[np.arange(10_000) % sample.size]
+        batch_types = [sensor_type] * batch.size
+        seconds = timed(lambda: detector.check_anomaly_batch(batch_types, batch))
+
+        sensors[sensor_type] = {
+            'single_us_p50': round(float(np.percentile(durations, 50)), 2),
+            'single_us_p99': round(float(np.percentile(durations, 99)), 2),
+            'single_calls_per_s': round(1e6 / float(durations.mean()), 1),
+            'batch_readings_per_s': round(batch.size / seconds, 1),
+        }
+
+    # 4. Mixed-type batches of growing size (shuffled: the test set is grouped by sensor type)
+    batches = {}
+    order = rng.permutation(values.size)
+    for size in BATCH_SIZES:
+        index = order[np.arange(size) % values.size]
+        batch_types, batch_values = sensor_types[index].tolist(), values[index]
+        seconds = timed(lambda: detector.check_anomaly_batch(batch_types, batch_values))
+        batches[str(size)] = {'us_per_batch': round(seconds * 1e6, 2),
+                              'readings_per_s': round(size / seconds, 1)}
+    return sensors, batches
+
+def accuracy_report(y_true, y_pred):
+    cm = confusion_matrix(y_true, y_pred, labels=[0, 1])
+    return {
+        'precision': round(float(precision_score(y_true, y_pred, zero_division=0)), 4),
+        'recall': round(float(recall_score(y_true, y_pred, zero_division=0)), 4),
+        'f1': round(float(f1_score(y_true, y_pred, zero_division=0)), 4),
+        'accuracy': round(float(accuracy_score(y_true, y_pred)), 4),
+        'support': int(np.sum(y_true)),
+        'confusion': cm.tolist(),
+    }
+
+def lookup(report, path):
+    for key in path.split('.'):
+        if not isinstance(report, dict) or key not in report:
+            return None
+        report = report[key]
+    return report
+
+def compare(report, baseline, max_slowdown, max_drop):
+    """Regressions against a stored baseline report, as readable lines."""
+    regressions = []
+    for path, kind in regression_checks(report.get('sensors', {})):
+        new, old = lookup(report, path), lookup(baseline, path)
+        if new is None or old is None:
+            continue
+        if kind == 'time' and old > 0 and new > old * (1 + max_slowdown):
+            regressions.append(f"{path}: {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+        elif kind == 'rate' and old > 0 and new < old * (1 - max_slowdown):
+            regressions.append(f"{path}: {old} -> {new} (-{(1 - new / old) * 100:.0f}%)")
+        elif kind == 'score' and new < old - max_drop:
+            regressions.append(f"{path}: {old} -> {new}")
+    return regressions
+
+def run_evaluation(args):
     print("--------------------------------------------------")
     print("🚀 STARTING MODEL EVALUATION")
     print("--------------------------------------------------")
 
-    # 1. Initialize Model (This runs the training logic)
-    detector = AnomalyDetector()
-    
+    # 1. Train (timed) and load back from a registry (timed)
+    detector, training, memory = benchmark_training(args.seed)
+    load = benchmark_load(detector)
+
     # 2. Get Test Data
-    X_test, y_true = generate_test_dataset()
-    y_pred = [] 
+    plots = None
+    if args.dataset:
+        sensor_types, values, y_true, plots, timestamps = load_test_dataset(args.dataset, args.limit)
+    else:
+        sensor_types, values, y_true = generate_test_dataset(args.samples, args.seed)
 
-    # 3. Run Predictions
+    # 3. Run Predictions (one vectorized call over the whole test set)
     print("🔍 Running inference on test set...")
-    for reading in X_test:
-        # We call your actual logic function
-        # It returns: (is_anomaly, reason, score)
-        is_anomaly, reason, score = detector.check_anomaly(reading['type'], reading['value'])
-        
-        # Convert True -> 1, False -> 0
-        y_pred.append(1 if is_anomaly else 0)
-
-    # 4. Calculate Metrics
-    precision = precision_score(y_true, y_pred)
-    recall = recall_score(y_true, y_pred)
-    f1 = f1_score(y_true, y_pred)
-    acc = accuracy_score(y_true, y_pred)
-    cm = confusion_matrix(y_true, y_pred)
+    result = detector.check_anomaly_batch(sensor_types, values)
+    y_pred = result.is_anomaly.astype(int)
+
+    # 4. Calculate Metrics, overall and per sensor type
+    overall = accuracy_report(y_true, y_pred)
+    if plots is not None:
+        # Datasets know their plots: also score with the per-plot baselines and recent windows
+        deviation, window = plot_deviations(plots, sensor_types, values, timestamps)
+        with_baselines = detector.check_anomaly_batch(sensor_types, values, deviation=deviation)
+        overall['with_baselines'] = accuracy_report(y_true, with_baselines.is_anomaly.astype(int))
+        with_windows = detector.check_anomaly_batch(sensor_types, values, deviation=deviation,
+                                                    window_deviation=window)
+        overall['with_windows'] = accuracy_report(y_true, with_windows.is_anomaly.astype(int))
+    print("⏱️  Benchmarking inference...")
+    sensors, batches = benchmark_latency(detector, sensor_types, values)
+    for sensor_type in sensors:
+        mask = sensor_types == sensor_type
+        if mask.any():
+            sensors[sensor_type].update(accuracy_report(y_true[mask], y_pred[mask]))
+
+    report = {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'seed': args.seed,
+            'dataset': args.dataset or f'synthetic ({args.samples} per sensor type)',
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'sklearn': sklearn.__version__,
+            'machine': platform.machine(),
+        },
+        'training': training,
+        'load': load,
+        'memory': memory,
+        'sensors': sensors,
+        'batch': batches,
+        'overall': overall,
+    }
 
     # 5. Print Final Report
+    cm = overall['confusion']
     print("\n" + "="*40)
     print("📊  FINAL EVALUATION REPORT")
     print("="*40)
     print(f"Model: Hybrid (Isolation Forest + Threshold)")
     print("-" * 40)
-    print(f"✅ Accuracy:   {acc*100:.2f}%")
-    print(f"🎯 Precision:  {precision:.2f}  (Trustworthiness)")
-    print(f"🔎 Recall:     {recall:.2f}     (Sensitivity)")
-    print(f"⚖️  F1-Score:   {f1:.2f}      (Overall Score)")
+    print(f"✅ Accuracy:   {overall['accuracy']*100:.2f}%")
+    print(f"🎯 Precision:  {overall['precision']:.2f}  (Trustworthiness)")
+    print(f"🔎 Recall:     {overall['recall']:.2f}     (Sensitivity)")
+    print(f"⚖️  F1-Score:   {overall['f1']:.2f}      (Overall Score)")
     print("-" * 40)
     print("Confusion Matrix:")
     print(f" [ {cm[0][0]} (TN)   {cm[0][1]} (FP) ]")
     print(f" [ {cm[1][0]} (FN)   {cm[1][1]} (TP) ]")
+    if 'with_baselines' in overall:
+        print(f"📍 With plot baselines: Precision {overall['with_baselines']['precision']:.2f}, "
+              f"Recall {overall['with_baselines']['recall']:.2f}")
+        print(f"📈 + recent windows:    Precision {overall['with_windows']['precision']:.2f}, "
+              f"Recall {overall['with_windows']['recall']:.2f}")
+    print("-" * 40)
+    for sensor_type, row in sensors.items():
+        print(f"{sensor_type:<12} P {row.get('precision', 0):.2f}  R {row.get('recall', 0):.2f}  "
+              f"call p50 {row['single_us_p50']:.1f}µs  batch {row['batch_readings_per_s']:,.0f}/s")
+    print(f"🧠 Training {training['seconds']:.2f}s (peak {memory['training_peak_mb']} MB), "
+          f"load {load['seconds'] * 1000:.2f}ms, tables {sum(memory['tables_bytes'].values()) / 1024:.1f} KiB")
     print("="*40 + "\n")
 
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"📄 Results written to {args.output}")
+
+    # 6. Compare against the stored baseline
+    if not args.baseline:
+        return 0
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"📌 Baseline saved to {args.baseline}")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.max_slowdown, args.max_drop)
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) against {args.baseline}:")
+        for line in regressions:
+            print(f"   {line}")
+        return 1
+    print(f"✅ No regressions against {args.baseline}")
+    return 0
+
 if __name__ == "__main__":
-    run_evaluation()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Detector accuracy and performance benchmark.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--samples", type=int, default=2000, help="Synthetic samples per sensor type")
+    parser.add_argument("--dataset", help="Use a dataset from `simulator.py generate` instead")
+    parser.add_argument("--limit", type=int, default=300_000, help="Rows used from --dataset")
+    parser.add_argument("--output", default="evaluation.json")
+    parser.add_argument("--baseline", help="Baseline report to compare against (created if missing)")
+    parser.add_argument("--update-baseline", action="store_true", help="Overwrite the baseline with this run")
+    parser.add_argument("--max-slowdown", type=float, default=0.3,
+                        help="Allowed relative slowdown for timings/throughput (0.3 = 30%%)")
+    parser.add_argument("--max-drop", type=float, default=0.02,
+                        help="Allowed absolute drop in precision/recall/F1")
+    sys.exit(run_evaluation(parser.parse_args()))
@@ -0,0 +1,209 @@
+"""
+Per-(plot, sensor_type) online baselines.
+
+Each baseline is one row of a few parallel NumPy arrays, updated in O(1) per reading:
+    count, mean, variance   Welford while warming up, then an EWMA (alpha = BASELINE_ALPHA),
+                            so the baseline follows seasons and crop changes
+    q25, q50, q75           streaming quantile estimates (stochastic approximation):
+                            the robust centre and spread a reading is scored against
+
+No per-plot model is fitted and no per-plot object is kept: tens of thousands of plots
+cost a few MB. State is loaded from PlotBaseline on first sight of a plot and written back
+every BASELINE_FLUSH_SECONDS, once a response is out (api/signals.flush_baselines), never
+inside an ingest transaction. Each worker process keeps its own copy; the database holds
+the last flush (baselines are estimates, last writer wins).
+"""
+
+import threading
+import time
+
+import numpy as np
+
+SENSOR_CODES = {'temperature': 0, 'humidity': 1, 'moisture': 2}
+SENSOR_NAMES = {code: name for name, code in SENSOR_CODES.items()}
+QUARTILES = np.array([0.25, 0.5, 0.75])
+
+# Smallest spread used for scoring, per sensor code (°C / %): a very steady plot must not
+# turn sensor noise into huge deviations
+MIN_SCALE = np.array([0.5, 1.0, 1.0])
+
+FIELDS = ('count', 'mean', 'variance', 'q25', 'q50', 'q75')
+
+
+class BaselineStore:
+    """Array-backed baselines, keyed by (plot_id, sensor code)."""
+
+    def __init__(self, alpha=0.01, warmup=30, quantile_rate=0.05, clip_sigmas=4.0, loader=None):
+        self.alpha = alpha
+        self.warmup = warmup
+        self.quantile_rate = quantile_rate
+        self.clip_sigmas = clip_sigmas
+        self.loader = loader  # keys -> {key: (count, mean, variance, q25, q50, q75)}
+
+        self.slots = {}
+        self.keys = []
+        self.size = 0
+        self.count = np.zeros(0, dtype=np.int64)
+        self.codes = np.zeros(0, dtype=np.int64)
+        self.state = np.zeros((0, 5))  # mean, variance, q25, q50, q75
+        self.dirty = set()
+        self.lock = threading.Lock()
+
+    # --- storage ---
+
+    def _grow(self, needed):
+        capacity = len(self.count)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        self.count = np.resize(self.count, capacity)
+        self.codes = np.resize(self.codes, capacity)
+        self.state = np.resize(self.state, (capacity, 5))
+
+    def slots_for(self, plot_ids, sensor_types):
+        """Slot index per reading (-1 for unknown sensor types); new keys are loaded or created."""
+        keys = [(plot_id, SENSOR_CODES.get(sensor_type)) for plot_id, sensor_type in zip(plot_ids, sensor_types)]
+        missing = {key for key in keys if key[1] is not None and key not in self.slots}
+        if missing:
+            stored = self.loader(missing) if self.loader else {}
+            self._grow(self.size + len(missing))
+            for key in sorted(missing):
+                slot = self.size
+                self.size += 1
+                self.slots[key] = slot
+                self.keys.append(key)
+                self.codes[slot] = key[1]
+                row = stored.get(key)
+                self.count[slot] = row[0] if row else 0
+                self.state[slot] = row[1:] if row else 0.0
+        return np.array([self.slots.get(key, -1) for key in keys], dtype=np.int64)
+
+    def export(self, slots):
+        """{(plot_id, sensor code): (count, mean, variance, q25, q50, q75)} for the given slots."""
+        return {self.keys[slot]: (int(self.count[slot]), *map(float, self.state[slot])) for slot in slots}
+
+    # --- statistics ---
+
+    def _score(self, slots, values):
+        """Robust z: distance from the median in units of IQR / 1.349 (= sigma for normal data)."""
+        q25, q50, q75 = self.state[slots, 2], self.state[slots, 3], self.state[slots, 4]
+        scale = np.maximum((q75 - q25) / 1.349, MIN_SCALE[self.codes[slots]])
+        z = (values - q50) / scale
+        return np.where(self.count[slots] >= self.warmup, z, np.nan)
+
+    def _update(self, slots, values):
+        """One reading per slot (no repeats): Welford / EWMA moments, then the quantile steps."""
+        count = self.count[slots] + 1
+        mean, variance = self.state[slots, 0], self.state[slots, 1]
+        first = count == 1
+
+        # Winsorize once warm, so a burst of outliers can't drag the baseline along
+        sigma = np.maximum(np.sqrt(variance), MIN_SCALE[self.codes[slots]])
+        warm = count > self.warmup
+        limit = self.clip_sigmas * sigma
+        values = np.where(warm, np.clip(values, mean - limit, mean + limit), values)
+
+        # alpha = 1/n is exactly Welford's update; max(alpha, 1/n) switches to an EWMA after 1/alpha readings
+        rate = np.maximum(self.alpha, 1.0 / count)
+        delta = values - mean
+        mean = mean + rate * delta
+        variance = (1 - rate) * (variance + rate * delta * delta)
+
+        # Quantiles: q += step * (tau - [x < q]), step proportional to the spread
+        quantiles = np.where(first[:, None], values[:, None], self.state[slots, 2:5])
+        step = self.quantile_rate * np.maximum(np.sqrt(variance), 1e-3)
+        below = values[:, None] < quantiles
+        quantiles = quantiles + step[:, None] * (QUARTILES[None, :] - below)
+        quantiles.sort(axis=1)  # Keep q25 <= q50 <= q75
+
+        self.count[slots] = count
+        self.state[slots, 0] = mean
+        self.state[slots, 1] = variance
+        self.state[slots, 2:5] = quantiles
+        self.dirty.update(slots.tolist())
+
+    def observe(self, plot_ids, sensor_types, values):
+        """
+        Scores each reading against its baseline as it was before that reading, then folds it in.
+        Returns robust z-scores (NaN while a baseline is still warming up or the type is unknown).
+        """
+        values = np.asarray(values, dtype=float)
+        z = np.full(len(values), np.nan)
+        with self.lock:
+            slots = self.slots_for(plot_ids, sensor_types)
+            known = np.flatnonzero((slots >= 0) & np.isfinite(values))
+            if not known.size:
+                return z
+
+            # Repeated slots in one batch are applied in rounds, in arrival order
+            order = known[np.argsort(slots[known], kind='stable')]
+            ordered = slots[order]
+            starts = np.r_[True, ordered[1:] != ordered[:-1]]
+            rank = np.arange(len(order)) - np.maximum.accumulate(np.where(starts, np.arange(len(order)), 0))
+            for round_ in range(rank.max() + 1):
+                members = order[rank == round_]
+                z[members] = self._score(slots[members], values[members])
+                self._update(slots[members], values[members])
+        return z
+
+    def take_dirty(self):
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+            return self.export(sorted(dirty))
+
+
+# --- Django glue: persistence in PlotBaseline ---
+
+_store = None
+_store_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def load_rows(keys):
+    from .models import PlotBaseline
+    plot_ids = {plot_id for plot_id, _ in keys}
+    rows = PlotBaseline.objects.filter(plot_id__in=plot_ids).values_list('plot_id', 'sensor_type', *FIELDS)
+    return {(plot_id, SENSOR_CODES.get(sensor_type)): tuple(values) for plot_id, sensor_type, *values in rows}
+
+
+def get_store():
+    """The process-wide store (created on first use)."""
+    global _store
+    if _store is None:
+        from django.conf import settings
+        with _store_lock:
+            if _store is None:
+                _store = BaselineStore(alpha=settings.BASELINE_ALPHA, warmup=settings.BASELINE_WARMUP,
+                                       loader=load_rows)
+    return _store
+
+
+def flush(store=None):
+    """Upserts every baseline changed since the last flush. Returns the number of rows written."""
+    global _last_flush
+    from api.models import FieldPlot
+    from .models import PlotBaseline
+
+    store = store or get_store()
+    _last_flush = time.monotonic()
+    rows = store.take_dirty()
+    if not rows:
+        return 0
+    # Plots deleted since they were loaded have nothing to keep
+    existing = set(FieldPlot.objects.filter(id__in={plot_id for plot_id, _ in rows}).values_list('id', flat=True))
+    baselines = [
+        PlotBaseline(plot_id=plot_id, sensor_type=SENSOR_NAMES[code], **dict(zip(FIELDS, values)))
+        for (plot_id, code), values in rows.items() if plot_id in existing
+    ]
+    PlotBaseline.objects.bulk_create(
+        baselines, update_conflicts=True, unique_fields=['plot', 'sensor_type'],
+        update_fields=[*FIELDS, 'updated_at'],
+    )
+    return len(baselines)
+
+
+def maybe_flush():
+    """Flushes when BASELINE_FLUSH_SECONDS have passed since the last flush."""
+    from django.conf import settings
+    if time.monotonic() - _last_flush >= settings.BASELINE_FLUSH_SECONDS:
+        flush()
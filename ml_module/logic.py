@@ -1,98 +1,212 @@
 import numpy as np
+from collections import namedtuple
 from sklearn.ensemble import IsolationForest
 
+from .score_table import ScoreTable
+
+# Reason codes used by the batch API (index into REASON_LABELS)
+REASON_NORMAL = 0
+REASON_UNKNOWN = 1
+REASON_HEAT_STRESS = 2
+REASON_FROST = 3
+REASON_DROUGHT = 4
+REASON_WATERLOGGING = 5
+REASON_DRY_AIR = 6
+REASON_HIGH_HUMIDITY = 7
+REASON_ABNORMAL_TEMPERATURE = 8
+REASON_ABNORMAL_HUMIDITY = 9
+REASON_ABNORMAL_MOISTURE = 10
+REASON_UNUSUAL_FOR_PLOT = 11
+REASON_SUDDEN_CHANGE = 12
+
+REASON_LABELS = np.array([
+    "Normal",
+    "Unknown",
+    "Heat Stress",
+    "Frost Danger",
+    "Drought / Pump Failure",
+    "Waterlogging",
+    "Extremely Dry Air",
+    "High Humidity",
+    "Abnormal temperature pattern",
+    "Abnormal humidity pattern",
+    "Abnormal moisture pattern",
+    "Unusual for this plot",
+    "Sudden change",
+], dtype=object)
+
+# --- LAYER 2: SAFETY THRESHOLDS ---
+# sensor_type -> (lower limit, reason below it, upper limit, reason above it, reason when only the AI fires)
+SAFETY_THRESHOLDS = {
+    'temperature': (5, REASON_FROST, 35, REASON_HEAT_STRESS, REASON_ABNORMAL_TEMPERATURE),
+    'moisture': (30, REASON_DROUGHT, 90, REASON_WATERLOGGING, REASON_ABNORMAL_MOISTURE),
+    'humidity': (20, REASON_DRY_AIR, 90, REASON_HIGH_HUMIDITY, REASON_ABNORMAL_HUMIDITY),
+}
+
+
+# --- LAYER 3: PLOT BASELINES (ml_module/baselines.py) ---
+# Robust z-score against the plot's own history. Once a plot has a baseline, the forest's
+# global "normal" only counts if the reading is also this unusual for the plot...
+BASELINE_CONFIRM_Z = 3.0
+# ...and a reading this far from the plot's normal is an anomaly on its own
+BASELINE_ALERT_Z = 6.0
+
+# --- LAYER 4: RECENT WINDOW (ml_module/ringbuffer.py) ---
+# Robust z-score against the plot's last few readings of the same sensor: a jump far outside
+# what the sensor did in the last hours is reported even when the value itself looks ordinary
+WINDOW_ALERT_Z = 12.0
+
+
+class AnomalyBatchResult(namedtuple('AnomalyBatchResult', ['is_anomaly', 'reason_code', 'confidence'])):
+    """
+    Array-backed output of check_anomaly_batch (one entry per input reading).
+    """
+    __slots__ = ()
+
+    @property
+    def reasons(self):
+        """Reason labels as an object array, e.g. "Heat Stress"."""
+        return REASON_LABELS[self.reason_code]
+
 class AnomalyDetector:
     """
     Advanced Isolation Forest Model with Tuned Confidence.
     """
-    def __init__(self):
+    def __init__(self, tables=None, seed=42, samples=None):
+        # Published artifacts (see ml_module/registry.py) only carry the compiled tables
+        self.version = None
+        self.metadata = {}
+        if tables is not None:
+            self.models = {}
+            self.tables = tables
+            return
+
         # contamination=0.1 means we expect ~10% anomalies
         self.models = {
             'temperature': IsolationForest(contamination=0.1, random_state=42),
             'humidity': IsolationForest(contamination=0.1, random_state=42),
             'moisture': IsolationForest(contamination=0.1, random_state=42)
         }
-        self._train_models()
+        self._train_models(seed, samples)
+        self._compile_tables()
 
-    def _train_models(self):
+    def _train_models(self, seed=42, samples=None):
         """
         Pre-trains with TIGHTER 'Normal' data ranges.
         This makes the model more confident that deviations are anomalies.
+        `samples`: optional {sensor_type: values} of real normal readings, used instead of
+        the synthetic data for those sensor types (see ml_module/retraining.py).
         """
         print("🧠 Training Stricter Isolation Forest Models...")
-        
+
+        # Seeded so every process (and every retrain with the same seed) gets identical models
+        rng = np.random.default_rng(seed)
+
         # 1. Normal Temperature (Stricter: mostly 20-30°C)
         # scale=2 means standard deviation is 2. 
-        X_temp = np.random.normal(loc=25, scale=2, size=(1000, 1)) 
-        self.models['temperature'].fit(X_temp)
+        X_temp = rng.normal(loc=25, scale=2, size=(1000, 1))
 
         # 2. Normal Humidity (Stricter: mostly 50-70%)
-        X_hum = np.random.normal(loc=60, scale=5, size=(1000, 1))
-        self.models['humidity'].fit(X_hum)
+        X_hum = rng.normal(loc=60, scale=5, size=(1000, 1))
 
         # 3. Normal Moisture (Stricter: mostly 45-65%)
-        X_moist = np.random.normal(loc=55, scale=5, size=(1000, 1))
-        self.models['moisture'].fit(X_moist)
+        X_moist = rng.normal(loc=55, scale=5, size=(1000, 1))
+
+        training = {'temperature': X_temp, 'humidity': X_hum, 'moisture': X_moist}
+        for sensor_type, values in (samples or {}).items():
+            training[sensor_type] = np.asarray(values, dtype=float).reshape(-1, 1)
+        for sensor_type, X in training.items():
+            self.models[sensor_type].fit(X)
         
         print("✅ Models Trained.")
 
+    def _compile_tables(self):
+        """
+        Compiles every fitted forest into a breakpoint/score lookup table.
+        Inference then uses np.searchsorted instead of walking 100 trees.
+        """
+        self.tables = {
+            sensor_type: ScoreTable.from_forest(model)
+            for sensor_type, model in self.models.items()
+        }
+
     def check_anomaly(self, sensor_type, value):
         """
         Returns: (is_anomaly, reason, confidence_score)
         """
-        model = self.models.get(sensor_type)
-        if not model: return False, "Unknown", 0.0
+        result = self.check_anomaly_batch([sensor_type], [value])
+        return bool(result.is_anomaly[0]), result.reasons[0], float(result.confidence[0])
+
+    def check_anomaly_batch(self, sensor_types, values, deviation=None, window_deviation=None):
+        """
+        Vectorized check_anomaly over parallel arrays of sensor types and values.
+        Scores are computed once per sensor type group.
+        `deviation`: optional per-reading robust z-scores against the plot baseline (NaN = no baseline yet).
+        `window_deviation`: optional robust z-scores against the plot's recent readings (NaN = too few).
+        Returns: AnomalyBatchResult(is_anomaly, reason_code, confidence) arrays
+        """
+        sensor_types = np.asarray(sensor_types, dtype=object)
+        values = np.asarray(values, dtype=float)
+        if deviation is not None:
+            deviation = np.abs(np.asarray(deviation, dtype=float))
+        if window_deviation is not None:
+            window_deviation = np.abs(np.asarray(window_deviation, dtype=float))
+
+        is_anomaly = np.zeros(len(values), dtype=bool)
+        reason_code = np.full(len(values), REASON_UNKNOWN, dtype=np.int8)
+        confidence = np.zeros(len(values), dtype=float)
+
+        for sensor_type, table in self.tables.items():
+            idx = np.flatnonzero(sensor_types == sensor_type)
+            if not idx.size: continue
+            group = values[idx]
+
+            # --- LAYER 1: ISOLATION FOREST ---
+            # predict() is just decision_function < 0, so one table lookup gives both
+            score = table.decision_function(group)
+            ai_anomaly = score < 0
+
+            # TUNED CONFIDENCE FORMULA
+            # We multiply the raw score by 3 to boost the confidence.
+            # If score is -0.1 (weak anomaly) -> 0.5 + 0.3 = 0.80
+            # If score is -0.2 (strong anomaly) -> 0.5 + 0.6 = 1.0 -> capped at 0.99
+            ai_confidence = np.minimum(0.99, 0.5 + (np.abs(score) * 3))
+
+            # --- LAYER 2: SAFETY THRESHOLDS ---
+            lower, lower_reason, upper, upper_reason, ai_reason = SAFETY_THRESHOLDS[sensor_type]
+            above = group > upper
+            below = ~above & (group < lower)
+            force_anomaly = above | below
+
+            # --- LAYER 3: PLOT BASELINE ---
+            unusual = np.zeros(len(group), dtype=bool)
+            if deviation is not None:
+                z = deviation[idx]
+                known = ~np.isnan(z)
+                ai_anomaly = ai_anomaly & (~known | (z >= BASELINE_CONFIRM_Z))
+                unusual = known & (z >= BASELINE_ALERT_Z) & ~ai_anomaly
+                ai_confidence = np.where(unusual, np.minimum(0.99, 0.6 + 0.05 * np.nan_to_num(z)), ai_confidence)
+
+            # --- LAYER 4: RECENT WINDOW ---
+            sudden = np.zeros(len(group), dtype=bool)
+            if window_deviation is not None:
+                z = np.nan_to_num(window_deviation[idx])
+                sudden = (z >= WINDOW_ALERT_Z) & ~(ai_anomaly | force_anomaly | unusual)
+                ai_confidence = np.where(sudden, np.minimum(0.99, 0.6 + 0.03 * z), ai_confidence)
+
+            # --- FINAL DECISION ---
+            anomaly = ai_anomaly | force_anomaly | unusual | sudden
 
-        # --- LAYER 1: ISOLATION FOREST ---
-        data_point = np.array([[value]])
-        prediction = model.predict(data_point)[0] # -1 is Anomaly
-        score = model.decision_function(data_point)[0]
-        
-        # TUNED CONFIDENCE FORMULA
-        # We multiply the raw score by 3 to boost the confidence.
-        # If score is -0.1 (weak anomaly) -> 0.5 + 0.3 = 0.80
-        # If score is -0.2 (strong anomaly) -> 0.5 + 0.6 = 1.0 -> capped at 0.99
-        ai_confidence = min(0.99, 0.5 + (abs(score) * 3))
-        
-        # --- LAYER 2: SAFETY THRESHOLDS ---
-        force_anomaly = False
-        reason = "Normal"
-
-        if sensor_type == 'temperature':
-            if value > 35: 
-                force_anomaly = True
-                reason = "Heat Stress"
-            elif value < 5:
-                force_anomaly = True
-                reason = "Frost Danger"
-        
-        elif sensor_type == 'moisture':
-            if value < 30:
-                force_anomaly = True
-                reason = "Drought / Pump Failure"
-            elif value > 90:
-                force_anomaly = True
-                reason = "Waterlogging"
-
-        elif sensor_type == 'humidity':
-            if value < 20:
-                force_anomaly = True
-                reason = "Extremely Dry Air"
-            elif value > 90:
-                force_anomaly = True
-                reason = "High Humidity"
-
-        # --- FINAL DECISION ---
-        if prediction == -1 or force_anomaly:
-            
             # If the threshold forced it, ensure high confidence
-            if force_anomaly and ai_confidence < 0.8:
-                ai_confidence = 0.95
-            
-            # If AI caught it but threshold didn't (rare but possible)
-            if prediction == -1 and not force_anomaly:
-                reason = f"Abnormal {sensor_type} pattern"
+            ai_confidence = np.where(force_anomaly & (ai_confidence < 0.8), 0.95, ai_confidence)
+
+            # If AI caught it but threshold didn't (rare but possible) -> "Abnormal <type> pattern"
+            reasons = np.where(above, upper_reason, np.where(below, lower_reason,
+                               np.where(unusual, REASON_UNUSUAL_FOR_PLOT,
+                               np.where(sudden, REASON_SUDDEN_CHANGE, ai_reason))))
 
-            return True, reason, float(f"{ai_confidence:.2f}")
+            is_anomaly[idx] = anomaly
+            reason_code[idx] = np.where(anomaly, reasons, REASON_NORMAL)
+            confidence[idx] = np.where(anomaly, np.round(ai_confidence, 2), 0.0)
 
-        return False, "Normal", 0.0
\ No newline at end of file
+        return AnomalyBatchResult(is_anomaly, reason_code, confidence)
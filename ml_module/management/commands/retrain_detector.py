@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_module import registry
+from ml_module.retraining import retrain
+
+
+class Command(BaseCommand):
+    help = ("Retrains the anomaly detector on recent normal readings and publishes it when it passes "
+            "validation on the latest days. Running servers switch to it without a restart.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=14, help="How far back to sample readings.")
+        parser.add_argument('--samples', type=int, default=20000, help="Readings sampled per sensor type.")
+        parser.add_argument('--min-samples', type=int, default=1000,
+                            help="Below this, a sensor type keeps the synthetic training data.")
+        parser.add_argument('--validate-days', type=int, default=2,
+                            help="The most recent days, kept out of training and validated on.")
+        parser.add_argument('--max-flag-rate', type=float, default=0.15,
+                            help="Reject the model if it flags more than this share of normal readings there.")
+        parser.add_argument('--max-recall-drop', type=float, default=0.1,
+                            help="Reject the model if it catches this much less of the forest's anomalies "
+                                 "there than the active detector.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--no-activate', action='store_true',
+                            help="Publish the version without pointing CURRENT at it.")
+        parser.add_argument('--every', type=float, default=None,
+                            help="Keep running and retrain every N hours (otherwise run once).")
+
+    def handle(self, *args, **options):
+        if not 0 < options['validate_days'] < options['days']:
+            raise CommandError("--validate-days must be at least 1 and less than --days")
+        while True:
+            self.run_once(options)
+            if options['every'] is None:
+                return
+            time.sleep(options['every'] * 3600)
+
+    def run_once(self, options):
+        started = time.perf_counter()
+        version, report = retrain(
+            days=options['days'], size=options['samples'], min_samples=options['min_samples'],
+            validate_days=options['validate_days'], max_flag_rate=options['max_flag_rate'],
+            max_recall_drop=options['max_recall_drop'], seed=options['seed'], activate=not options['no_activate'],
+        )
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"📥 {report['rows_read']} readings read, sampled {report['samples']}")
+        for sensor_type, rate in report.get('validation_flag_rate', {}).items():
+            current = report.get('current_flag_rate', {}).get(sensor_type)
+            against = f" (active detector: {current:.1%})" if current is not None else ""
+            self.stdout.write(f"   {sensor_type:<12} normal readings flagged {rate:.1%}{against}")
+        for sensor_type, rate in report.get('anomaly_catch_rate', {}).items():
+            current = report.get('current_anomaly_catch_rate', {}).get(sensor_type)
+            against = f" (active detector: {current:.1%})" if current is not None else ""
+            self.stdout.write(f"   {sensor_type:<12} recent anomalies caught {rate:.1%}{against}")
+
+        if version is None:
+            self.stdout.write(self.style.WARNING(f"⚠️  Not published: {report['rejected']}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Published detector {version} to {registry.model_dir()} ({elapsed:.2f}s)"
+            ))
@@ -0,0 +1,38 @@
+import time
+
+import sklearn
+from django.core.management.base import BaseCommand
+
+from ml_module import registry
+from ml_module.logic import AnomalyDetector
+
+
+class Command(BaseCommand):
+    help = "Trains the anomaly detector and publishes it as a new version in the model registry."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42, help="Seed for the synthetic training data.")
+        parser.add_argument('--if-missing', action='store_true',
+                            help="Do nothing if a version is already active (used at container start).")
+        parser.add_argument('--no-activate', action='store_true',
+                            help="Publish the version without pointing CURRENT at it.")
+
+    def handle(self, *args, **options):
+        if options['if_missing'] and registry.current_version():
+            self.stdout.write(f"Detector {registry.current_version()} already published, skipping.")
+            return
+
+        started = time.perf_counter()
+        detector = AnomalyDetector(seed=options['seed'])
+        elapsed = time.perf_counter() - started
+
+        version = registry.publish(detector, metadata={
+            'source': 'synthetic',
+            'seed': options['seed'],
+            'training_seconds': round(elapsed, 3),
+            'sklearn_version': sklearn.__version__,
+        }, activate=not options['no_activate'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Published detector {version} to {registry.model_dir()} ({elapsed:.2f}s)"
+        ))
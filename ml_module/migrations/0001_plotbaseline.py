@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('api', '0007_readingimport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlotBaseline',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sensor_type', models.CharField(max_length=20)),
+                ('count', models.BigIntegerField()),
+                ('mean', models.FloatField()),
+                ('variance', models.FloatField()),
+                ('q25', models.FloatField()),
+                ('q50', models.FloatField()),
+                ('q75', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('plot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='baselines', to='api.fieldplot')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('plot', 'sensor_type'), name='unique_plot_baseline')],
+            },
+        ),
+    ]
@@ -1,3 +1,22 @@
 from django.db import models
 
-# Create your models here.
+
+class PlotBaseline(models.Model):
+    """
+    Persisted state of one online baseline (ml_module/baselines.py).
+    Written in bulk every BASELINE_FLUSH_SECONDS, read when a worker first sees the plot.
+    """
+    plot = models.ForeignKey('api.FieldPlot', on_delete=models.CASCADE, related_name='baselines')
+    sensor_type = models.CharField(max_length=20)
+    count = models.BigIntegerField()
+    mean = models.FloatField()
+    variance = models.FloatField()
+    q25 = models.FloatField()
+    q50 = models.FloatField()
+    q75 = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['plot', 'sensor_type'], name='unique_plot_baseline'),
+        ]
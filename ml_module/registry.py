@@ -0,0 +1,160 @@
+"""
+On-disk registry of published detectors.
+
+Layout under settings.ML_MODEL_DIR:
+    CURRENT                      <- name of the active version
+    v0001/meta.json
+    v0001/<sensor_type>.breakpoints.npy
+    v0001/<sensor_type>.scores.npy
+
+Versions are immutable once published. Arrays are loaded with mmap_mode='r',
+so every worker process on a host shares the same page-cache pages.
+"""
+
+import errno
+import json
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .logic import AnomalyDetector
+from .score_table import ScoreTable
+
+CURRENT_FILE = 'CURRENT'
+VERSION_PATTERN = re.compile(r'^v(\d+)$')
+
+
+def model_dir():
+    return Path(settings.ML_MODEL_DIR)
+
+
+def list_versions():
+    root = model_dir()
+    if not root.is_dir():
+        return []
+    versions = [p.name for p in root.iterdir() if p.is_dir() and VERSION_PATTERN.match(p.name)]
+    return sorted(versions, key=lambda name: int(VERSION_PATTERN.match(name).group(1)))
+
+
+def current_version():
+    """Returns the active version name, or None when nothing was published yet."""
+    try:
+        return (model_dir() / CURRENT_FILE).read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _write_atomic(path, text):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def publish(detector, metadata=None, activate=True):
+    """
+    Writes the detector's compiled tables as a new immutable version.
+    The version directory is staged and renamed into place, then CURRENT is swapped atomically.
+    Returns the new version name.
+    """
+    root = model_dir()
+    root.mkdir(parents=True, exist_ok=True)
+
+    # 1. Stage everything in a hidden directory (removed again if publishing fails)
+    staging = Path(tempfile.mkdtemp(dir=root, prefix='.staging-'))
+    try:
+        for sensor_type, table in detector.tables.items():
+            np.save(staging / f'{sensor_type}.breakpoints.npy', np.asarray(table.breakpoints))
+            np.save(staging / f'{sensor_type}.scores.npy', np.asarray(table.scores))
+
+        meta = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'sensor_types': sorted(detector.tables),
+            'breakpoints': {st: int(t.breakpoints.size) for st, t in detector.tables.items()},
+            **(metadata or {}),
+        }
+
+        # 2. Claim the next version number (retry only if another publisher got there first)
+        while True:
+            versions = list_versions()
+            last = int(VERSION_PATTERN.match(versions[-1]).group(1)) if versions else 0
+            version = f'v{last + 1:04d}'
+            meta['version'] = version
+            (staging / 'meta.json').write_text(json.dumps(meta, indent=2))
+            try:
+                os.rename(staging, root / version)
+                break
+            except OSError as e:
+                # Renaming onto an existing version directory: EEXIST or ENOTEMPTY depending on the OS
+                if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                    raise
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    # 3. Point CURRENT at it
+    if activate:
+        _write_atomic(root / CURRENT_FILE, version + '\n')
+    return version
+
+
+def load(version=None):
+    """
+    Loads a published detector (CURRENT by default) with memory-mapped tables.
+    Raises FileNotFoundError if the version doesn't exist.
+    """
+    version = version or current_version()
+    if version is None:
+        raise FileNotFoundError(f"No detector published in {model_dir()}")
+
+    path = model_dir() / version
+    meta = json.loads((path / 'meta.json').read_text())
+    tables = {
+        sensor_type: ScoreTable(
+            np.load(path / f'{sensor_type}.breakpoints.npy', mmap_mode='r'),
+            np.load(path / f'{sensor_type}.scores.npy', mmap_mode='r'),
+        )
+        for sensor_type in meta['sensor_types']
+    }
+
+    detector = AnomalyDetector(tables=tables)
+    detector.version = version
+    detector.metadata = meta
+    return detector
+
+
+def load_or_train():
+    """
+    Used at server start: the published detector if there is one, otherwise an in-process
+    (seeded) training run so a fresh checkout still works.
+    """
+    try:
+        detector = load()
+        print(f"🧠 Loaded detector {detector.version} from {model_dir()}")
+        return detector
+    except FileNotFoundError:
+        print("⚠️ No published detector found (run `manage.py train_detector`). Training in-process...")
+        return AnomalyDetector()
+
+
+def refresh(detector):
+    """
+    Hot swap: the detector CURRENT points at, or `detector` itself when it is already
+    that version (or the new one can't be loaded: the running detector is kept).
+    """
+    version = current_version()
+    if version is None or version == detector.version:
+        return detector
+    try:
+        fresh = load(version)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Could not load detector {version}, keeping {detector.version}: {e}")
+        return detector
+    print(f"🔄 Detector {detector.version} -> {version}")
+    return fresh
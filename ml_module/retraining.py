@@ -0,0 +1,203 @@
+"""
+Retraining the detector on stored readings (`manage.py retrain_detector`).
+
+1. Sample: recent readings that raised no anomaly are streamed from the DB (server-side
+   cursor) into a fixed-size reservoir per sensor type, so memory doesn't grow with the table.
+   Repeats coalesced into an incident (api/incidents.py) have no anomaly row of their own,
+   so readings inside an incident's window are left out too.
+2. Fit: the forests are trained in a separate, low-priority process; the caller only waits.
+3. Validate: on the most recent `validate_days`, which training never sees, next to the
+   active detector. A model that flags far more than its contamination rate of normal
+   readings, or misses anomalies the forest caught there that the active one still
+   catches, is not published.
+4. Publish: a new registry version; CURRENT is the signal. Running workers pick it up on
+   their next check (api/ingest.get_detector) and swap the reference, no restart.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+
+from .logic import AnomalyDetector, SAFETY_THRESHOLDS
+
+SENSOR_TYPES = tuple(SAFETY_THRESHOLDS)
+
+
+class Reservoir:
+    """Uniform sample of at most `size` values from a stream of unknown length (algorithm R)."""
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self.values = np.empty(size)
+        self.seen = 0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        index = self.seen + np.arange(len(values))  # Position of each value in the stream
+        fill = index < self.size
+        self.values[index[fill]] = values[fill]
+        # Value i replaces a random slot with probability size / (i + 1);
+        # on repeated slots the later value wins, as in the one-at-a-time algorithm
+        slots = self.rng.integers(0, index + 1)
+        replace = ~fill & (slots < self.size)
+        self.values[slots[replace]] = values[replace]
+        self.seen += len(values)
+
+    def sample(self):
+        return self.values[:min(self.seen, self.size)].copy()
+
+
+def incident_windows():
+    """
+    Incidents covering an outer SensorReading: same plot and sensor, from the incident's
+    first reading to its last repeat.
+    """
+    from django.db.models import OuterRef
+    from api.models import AnomalyEvent
+
+    return AnomalyEvent.objects.filter(
+        plot_id=OuterRef('plot_id'), sensor_type=OuterRef('sensor_type'),
+        reading__timestamp__lte=OuterRef('timestamp'), last_seen__gte=OuterRef('timestamp'),
+    )
+
+
+def sample_readings(days, size, seed=42, chunk_size=10000, skip_days=0):
+    """
+    {sensor_type: values} sampled uniformly from the last `days` of readings that raised
+    no anomaly and fall in no incident, plus the number of rows read.
+    `skip_days`: the most recent days are left out (kept for validation).
+    """
+    from django.db.models import Exists
+    from django.utils import timezone
+    from api.models import SensorReading
+
+    rng = np.random.default_rng(seed)
+    reservoirs = {sensor_type: Reservoir(size, rng) for sensor_type in SENSOR_TYPES}
+    now = timezone.now()
+    rows = SensorReading.objects.filter(timestamp__gte=now - timedelta(days=days), anomalies__isnull=True)
+    if skip_days:
+        rows = rows.filter(timestamp__lt=now - timedelta(days=skip_days))
+    rows = rows.exclude(Exists(incident_windows())).values_list('sensor_type', 'value')
+
+    pending = {sensor_type: [] for sensor_type in SENSOR_TYPES}
+    read = 0
+    for sensor_type, value in rows.iterator(chunk_size=chunk_size):
+        read += 1
+        if sensor_type in pending:
+            pending[sensor_type].append(value)
+        if read % chunk_size == 0:
+            for name, values in pending.items():
+                reservoirs[name].add(values)
+                values.clear()
+    for name, values in pending.items():
+        reservoirs[name].add(values)
+    return {sensor_type: reservoir.sample() for sensor_type, reservoir in reservoirs.items()}, read
+
+
+def forest_anomalies(days, size):
+    """
+    {sensor_type: values} of the last `days`' anomalies that the forest alone raised
+    ("Abnormal <type> pattern"): labelled examples a new model should still catch.
+    Newest `size` per sensor type.
+    """
+    from django.utils import timezone
+    from api.models import AnomalyEvent
+
+    since = timezone.now() - timedelta(days=days)
+    found = {}
+    for sensor_type, (*_, ai_reason) in SAFETY_THRESHOLDS.items():
+        values = AnomalyEvent.objects.filter(
+            sensor_type=sensor_type, reason_code=ai_reason, reading__timestamp__gte=since, value__isnull=False,
+        ).order_by('-reading__timestamp').values_list('value', flat=True)[:size]
+        found[sensor_type] = np.array(list(values), dtype=float)
+    return found
+
+
+def fit_tables(samples, seed):
+    """Runs in the worker process: trains on the samples, returns the compiled tables."""
+    return AnomalyDetector(seed=seed, samples=samples).tables
+
+
+def fit_in_subprocess(samples, seed):
+    """
+    Fits in a fresh, niced interpreter: training is CPU-bound and must not hold up
+    the web workers or ingest (and a spawned process inherits no DB connections).
+    """
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=os.nice, initargs=(10,)) as pool:
+        return pool.submit(fit_tables, samples, seed).result()
+
+
+def flag_rates(detector, samples):
+    """Share of each sample the forest flags on its own."""
+    return {
+        sensor_type: round(float(np.mean(detector.tables[sensor_type].decision_function(values) < 0)), 4)
+        for sensor_type, values in samples.items() if len(values)
+    }
+
+
+def retrain(days=14, size=20000, min_samples=1000, validate_days=2, max_flag_rate=0.15, max_recall_drop=0.1,
+            seed=42, activate=True):
+    """
+    One retraining run: trains on the `days` before the last `validate_days`, validates on
+    those. Sensor types with fewer than `min_samples` normal readings keep the synthetic
+    training data. Returns (published version or None, report dict).
+    """
+    from . import registry
+
+    # 1. Sample (the validation window stays out of training)
+    samples, read = sample_readings(days, size, seed, skip_days=validate_days)
+    real = {sensor_type: values for sensor_type, values in samples.items() if len(values) >= min_samples}
+    report = {
+        'rows_read': read,
+        'samples': {sensor_type: len(values) for sensor_type, values in samples.items()},
+        'real_sensor_types': sorted(real),
+    }
+    if not real:
+        report['rejected'] = f"fewer than {min_samples} normal readings per sensor type in the last {days} days"
+        return None, report
+
+    # 2. Fit off-process
+    detector = AnomalyDetector(tables=fit_in_subprocess(real, seed))
+
+    # 3. Validate on the later window, next to the active detector
+    normal, _ = sample_readings(validate_days, size, seed)
+    normal = {sensor_type: normal[sensor_type] for sensor_type in real}
+    anomalies = {sensor_type: values for sensor_type, values in forest_anomalies(validate_days, size).items()
+                 if sensor_type in real}
+    report['validation_flag_rate'] = flag_rates(detector, normal)
+    report['anomaly_catch_rate'] = flag_rates(detector, anomalies)
+    if not report['validation_flag_rate']:
+        report['rejected'] = f"no normal readings in the last {validate_days} days to validate on"
+        return None, report
+    try:
+        current = registry.load()
+    except FileNotFoundError:
+        current = None
+    if current is not None:
+        report['current_flag_rate'] = flag_rates(current, normal)
+        report['current_anomaly_catch_rate'] = flag_rates(current, anomalies)
+
+    too_high = {sensor_type: rate for sensor_type, rate in report['validation_flag_rate'].items()
+                if rate > max_flag_rate}
+    if too_high:
+        report['rejected'] = f"validation flag rate above {max_flag_rate}: {too_high}"
+        return None, report
+    missed = {sensor_type: rate for sensor_type, rate in report['anomaly_catch_rate'].items()
+              if rate < report.get('current_anomaly_catch_rate', {}).get(sensor_type, 0) - max_recall_drop}
+    if missed:
+        report['rejected'] = f"catches fewer recent anomalies than the active detector: {missed}"
+        return None, report
+
+    # 4. Publish
+    version = registry.publish(detector, metadata={
+        'source': 'readings',
+        'seed': seed,
+        'days': days,
+        **report,
+    }, activate=activate)
+    return version, report
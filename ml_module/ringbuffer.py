@@ -0,0 +1,373 @@
+"""
+Recent readings per (plot, sensor_type) in fixed-size NumPy ring buffers.
+
+Every slot holds the last RECENT_READINGS_SIZE readings (id, timestamp, value, source)
+in preallocated 2-D arrays, so memory is ~28 bytes x size x 3 sensor types per plot
+(about 5 KB per plot at the default 64) no matter how much a plot sends.
+
+Two users:
+  * ingest folds new readings in and gets rolling-window features for the detector
+    (change rate, window mean/std, deviation from the window median);
+  * the "latest readings" endpoint serves from memory. A plot's buffer is only trusted
+    while the plot's version key (api/changes.py) is the one it was loaded at; otherwise
+    that plot is reloaded from the DB first (another process may have written to it).
+    A batch folded in here un-trusts the plot until it commits; the version it bumps to
+    is then adopted if the buffer was current right before (restamp), instead of a reload.
+"""
+
+import datetime
+import threading
+
+import numpy as np
+
+SENSOR_TYPES = ('humidity', 'moisture', 'temperature')  # Sorted, like the endpoint's ordering
+SENSOR_CODES = {name: code for code, name in enumerate(SENSOR_TYPES)}
+# Smallest window spread used for scoring, per sensor code (%, %, °C)
+MIN_SCALE = np.array([1.0, 1.0, 0.5])
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def to_micros(timestamp):
+    return (timestamp - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def from_micros(micros):
+    return EPOCH + datetime.timedelta(microseconds=int(micros))
+
+
+class RecentReadings:
+    """Ring buffers keyed by (plot_id, sensor code); every plot gets all three slots at once."""
+
+    def __init__(self, size=64, window=12):
+        self.size = size
+        self.window = min(window, size)
+        self.plots = {}       # plot_id -> first of its 3 slots
+        self.versions = {}    # plot_id -> (plot version, data epoch) the buffer is complete for
+        self.generations = {}  # plot_id -> number of batches / loads applied
+        self.pending = {}     # plot_id -> (version before the last batch, its generation, its reading ids)
+        self.sources = {}     # source string <-> small int, sources repeat a lot
+        self.source_names = []
+        self.used = 0
+        self.ids = np.zeros((0, size), dtype=np.int64)
+        self.micros = np.zeros((0, size), dtype=np.int64)
+        self.values = np.zeros((0, size))
+        self.source = np.zeros((0, size), dtype=np.int32)
+        self.head = np.zeros(0, dtype=np.int64)    # Next write position
+        self.length = np.zeros(0, dtype=np.int64)
+        self.lock = threading.RLock()
+
+    # --- storage ---
+
+    def _slots_of(self, plot_id):
+        first = self.plots.get(plot_id)
+        if first is None:
+            first = self.used
+            self.used += len(SENSOR_TYPES)
+            if self.used > len(self.head):
+                capacity = max(self.used, 2 * len(self.head), 3 * 256)
+                for name in ('ids', 'micros', 'values', 'source'):
+                    setattr(self, name, np.resize(getattr(self, name), (capacity, self.size)))
+                self.head = np.resize(self.head, capacity)
+                self.length = np.resize(self.length, capacity)
+                self.head[first:] = 0
+                self.length[first:] = 0
+            self.plots[plot_id] = first
+        return first
+
+    def _source_code(self, source):
+        code = self.sources.get(source)
+        if code is None:
+            code = self.sources[source] = len(self.source_names)
+            self.source_names.append(source)
+        return code
+
+    def slots(self, plot_ids, sensor_types):
+        return np.array([
+            self._slots_of(plot_id) + SENSOR_CODES[sensor_type] if sensor_type in SENSOR_CODES else -1
+            for plot_id, sensor_type in zip(plot_ids, sensor_types)
+        ], dtype=np.int64)
+
+    def _write(self, slots, ids, micros, values, sources):
+        """Appends one reading per slot (no repeats)."""
+        position = self.head[slots]
+        self.ids[slots, position] = ids
+        self.micros[slots, position] = micros
+        self.values[slots, position] = values
+        self.source[slots, position] = sources
+        self.head[slots] = (position + 1) % self.size
+        self.length[slots] = np.minimum(self.length[slots] + 1, self.size)
+
+    def _recent(self, slots, count):
+        """(n, count) positions of each slot's newest readings, newest first, and a validity mask."""
+        offsets = np.arange(1, count + 1)
+        positions = (self.head[slots][:, None] - offsets[None, :]) % self.size
+        valid = offsets[None, :] <= self.length[slots][:, None]
+        return positions, valid
+
+    # --- ingest: features + append ---
+
+    def _features(self, slots, micros, values):
+        positions, valid = self._recent(slots, self.window)
+        filled = valid.sum(axis=1)
+        has_last = filled > 0
+        # Slots without history get a dummy row of zeros (masked out below) to keep nan* quiet
+        window = np.where(valid | ~has_last[:, None], self.values[slots[:, None], positions], np.nan)
+        window[~has_last] = 0.0
+
+        last_micros = self.micros[slots, positions[:, 0]]
+        hours = np.maximum(micros - last_micros, 1_000_000) / 3.6e9
+        rate = (values - window[:, 0]) / hours
+
+        median = np.nanmedian(window, axis=1)
+        mad = np.nanmedian(np.abs(window - median[:, None]), axis=1)
+        scale = np.maximum(1.4826 * mad, MIN_SCALE[slots % len(SENSOR_TYPES)])
+        return {
+            'rate_per_hour': np.where(has_last, rate, np.nan),
+            'window_mean': np.where(has_last, np.nanmean(window, axis=1), np.nan),
+            'window_std': np.where(has_last, np.nanstd(window, axis=1), np.nan),
+            # Only once the window is full: a couple of readings say little
+            'window_z': np.where(filled >= self.window, (values - median) / scale, np.nan),
+        }
+
+    def observe(self, plot_ids, sensor_types, ids, timestamps, values, sources):
+        """
+        Features of each reading against the readings before it, then appends it.
+        Returns a dict of arrays aligned with the input (NaN where there is no history).
+        """
+        values = np.asarray(values, dtype=float)
+        micros = np.array([to_micros(timestamp) for timestamp in timestamps], dtype=np.int64)
+        ids = np.asarray(ids, dtype=np.int64)
+        features = {name: np.full(len(values), np.nan)
+                    for name in ('rate_per_hour', 'window_mean', 'window_std', 'window_z')}
+        with self.lock:
+            slots = self.slots(plot_ids, sensor_types)
+            # The buffers now hold rows that may not be committed (yet): reads reload these plots
+            # until restamp() learns the batch committed
+            batch = {}
+            for plot_id, reading_id in zip(plot_ids, ids.tolist()):
+                batch.setdefault(plot_id, []).append(reading_id)
+            for plot_id, reading_ids in batch.items():
+                generation = self.generations[plot_id] = self.generations.get(plot_id, 0) + 1
+                self.pending[plot_id] = (self.versions.pop(plot_id, None), generation, tuple(reading_ids))
+            sources = np.array([self._source_code(source) for source in sources], dtype=np.int32)
+            known = np.flatnonzero((slots >= 0) & np.isfinite(values))
+            if not known.size:
+                return features
+
+            # Repeated slots in one batch are applied in rounds, in arrival order
+            order = known[np.argsort(slots[known], kind='stable')]
+            ordered = slots[order]
+            starts = np.r_[True, ordered[1:] != ordered[:-1]]
+            rank = np.arange(len(order)) - np.maximum.accumulate(np.where(starts, np.arange(len(order)), 0))
+            for round_ in range(rank.max() + 1):
+                members = order[rank == round_]
+                for name, column in self._features(slots[members], micros[members], values[members]).items():
+                    features[name][members] = column
+                self._write(slots[members], ids[members], micros[members], values[members], sources[members])
+        return features
+
+    # --- loading ---
+
+    def replace(self, plot_id, rows, version):
+        """
+        Resets a plot to `rows` (sensor_type, id, value, timestamp, source): its newest readings
+        per sensor type from the DB, any order. Marks the plot complete for `version`.
+        """
+        with self.lock:
+            first = self._slots_of(plot_id)
+            for code, sensor_type in enumerate(SENSOR_TYPES):
+                slot = first + code
+                # Oldest first, so the newest reading ends up right before the head
+                kept = sorted((row for row in rows if row[0] == sensor_type), key=lambda row: (row[3], row[1]))
+                kept = kept[-self.size:]
+                count = len(kept)
+                self.head[slot] = count % self.size
+                self.length[slot] = count
+                if count:
+                    self.ids[slot, :count] = [row[1] for row in kept]
+                    self.values[slot, :count] = [row[2] for row in kept]
+                    self.micros[slot, :count] = [to_micros(row[3]) for row in kept]
+                    self.source[slot, :count] = [self._source_code(row[4]) for row in kept]
+            self.versions[plot_id] = version
+            self.generations[plot_id] = self.generations.get(plot_id, 0) + 1
+
+    def restamp(self, reading_ids, before, now):
+        """
+        A batch (`reading_ids` per plot) committed and moved the plots' versions from `before`
+        (plot id -> (version, data epoch)) to `now`. Plots that were current right before the
+        batch, and took nothing else since, are complete for the new version.
+        """
+        with self.lock:
+            for plot_id, ids in reading_ids.items():
+                pending = self.pending.get(plot_id)
+                if pending is None or pending[2] != ids:
+                    continue
+                del self.pending[plot_id]
+                stamp = before.get(plot_id)
+                if pending[1] == self.generations.get(plot_id) and stamp is not None and pending[0] == stamp:
+                    self.versions[plot_id] = (now, stamp[1])
+
+    def is_current(self, plot_id, version):
+        return self.versions.get(plot_id) == version
+
+    # --- reads ---
+
+    def latest(self, plot_id, limit, after=0):
+        """
+        The plot's newest `limit` readings per sensor type with id > `after`, ordered like the
+        latest endpoint (sensor type, newest first), as (id, sensor_type, value, timestamp, source).
+        Returns None when memory can't answer exactly (the caller queries the DB).
+        """
+        if limit > self.size:
+            return None
+        with self.lock:
+            first = self.plots.get(plot_id)
+            if first is None:
+                return None
+            rows = []
+            for code, sensor_type in enumerate(SENSOR_TYPES):
+                slot = first + code
+                length = int(self.length[slot])
+                # With ?after, readings older than the buffer could still qualify unless it holds everything
+                if after and length == self.size:
+                    return None
+                positions = (self.head[slot] - np.arange(1, length + 1)) % self.size
+                micros, ids = self.micros[slot, positions], self.ids[slot, positions]
+                order = np.lexsort((-ids, -micros))  # Newest first, id breaks ties
+                taken = 0
+                for position in positions[order]:
+                    if taken == limit:
+                        break
+                    if self.ids[slot, position] <= after:
+                        continue
+                    rows.append((int(self.ids[slot, position]), sensor_type, float(self.values[slot, position]),
+                                 from_micros(self.micros[slot, position]),
+                                 self.source_names[self.source[slot, position]]))
+                    taken += 1
+            return rows
+
+
+# --- Django glue ---
+
+_recent = None
+_recent_lock = threading.Lock()
+
+
+def get_recent():
+    """The process-wide buffers (created on first use)."""
+    global _recent
+    if _recent is None:
+        from django.conf import settings
+        with _recent_lock:
+            if _recent is None:
+                _recent = RecentReadings(size=settings.RECENT_READINGS_SIZE, window=settings.RECENT_READINGS_WINDOW)
+    return _recent
+
+
+def stamps_of(plot_ids):
+    """plot id -> (plot version, data epoch): what a buffer is complete for (api/changes.py)."""
+    from api.changes import EPOCH_KEY, version_key, versions
+
+    found = versions([version_key(plot_id) for plot_id in plot_ids] + [EPOCH_KEY])
+    return {plot_id: (found[version_key(plot_id)], found[EPOCH_KEY]) for plot_id in plot_ids}
+
+
+def reload(plot_ids, exclude=()):
+    """
+    Loads the plots' newest readings per sensor type from the DB (one windowed query),
+    leaving out the ids in `exclude`.
+    """
+    from django.db.models import F, Window
+    from django.db.models.functions import RowNumber
+    from api.models import SensorReading
+
+    recent = get_recent()
+    plot_ids = list(plot_ids)
+    if not plot_ids:
+        return
+    # Versions first: a write racing with the query leaves the buffer marked stale
+    stamps = stamps_of(plot_ids)
+    queryset = SensorReading.objects.filter(plot_id__in=plot_ids)
+    if exclude:
+        queryset = queryset.exclude(id__in=exclude)
+    rows = queryset.annotate(
+        row_number=Window(RowNumber(), partition_by=[F('plot_id'), F('sensor_type')],
+                          order_by=[F('timestamp').desc(), F('id').desc()])
+    ).filter(row_number__lte=recent.size).values_list('plot_id', 'sensor_type', 'id', 'value', 'timestamp', 'source')
+
+    by_plot = {plot_id: [] for plot_id in plot_ids}
+    for plot_id, *row in rows:
+        by_plot[plot_id].append(row)
+    for plot_id, plot_rows in by_plot.items():
+        recent.replace(plot_id, plot_rows, stamps[plot_id])
+
+
+def append(readings, recent=None):
+    """
+    Ingest: window features for saved readings, which are then kept.
+    Plots seen for the first time are loaded from the DB first, unless `recent` (buffers of
+    the caller's own, e.g. a historical import's) is given.
+    """
+    if recent is None:
+        recent = get_recent()
+        unseen = {reading.plot_id for reading in readings} - recent.plots.keys()
+        if unseen:
+            # Without the batch itself: it's folded in below, after being scored
+            reload(unseen, exclude=[reading.id for reading in readings])
+    return recent.observe(
+        [reading.plot_id for reading in readings], [reading.sensor_type for reading in readings],
+        [reading.id for reading in readings], [reading.timestamp for reading in readings],
+        [reading.value for reading in readings], [reading.source for reading in readings],
+    )
+
+
+def restamp(readings, before, now):
+    """
+    After an ingest commits (changes.bump_plots): the process-wide buffers that took `readings`
+    stay current for the plots' new version `now`. `before`: plot id -> (version, data epoch)
+    just before that bump; another process's write in between shows up there and forces a reload.
+    """
+    if _recent is None:
+        return
+    reading_ids = {}
+    for reading in readings:
+        reading_ids.setdefault(reading.plot_id, []).append(reading.id)
+    _recent.restamp({plot_id: tuple(ids) for plot_id, ids in reading_ids.items()}, before, now)
+
+
+def latest(plot_id, limit, after=0):
+    """Latest-readings rows from memory, reloading the plot if it changed; None = ask the DB."""
+    recent = get_recent()
+    if limit > recent.size:
+        return None
+    if not recent.is_current(plot_id, stamps_of([plot_id])[plot_id]):
+        reload([plot_id])
+    return recent.latest(plot_id, limit, after)
+
+
+def warm(chunk_size=500):
+    """Loads every plot's recent readings, a chunk of plots per query. Returns the number of plots."""
+    from api.models import FieldPlot
+
+    plot_ids = list(FieldPlot.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(plot_ids), chunk_size):
+        reload(plot_ids[start:start + chunk_size])
+    return len(plot_ids)
+
+
+def warm_in_background():
+    """Server start-up: warms the buffers in a daemon thread (requests don't wait, cold plots load lazily)."""
+    from django.conf import settings
+
+    def run():
+        from django.db import DatabaseError, connection
+        try:
+            print(f"🔥 Recent readings loaded for {warm()} plots.")
+        except DatabaseError as e:
+            # e.g. migrations not applied yet: the buffers fill lazily instead
+            print(f"⚠️  Recent readings not preloaded: {e}")
+        finally:
+            connection.close()
+
+    if settings.RECENT_READINGS_WARM:
+        threading.Thread(target=run, name='recent-readings-warm', daemon=True).start()
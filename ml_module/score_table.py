@@ -0,0 +1,52 @@
+import numpy as np
+
+
+class ScoreTable:
+    """
+    A fitted single-feature IsolationForest compiled into a step function.
+
+    With one feature, every tree only compares the value against its split
+    thresholds, so decision_function is constant between consecutive thresholds.
+    The table stores those breakpoints (sorted) and the forest's score for each
+    interval; scoring becomes one np.searchsorted instead of walking every tree.
+    """
+    def __init__(self, breakpoints, scores):
+        self.breakpoints = breakpoints  # float32, sorted, unique
+        self.scores = scores            # float64, len(breakpoints) + 1
+
+    @classmethod
+    def from_forest(cls, model):
+        # 1. Collect the split thresholds of every tree (leaves have no split)
+        thresholds = np.unique(np.concatenate([
+            estimator.tree_.threshold[estimator.tree_.children_left != -1]
+            for estimator in model.estimators_
+        ]))
+
+        # 2. sklearn casts inputs to float32 and goes left when x <= threshold (float64),
+        #    so snap each threshold DOWN to the largest float32 that still goes left.
+        breakpoints = thresholds.astype(np.float32)
+        too_high = breakpoints.astype(np.float64) > thresholds
+        breakpoints[too_high] = np.nextafter(breakpoints[too_high], np.float32(-np.inf))
+        breakpoints = np.unique(breakpoints)
+
+        # 3. Score one representative per interval with sklearn itself:
+        #    (b[i-1], b[i]] is represented by b[i], the open tail by the next float32 after b[-1]
+        if breakpoints.size:
+            tail = np.nextafter(breakpoints[-1], np.float32(np.inf))
+        else:
+            tail = np.float32(0)
+        representatives = np.append(breakpoints, tail).astype(np.float32)
+        scores = model.decision_function(representatives.reshape(-1, 1))
+
+        return cls(breakpoints, np.ascontiguousarray(scores, dtype=np.float64))
+
+    def decision_function(self, values):
+        """
+        Same output as model.decision_function(values.reshape(-1, 1)), in O(log n) per value.
+        """
+        values = np.asarray(values, dtype=np.float32)
+        return self.scores[np.searchsorted(self.breakpoints, values, side='left')]
+
+    @property
+    def nbytes(self):
+        return self.breakpoints.nbytes + self.scores.nbytes
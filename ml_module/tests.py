@@ -1,3 +1,556 @@
-from django.test import TestCase
+import datetime
+import errno
+import os
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from api.models import AnomalyEvent, FarmProfile, FieldPlot, SensorReading
+from api.views import SensorReadingLatestView
+
+from . import baselines, registry, retraining, ringbuffer
+from .baselines import BaselineStore
+from .logic import (
+    AnomalyDetector, REASON_ABNORMAL_TEMPERATURE, REASON_DROUGHT, REASON_SUDDEN_CHANGE, SAFETY_THRESHOLDS,
+)
+from .ringbuffer import RecentReadings
+from .score_table import ScoreTable
+
+
+def make_plot(username):
+    """A plot on a new user's farm."""
+    user = User.objects.create_user(username, password='pw')
+    farm = FarmProfile.objects.create(user=user, name='Farm', owner_name='F', location='X', size_hectares=1)
+    return FieldPlot.objects.create(farm=farm, plot_name='P', crop_variety='Wheat', area_sqm=100)
+
+
+class ScoreTableParityTests(SimpleTestCase):
+    """
+    The compiled lookup tables must reproduce sklearn's decision_function exactly.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.detector = AnomalyDetector()
+
+    def assert_parity(self, sensor_type, values):
+        values = np.asarray(values, dtype=np.float64)
+        expected = self.detector.models[sensor_type].decision_function(values.reshape(-1, 1))
+        actual = self.detector.tables[sensor_type].decision_function(values)
+        np.testing.assert_array_equal(actual, expected)
+
+    def test_random_values(self):
+        rng = np.random.default_rng(0)
+        for sensor_type in self.detector.models:
+            self.assert_parity(sensor_type, rng.uniform(-50, 150, 20000))
+
+    def test_values_on_and_around_breakpoints(self):
+        for sensor_type, table in self.detector.tables.items():
+            points = table.breakpoints
+            below = np.nextafter(points, np.float32(-np.inf))
+            above = np.nextafter(points, np.float32(np.inf))
+            self.assert_parity(sensor_type, np.concatenate([points, below, above]))
+
+    def test_raw_split_thresholds(self):
+        # The float64 thresholds themselves fall between two float32 values
+        for sensor_type, model in self.detector.models.items():
+            thresholds = np.concatenate([
+                estimator.tree_.threshold[estimator.tree_.children_left != -1]
+                for estimator in model.estimators_
+            ])
+            self.assert_parity(sensor_type, thresholds)
+
+    def test_extreme_values(self):
+        for sensor_type in self.detector.models:
+            self.assert_parity(sensor_type, [-1e30, -1e6, 0.0, 1e6, 1e30])
+
+    def test_batch_matches_sklearn_predict(self):
+        rng = np.random.default_rng(1)
+        for sensor_type, model in self.detector.models.items():
+            values = rng.uniform(-20, 120, 5000)
+            result = self.detector.check_anomaly_batch([sensor_type] * len(values), values)
+            ai_only = result.is_anomaly & (result.reasons == f"Abnormal {sensor_type} pattern")
+            predicted = model.predict(values.reshape(-1, 1)) == -1
+            # Every AI-only anomaly must be an sklearn outlier
+            self.assertTrue(np.all(predicted[ai_only]))
+
+
+class CheckAnomalyParityTests(SimpleTestCase):
+    """
+    check_anomaly_batch (and check_anomaly, which wraps it) must give the per-reading
+    answers of the original scalar check: is_anomaly, reason and confidence.
+    """
+    # Readings no forest can score: (sensor_type, value, expected)
+    NON_FINITE = [
+        ('temperature', np.inf, (True, 'Heat Stress', 0.99)),
+        ('temperature', -np.inf, (True, 'Frost Danger', 0.99)),
+        ('moisture', np.inf, (True, 'Waterlogging', 0.99)),
+        ('moisture', -np.inf, (True, 'Drought / Pump Failure', 0.99)),
+        ('humidity', -np.inf, (True, 'Extremely Dry Air', 0.99)),
+        ('humidity', np.nan, (True, 'Abnormal humidity pattern', 0.99)),  # A broken sensor
+        ('wind', np.nan, (False, 'Unknown', 0.0)),
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.detector = AnomalyDetector()
+
+    def scalar(self, sensor_type, value):
+        """The pre-batch check_anomaly, one reading at a time with the sklearn forest."""
+        model = self.detector.models.get(sensor_type)
+        if not model: return False, "Unknown", 0.0
+
+        data_point = np.array([[value]])
+        prediction = model.predict(data_point)[0]
+        score = model.decision_function(data_point)[0]
+        ai_confidence = min(0.99, 0.5 + (abs(score) * 3))
+
+        lower, _, upper, _, _ = SAFETY_THRESHOLDS[sensor_type]
+        labels = {'temperature': ("Frost Danger", "Heat Stress"),
+                  'moisture': ("Drought / Pump Failure", "Waterlogging"),
+                  'humidity': ("Extremely Dry Air", "High Humidity")}[sensor_type]
+        force_anomaly = value > upper or value < lower
+        reason = labels[1] if value > upper else labels[0] if value < lower else "Normal"
+
+        if prediction == -1 or force_anomaly:
+            if force_anomaly and ai_confidence < 0.8:
+                ai_confidence = 0.95
+            if prediction == -1 and not force_anomaly:
+                reason = f"Abnormal {sensor_type} pattern"
+            return True, reason, float(f"{ai_confidence:.2f}")
+        return False, "Normal", 0.0
+
+    def cases(self):
+        """Each threshold, one ulp either side, nearby and far values, and typical readings."""
+        cases = []
+        for sensor_type, (lower, _, upper, _, _) in SAFETY_THRESHOLDS.items():
+            for limit in (lower, upper):
+                limit = float(limit)
+                for value in (limit, np.nextafter(limit, -np.inf), np.nextafter(limit, np.inf),
+                              limit - 1, limit + 1, limit - 0.005, limit + 0.005):
+                    cases.append((sensor_type, value))
+            cases += [(sensor_type, value) for value in (-1e6, 0.0, (lower + upper) / 2, 1e6)]
+        rng = np.random.default_rng(3)
+        cases += [(sensor_type, value) for sensor_type in SAFETY_THRESHOLDS for value in rng.uniform(-20, 120, 50)]
+        cases += [(sensor_type, 50.0) for sensor_type in ('wind', '', 'Temperature', None)]
+        order = rng.permutation(len(cases))  # Sensor types interleaved within the batch
+        return [cases[index] for index in order]
+
+    def batch(self, cases):
+        result = self.detector.check_anomaly_batch([sensor_type for sensor_type, _ in cases],
+                                                   [value for _, value in cases])
+        return [(bool(anomaly), reason, float(confidence))
+                for anomaly, reason, confidence in zip(result.is_anomaly, result.reasons, result.confidence)]
+
+    def test_batch_matches_scalar(self):
+        cases = self.cases()
+        for (sensor_type, value), actual in zip(cases, self.batch(cases)):
+            with self.subTest(sensor_type=sensor_type, value=value):
+                expected = self.scalar(sensor_type, value)
+                self.assertEqual(actual, expected)
+                self.assertEqual(self.detector.check_anomaly(sensor_type, value), expected)
+
+    def test_unknown_sensor_types(self):
+        for sensor_type in ('wind', '', 'Temperature', None):
+            with self.subTest(sensor_type=sensor_type):
+                self.assertEqual(self.detector.check_anomaly(sensor_type, 1e6), (False, 'Unknown', 0.0))
+
+    def test_non_finite_values(self):
+        cases = [(sensor_type, value) for sensor_type, value, _ in self.NON_FINITE]
+        # Mixed into ordinary readings, which keep their own answers
+        cases += [('temperature', 25.0), ('moisture', 20.0)]
+        expected = [expected for _, _, expected in self.NON_FINITE]
+        expected += [self.scalar('temperature', 25.0), self.scalar('moisture', 20.0)]
+        self.assertEqual(self.batch(cases), expected)
+        for (sensor_type, value, result) in self.NON_FINITE:
+            with self.subTest(sensor_type=sensor_type, value=value):
+                self.assertEqual(self.detector.check_anomaly(sensor_type, value), result)
+
+
+class RegistryPublishTests(SimpleTestCase):
+    """Publishing claims the next free version and leaves no staging directory behind."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        settings = override_settings(ML_MODEL_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        table = ScoreTable(np.array([1.0], dtype=np.float32), np.array([0.1, -0.1]))
+        self.detector = AnomalyDetector(tables={'temperature': table})
+
+    def leftovers(self):
+        return [path.name for path in self.root.iterdir() if path.name.startswith('.staging-')]
+
+    def test_versions_are_numbered(self):
+        self.assertEqual(registry.publish(self.detector), 'v0001')
+        self.assertEqual(registry.publish(self.detector, activate=False), 'v0002')
+        self.assertEqual(registry.current_version(), 'v0001')
+        self.assertEqual(self.leftovers(), [])
+
+    def test_retries_when_another_publisher_took_the_version(self):
+        rename = os.rename
+
+        def race(source, target):
+            # Another process publishes the same version number between listing and renaming
+            if Path(target).name == 'v0001' and not (self.root / 'v0001').exists():
+                (self.root / 'v0001').mkdir()
+                (self.root / 'v0001' / 'meta.json').write_text('{}')
+            return rename(source, target)
+
+        with mock.patch('ml_module.registry.os.rename', side_effect=race):
+            self.assertEqual(registry.publish(self.detector), 'v0002')
+        self.assertEqual(self.leftovers(), [])
+
+    def test_other_errors_are_raised_and_cleaned_up(self):
+        failure = OSError(errno.EACCES, 'Permission denied')
+        with mock.patch('ml_module.registry.os.rename', side_effect=failure) as rename:
+            with self.assertRaises(PermissionError):
+                registry.publish(self.detector)
+        self.assertEqual(rename.call_count, 1)
+        self.assertEqual(self.leftovers(), [])
+        self.assertIsNone(registry.current_version())
+
+
+class BaselineStoreTests(SimpleTestCase):
+    """Online per-(plot, sensor) baselines: moments, quantiles, scoring and batches."""
+
+    def observe_one_by_one(self, store, plot_ids, sensor_types, values):
+        return np.concatenate([store.observe([plot_id], [sensor_type], [value])
+                               for plot_id, sensor_type, value in zip(plot_ids, sensor_types, values)])
+
+    def test_welford_then_ewma(self):
+        store = BaselineStore(alpha=0.1, warmup=1000)  # 1 / alpha = 10 readings of exact Welford
+        values = np.random.default_rng(1).normal(20, 3, 10)
+        for value in values:
+            store.observe([1], ['temperature'], [value])
+        (count, mean, variance, *_), = store.export([0]).values()
+        self.assertEqual(count, 10)
+        self.assertAlmostEqual(mean, values.mean())
+        self.assertAlmostEqual(variance, values.var())
+
+        # From the 11th reading on the weight stays at alpha
+        store.observe([1], ['temperature'], [40.0])
+        _, new_mean, new_variance, *_ = store.export([0])[(1, 0)]
+        delta = 40.0 - mean
+        self.assertAlmostEqual(new_mean, mean + 0.1 * delta)
+        self.assertAlmostEqual(new_variance, 0.9 * (variance + 0.1 * delta * delta))
+
+    def test_quantiles_stay_ordered_and_converge(self):
+        store = BaselineStore(warmup=30)
+        rng = np.random.default_rng(2)
+        for _ in range(300):
+            # Heavy tails and two plots per batch
+            values = np.concatenate([rng.standard_t(2, 10) * 2 + 20, rng.normal(60, 5, 10)])
+            store.observe([1] * 10 + [2] * 10, ['temperature'] * 10 + ['humidity'] * 10, values)
+            quantiles = store.state[:store.size, 2:5]
+            self.assertTrue(np.all(np.diff(quantiles, axis=1) >= 0))
+        q25, q50, q75 = store.export([store.slots[(2, 1)]])[(2, 1)][3:]
+        self.assertAlmostEqual(q50, 60, delta=1.5)
+        self.assertAlmostEqual(q75 - q25, 5 * 1.349, delta=2.5)
+
+    def test_repeated_slots_in_one_batch(self):
+        rng = np.random.default_rng(3)
+        plot_ids = rng.integers(1, 4, 200).tolist()
+        sensor_types = rng.choice(['temperature', 'humidity', 'moisture'], 200).tolist()
+        values = rng.normal(30, 5, 200)
+
+        batched, single = BaselineStore(warmup=5), BaselineStore(warmup=5)
+        z = batched.observe(plot_ids, sensor_types, values)
+        expected = self.observe_one_by_one(single, plot_ids, sensor_types, values)
+        np.testing.assert_allclose(z, expected, equal_nan=True)
+        keys = sorted(single.slots)
+        self.assertEqual(sorted(batched.slots), keys)
+        for key in keys:
+            np.testing.assert_allclose(batched.export([batched.slots[key]])[key],
+                                       single.export([single.slots[key]])[key])
+
+    def test_scored_before_being_folded_in(self):
+        store = BaselineStore(warmup=3)
+        z = store.observe([1] * 5, ['moisture'] * 5, [50, 50, 50, 50, 90])
+        # Warming up for the first three; the outlier is judged against the baseline without it
+        self.assertTrue(np.all(np.isnan(z[:3])))
+        self.assertAlmostEqual(z[3], 0, delta=0.5)
+        self.assertGreater(z[4], 10)
+
+    def test_unknown_sensor_types_and_values(self):
+        store = BaselineStore(warmup=0)
+        z = store.observe([1, 1, 1], ['wind', 'moisture', 'moisture'], [5, np.nan, 40])
+        self.assertTrue(np.isnan(z[0]) and np.isnan(z[1]))
+        self.assertEqual(list(store.slots), [(1, 2)])
+        self.assertEqual(store.export([0])[(1, 2)][0], 1)  # The NaN wasn't counted
+
+    def test_new_keys_are_loaded(self):
+        loader = mock.Mock(return_value={(7, 0): (100, 20.0, 4.0, 18.0, 20.0, 22.0)})
+        store = BaselineStore(warmup=30, loader=loader)
+        z = store.observe([7, 7], ['temperature', 'humidity'], [23.0, 50.0])
+        loader.assert_called_once_with({(7, 0), (7, 1)})
+        self.assertAlmostEqual(z[0], (23.0 - 20.0) / (4.0 / 1.349))
+        self.assertTrue(np.isnan(z[1]))  # Nothing stored for humidity: warming up
+        self.assertEqual(store.take_dirty()[(7, 0)][0], 101)
+        self.assertEqual(store.take_dirty(), {})
+
+
+class RecentReadingsTests(SimpleTestCase):
+    """Ring buffers of recent readings: wraparound, ordering and when memory can't answer."""
+    START = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+    def observe(self, recent, rows):
+        """rows: (plot_id, sensor_type, id, minute, value)."""
+        plot_ids, sensor_types, ids, minutes, values = zip(*rows)
+        return recent.observe(plot_ids, sensor_types, ids,
+                              [self.START + datetime.timedelta(minutes=minute) for minute in minutes],
+                              values, ['sim'] * len(rows))
+
+    def test_wraparound(self):
+        recent = RecentReadings(size=4, window=2)
+        for reading_id in range(1, 7):
+            self.observe(recent, [(1, 'moisture', reading_id, reading_id, 40 + reading_id)])
+        rows = recent.latest(1, 4)
+        self.assertEqual([row[0] for row in rows], [6, 5, 4, 3])  # The two oldest were overwritten
+        self.assertEqual(rows[0][1:], ('moisture', 46.0, self.START + datetime.timedelta(minutes=6), 'sim'))
+        self.assertEqual([row[0] for row in recent.latest(1, 2)], [6, 5])
+
+    def test_batch_with_repeated_slots_wraps_in_order(self):
+        one_batch, one_by_one = RecentReadings(size=3, window=2), RecentReadings(size=3, window=2)
+        rows = [(plot_id, 'humidity', reading_id, reading_id, reading_id * 1.5)
+                for reading_id, plot_id in enumerate([1, 2, 1, 1, 2, 1, 1], start=1)]
+        features = self.observe(one_batch, rows)
+        expected = [self.observe(one_by_one, [row]) for row in rows]
+        for name, column in features.items():
+            np.testing.assert_allclose(column, [found[name][0] for found in expected], equal_nan=True)
+        for plot_id in (1, 2):
+            self.assertEqual(one_batch.latest(plot_id, 3), one_by_one.latest(plot_id, 3))
+        self.assertEqual([row[0] for row in one_batch.latest(1, 3)], [7, 6, 4])
+
+    def test_newest_first_by_timestamp(self):
+        recent = RecentReadings(size=8)
+        # Arrival order isn't time order; equal timestamps fall back to the id
+        self.observe(recent, [(1, 'temperature', 1, 5, 20), (1, 'temperature', 2, 3, 21),
+                              (1, 'temperature', 3, 5, 22), (1, 'humidity', 4, 1, 60)])
+        self.assertEqual([(row[0], row[1]) for row in recent.latest(1, 8)],
+                         [(4, 'humidity'), (3, 'temperature'), (1, 'temperature'), (2, 'temperature')])
+
+    def test_when_memory_cannot_answer(self):
+        recent = RecentReadings(size=4)
+        self.assertIsNone(recent.latest(1, 2))  # Unknown plot
+        self.observe(recent, [(1, 'moisture', reading_id, reading_id, 40) for reading_id in range(1, 4)])
+        self.assertIsNone(recent.latest(1, 5))  # More than a buffer holds
+        # Not full: everything newer than the watermark is here
+        self.assertEqual([row[0] for row in recent.latest(1, 4, after=1)], [3, 2])
+        self.observe(recent, [(1, 'moisture', 4, 4, 40)])
+        # Full: older readings newer than the watermark may have been overwritten
+        self.assertIsNone(recent.latest(1, 4, after=1))
+        self.assertEqual(len(recent.latest(1, 4)), 4)
+
+    def test_restamp_after_commit(self):
+        recent = RecentReadings(size=4)
+        recent.replace(1, [], ('v1', 'e'))
+        recent.replace(2, [], ('v1', 'e'))
+        self.observe(recent, [(1, 'moisture', 1, 1, 40), (2, 'moisture', 2, 1, 40), (1, 'humidity', 3, 1, 60)])
+        self.assertFalse(recent.is_current(1, ('v1', 'e')))  # Not committed yet
+        # Plot 2 was written by another process right before this batch's bump
+        recent.restamp({1: (1, 3), 2: (2,)}, {1: ('v1', 'e'), 2: ('v9', 'e')}, 'v2')
+        self.assertTrue(recent.is_current(1, ('v2', 'e')))
+        self.assertEqual(recent.versions.get(2), None)
+
+        # A later batch in this process (not committed yet) keeps the plot untrusted
+        self.observe(recent, [(1, 'moisture', 4, 2, 41)])
+        self.observe(recent, [(1, 'moisture', 5, 3, 42)])
+        recent.restamp({1: (4,)}, {1: ('v2', 'e')}, 'v3')
+        recent.restamp({1: (5,)}, {1: ('v3', 'e')}, 'v4')
+        self.assertEqual(recent.versions.get(1), None)
+
+    def test_window_features(self):
+        recent = RecentReadings(size=8, window=3)
+        features = self.observe(recent, [(1, 'moisture', reading_id, reading_id * 60, value)
+                                         for reading_id, value in enumerate([40, 42, 44, 46, 80], start=1)])
+        self.assertTrue(np.isnan(features['rate_per_hour'][0]))
+        np.testing.assert_allclose(features['rate_per_hour'][1:4], [2, 2, 2])
+        self.assertTrue(np.all(np.isnan(features['window_z'][:3])))  # Until the window is full
+        self.assertGreater(features['window_z'][4], 10)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'recent'}},
+    RECENT_READINGS_SIZE=4, RECENT_READINGS_WINDOW=2,
+)
+class RecentReadingsParityTests(TestCase):
+    """The latest endpoint answers the same from memory as from the database."""
+    START = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(ringbuffer, '_recent', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.plot = make_plot('recent')
+        self.sparse = FieldPlot.objects.create(farm=self.plot.farm, plot_name='S', crop_variety='Wheat', area_sqm=100)
+        rows = [(self.plot, sensor_type, minute) for sensor_type in ('humidity', 'moisture')
+                for minute in (7, 1, 9, 3, 3, 12, 5)]
+        rows += [(self.sparse, 'temperature', minute) for minute in (2, 1)]
+        self.readings = SensorReading.objects.bulk_create([
+            SensorReading(plot=plot, sensor_type=sensor_type, value=minute, source='sim',
+                          timestamp=self.START + datetime.timedelta(minutes=minute))
+            for plot, sensor_type, minute in rows
+        ])
+        self.view = SensorReadingLatestView()
+        self.view.request = SimpleNamespace(user=User(is_superuser=True))
+
+    def from_db(self, plot, limit, after):
+        return [(reading.id, reading.sensor_type, reading.value, reading.timestamp, reading.source)
+                for reading in self.view.latest_queryset(plot.id, limit, after)]
+
+    def test_memory_matches_the_database(self):
+        ids = [reading.id for reading in self.readings]
+        answered = 0
+        for plot in (self.plot, self.sparse):
+            for limit in (1, 3, 4, 5, 20):
+                for after in (0, ids[0], ids[5], ids[9], ids[-1]):
+                    rows = ringbuffer.latest(plot.id, limit, after)
+                    full = plot == self.plot  # 7 readings per type: the buffers are full
+                    if limit > 4 or (after and full):
+                        self.assertIsNone(rows, (plot.plot_name, limit, after))
+                        continue
+                    self.assertEqual(rows, self.from_db(plot, limit, after), (plot.plot_name, limit, after))
+                    answered += 1
+        self.assertGreater(answered, 10)
+
+    def test_stale_buffer_is_reloaded(self):
+        self.assertEqual(len(ringbuffer.latest(self.sparse.id, 4)), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            # Written by another process: only the plot's version key tells this one
+            SensorReading.objects.create(plot=self.sparse, sensor_type='temperature', value=3, source='sim',
+                                         timestamp=self.START + datetime.timedelta(minutes=3))
+        self.assertEqual(ringbuffer.latest(self.sparse.id, 4), self.from_db(self.sparse, 4, 0))
+        self.assertEqual(len(ringbuffer.latest(self.sparse.id, 4)), 3)
+
+    def test_own_ingest_keeps_the_buffer(self):
+        from api.ingest import ingest_readings
+
+        self.assertEqual(len(ringbuffer.latest(self.sparse.id, 4)), 2)
+        reading = SensorReading(plot=self.sparse, sensor_type='temperature', value=21, source='sim',
+                                timestamp=self.START + datetime.timedelta(minutes=3))
+        with mock.patch.object(baselines, '_store', None), self.captureOnCommitCallbacks(execute=True):
+            ingest_readings([reading])
+        # Took the batch itself, so the bumped version needs no reload
+        with mock.patch.object(ringbuffer, 'reload') as reload:
+            rows = ringbuffer.latest(self.sparse.id, 4)
+        reload.assert_not_called()
+        self.assertEqual(rows, self.from_db(self.sparse, 4, 0))
+        self.assertEqual(rows[0][0], reading.id)
+
+
+class RetrainingSampleTests(TestCase):
+    """Retraining samples only normal readings: coalesced repeats of an incident stay out."""
+
+    def setUp(self):
+        self.plot = make_plot('retrain')
+        self.start = timezone.now() - datetime.timedelta(days=1)
+
+    def reading(self, minute, sensor_type, value, plot=None):
+        return SensorReading.objects.create(plot=plot or self.plot, sensor_type=sensor_type, value=value,
+                                            timestamp=self.start + datetime.timedelta(minutes=minute))
+
+    def incident(self, reading, last_minute, anomaly_type, reason_code):
+        return AnomalyEvent.objects.create(
+            plot=reading.plot, anomaly_type=anomaly_type, description='', severity='high', model_confidence=0.9,
+            sensor_type=reading.sensor_type, value=reading.value, reason_code=reason_code, reading=reading,
+            occurrences=3, last_seen=self.start + datetime.timedelta(minutes=last_minute),
+        )
+
+    def sampled(self):
+        samples, _ = retraining.sample_readings(days=7, size=100)
+        return {sensor_type: sorted(values.tolist()) for sensor_type, values in samples.items() if len(values)}
+
+    def test_incident_windows_are_left_out(self):
+        self.reading(0, 'moisture', 50)
+        # A pump failure: the first reading is linked, the two repeats only counted
+        self.incident(self.reading(10, 'moisture', 5), 20, 'Drought / Pump Failure', REASON_DROUGHT)
+        self.reading(15, 'moisture', 6)
+        self.reading(20, 'moisture', 7)
+        self.reading(15, 'temperature', 22)  # Another sensor of the plot, normal
+        self.reading(30, 'moisture', 48)     # After the last repeat
+        other = FieldPlot.objects.create(farm=self.plot.farm, plot_name='Q', crop_variety='Corn', area_sqm=100)
+        self.reading(15, 'moisture', 45, plot=other)
+
+        self.assertEqual(self.sampled(), {'moisture': [45.0, 48.0, 50.0], 'temperature': [22.0]})
+
+    def test_plot_relative_incidents_cover_their_sensor_only(self):
+        # "Sudden change" is shared by every sensor, but incidents are kept per sensor
+        self.incident(self.reading(0, 'humidity', 95), 10, 'Sudden change', REASON_SUDDEN_CHANGE)
+        self.reading(5, 'humidity', 96)
+        self.reading(5, 'temperature', 38)
+        self.assertEqual(self.sampled(), {'temperature': [38.0]})
+
+
+class RetrainingValidationTests(TestCase):
+    """Retraining validates on the latest days, which it never trains on, next to the active detector."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(ML_MODEL_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # Fitted in-process, against a synthetic active detector
+        for patcher in (mock.patch.object(retraining, 'fit_in_subprocess', self.fit),
+                        mock.patch.object(registry, 'load', lambda: self.active)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.active = AnomalyDetector()
+        self.trained_on = None
+        self.plot = make_plot('validate')
+        self.now = timezone.now()
+
+    def fit(self, samples, seed):
+        self.trained_on = samples
+        return retraining.fit_tables(samples, seed)
+
+    def readings(self, days_ago, values):
+        return SensorReading.objects.bulk_create([
+            SensorReading(plot=self.plot, sensor_type='temperature', value=value,
+                          timestamp=self.now - datetime.timedelta(days=days_ago, minutes=index))
+            for index, value in enumerate(values)
+        ])
+
+    def setup_window(self, training_values):
+        self.readings(5, training_values)
+        self.readings(0.5, np.full(50, 25.5))  # Normal readings of the validation window
+        # Readings the forest alone flagged there
+        for reading in self.readings(0.5, [31.5, 32.0, 32.5, 33.0]):
+            AnomalyEvent.objects.create(
+                plot=self.plot, anomaly_type='Abnormal temperature pattern', description='', severity='high',
+                model_confidence=0.9, sensor_type='temperature', value=reading.value,
+                reason_code=REASON_ABNORMAL_TEMPERATURE, reading=reading,
+            )
+
+    def retrain(self):
+        return retraining.retrain(days=14, size=1000, min_samples=100, validate_days=2, max_flag_rate=0.3)
+
+    def test_publishes_when_validation_passes(self):
+        self.setup_window(np.random.default_rng(0).normal(25, 2, 300))
+        version, report = self.retrain()
+        self.assertEqual(version, 'v0001', report)
+        self.assertNotIn(25.5, self.trained_on['temperature'])  # The validation window stayed out
+        self.assertEqual(len(self.trained_on['temperature']), 300)
+        self.assertEqual(report['current_anomaly_catch_rate']['temperature'], 1.0)
+        self.assertGreaterEqual(report['anomaly_catch_rate']['temperature'], 0.9)
+
+    def test_rejects_a_model_that_misses_recent_anomalies(self):
+        # Trained on a much wider spread, 31-33 °C looks normal to the new forest
+        self.setup_window(np.random.default_rng(0).uniform(10, 40, 300))
+        version, report = self.retrain()
+        self.assertIsNone(version)
+        self.assertIn('catches fewer recent anomalies', report['rejected'])
+        self.assertIsNone(registry.current_version())
 
-# Create your tests here.
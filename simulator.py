@@ -1,13 +1,22 @@
+import argparse
+import asyncio
+import json
+import os
 import requests
 import time
 import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from faker import Faker
+from requests.adapters import HTTPAdapter
 
 # Configuration
 BASE_URL = "http://127.0.0.1:8000/api"
 USERNAME = "admin"
 PASSWORD = "admin"
+# Device key from `manage.py create_sensor_source` (skips the login / token refresh dance)
+API_KEY = os.environ.get("API_KEY")
 
 # Initialize Faker
 fake = Faker()
@@ -26,21 +35,30 @@ def get_token():
         print(f"Connection Error during login: {e}")
         return None
 
-def get_plots(token):
-    """Fetches available Plot IDs."""
+def get_auth_headers():
+    if API_KEY:
+        return {"Authorization": f"Api-Key {API_KEY}"}
+    token = get_token()
+    return {"Authorization": f"Bearer {token}"} if token else None
+
+def get_plots(headers):
+    """Fetches available Plot IDs (follows the cursor pages)."""
     try:
-        headers = {"Authorization": f"Bearer {token}"}
-        response = requests.get(f"{BASE_URL}/plots/", headers=headers)
-        if response.status_code == 200:
-            plots = response.json()
-            ids = [p['id'] for p in plots]
-            if not ids: print("⚠️ No plots found in DB! Create some in Admin Panel.")
-            return ids
-        return []
+        ids = []
+        url = f"{BASE_URL}/plots/"
+        while url:
+            response = requests.get(url, headers=headers)
+            if response.status_code != 200:
+                break
+            page = response.json()
+            ids.extend(p['id'] for p in page['results'])
+            url = page['next']
+        if not ids: print("⚠️ No plots found in DB! Create some in Admin Panel.")
+        return ids
     except:
         return []
 
-def generate_reading(hour, plot_variation=0):
+def generate_reading(hour, plot_variation=0, verbose=True):
     """
     Generates data using NumPy for realistic distributions.
     """
@@ -72,33 +90,32 @@ def generate_reading(hour, plot_variation=0):
         anomaly_type = np.random.choice(['heat_wave', 'pump_failure', 'frost', 'dry_air', 'flood'])
         
         if anomaly_type == 'heat_wave':
-            print(f"⚠️  Simulating Heat Wave on Plot {plot_variation}")
+            if verbose: print(f"⚠️  Simulating Heat Wave on Plot {plot_variation}")
             temperature = np.random.uniform(40, 50) 
             
         elif anomaly_type == 'pump_failure':
-            print(f"⚠️  Simulating Pump Failure on Plot {plot_variation}")
+            if verbose: print(f"⚠️  Simulating Pump Failure on Plot {plot_variation}")
             moisture = np.random.uniform(5, 15)
 
         elif anomaly_type == 'frost':
-            print(f"⚠️  Simulating Cold Stress on Plot {plot_variation}")
+            if verbose: print(f"⚠️  Simulating Cold Stress on Plot {plot_variation}")
             temperature = np.random.uniform(0, 4) 
             
         elif anomaly_type == 'dry_air':
-            print(f"⚠️  Simulating Dry Air on Plot {plot_variation}")
+            if verbose: print(f"⚠️  Simulating Dry Air on Plot {plot_variation}")
             humidity = np.random.uniform(5, 15)
 
         elif anomaly_type == 'flood':
-            print(f"⚠️  Simulating Flood on Plot {plot_variation}")
+            if verbose: print(f"⚠️  Simulating Flood on Plot {plot_variation}")
             moisture = np.random.uniform(92, 99)
             
     return round(temperature, 2), round(humidity, 2), round(moisture, 2)
 
 def run_simulator():
-    token = get_token()
-    if not token: return
+    headers = get_auth_headers()
+    if not headers: return
 
-    headers = {"Authorization": f"Bearer {token}"}
-    plot_ids = get_plots(token)
+    plot_ids = get_plots(headers)
     if not plot_ids: plot_ids = [1]
 
     print(f"🌱 Simulator started for Plots: {plot_ids}")
@@ -114,7 +131,9 @@ def run_simulator():
     
     while True:
         print(f"\n--- 🕒 Simulating Hour {virtual_hour}:00 ---")
-        
+
+        # Collect the whole tick (every sensor of every plot) into ONE batch request
+        batch = []
         for plot_id in plot_ids:
             temp, hum, moist = generate_reading(virtual_hour, plot_variation=plot_id)
             
@@ -128,29 +147,409 @@ def run_simulator():
             ]
 
             for sensor in sensors:
-                payload = {
+                batch.append({
                     "plot": plot_id,
                     "sensor_type": sensor['type'],
                     "value": sensor['value'],
                     "timestamp": datetime.datetime.now().isoformat(),
                     "source": current_source  # <--- Unique ID per plot
-                }
-                try:
-                    r = requests.post(f"{BASE_URL}/sensor-readings/", json=payload, headers=headers)
-                    if r.status_code == 401:
-                        print("🔄 Token expired! Re-logging in...")
-                        token = get_token()
-                        if token:
-                            headers = {"Authorization": f"Bearer {token}"}
-                            requests.post(f"{BASE_URL}/sensor-readings/", json=payload, headers=headers)
-                except Exception as e:
-                    print(f"Error sending: {e}")
-            
-            print(f"✅ Sent data for Plot {plot_id} (Source: {current_source})")
+                })
+
+        try:
+            r = requests.post(f"{BASE_URL}/sensor-readings/batch/", json=batch, headers=headers)
+            if r.status_code == 401 and not API_KEY:
+                print("🔄 Token expired! Re-logging in...")
+                headers = get_auth_headers()
+                if headers:
+                    r = requests.post(f"{BASE_URL}/sensor-readings/batch/", json=batch, headers=headers)
+            if r.status_code in (201, 207):
+                result = r.json()
+                print(f"✅ Sent {result['created']} readings for Plots {plot_ids} ({result['failed']} rejected)")
+            else:
+                print(f"❌ Batch rejected ({r.status_code}): {r.text[:100]}")
+        except Exception as e:
+            print(f"Error sending: {e}")
 
         virtual_hour += 1
         if virtual_hour > 23: virtual_hour = 0
         time.sleep(2)
 
+# --- LOAD GENERATOR (python simulator.py load --help) ---
+
+SENSOR_TYPES = ("temperature", "humidity", "moisture")
+
+def build_session(headers, pool_size):
+    """One pooled keep-alive session shared by every virtual device."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(headers)
+    return session
+
+def build_devices(plot_ids, n_plots, n_devices):
+    """
+    Spreads `n_plots` virtual plots over `n_devices` virtual devices.
+    Virtual plots reuse the real plot ids round-robin (the API only accepts existing plots)
+    but each keeps its own variation, so the generated patterns differ.
+    """
+    virtual = [(plot_ids[v % len(plot_ids)], v) for v in range(n_plots)]
+    devices = []
+    for d in range(n_devices):
+        plots = virtual[d::n_devices]
+        if plots:
+            devices.append({"source": f"Load-{d:04d}", "plots": plots, "next": 0})
+    return devices
+
+def make_payload(device, mode, batch_size, hour):
+    """A single reading (dict) or a batch (list), cycling through the device's plots and sensors."""
+    readings = []
+    now = datetime.datetime.now().isoformat()
+    for _ in range(batch_size if mode == "batch" else 1):
+        slot = device["next"]
+        device["next"] += 1
+        plot_id, variation = device["plots"][(slot // len(SENSOR_TYPES)) % len(device["plots"])]
+        values = generate_reading(hour, plot_variation=variation, verbose=False)
+        sensor = slot % len(SENSOR_TYPES)
+        readings.append({"plot": plot_id, "sensor_type": SENSOR_TYPES[sensor], "value": float(values[sensor]),
+                         "timestamp": now, "source": device["source"]})
+    return readings if mode == "batch" else readings[0]
+
+def send_request(session, url, payload):
+    """Blocking POST (runs in the pool). Returns (status, readings created, seconds on the wire)."""
+    started = time.perf_counter()
+    try:
+        r = session.post(url, json=payload, timeout=30)
+    except requests.RequestException as e:
+        return type(e).__name__, 0, time.perf_counter() - started
+    elapsed = time.perf_counter() - started
+    if r.status_code in (201, 207):
+        created = r.json().get("created", 1) if isinstance(payload, list) else 1
+    else:
+        created = 0
+    return r.status_code, created, elapsed
+
+def due_requests(rate, ramp_up, elapsed):
+    """Requests that should have started after `elapsed` seconds (linear ramp to `rate`)."""
+    if ramp_up <= 0:
+        return rate * elapsed
+    if elapsed < ramp_up:
+        return rate * elapsed * elapsed / (2 * ramp_up)
+    return rate * (elapsed - ramp_up / 2)
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(p50, 2), "p95": round(p95, 2), "p99": round(p99, 2),
+            "mean": round(values.mean(), 2), "max": round(values.max(), 2)}
+
+async def run_load(args):
+    """
+    Open-loop load: requests start on a fixed schedule (not when the previous one
+    returns), so a slow server shows up as latency instead of as a lower request rate.
+    `latency_ms` counts from the scheduled start (including time queued behind
+    --concurrency), `service_ms` only the time on the wire.
+    """
+    headers = get_auth_headers()
+    if not headers: return None
+    plot_ids = get_plots(headers)
+    if not plot_ids:
+        print("❌ No plots to send readings to.")
+        return None
+
+    devices = build_devices(plot_ids, args.plots, args.devices)
+    per_request = args.batch_size if args.mode == "batch" else 1
+    request_rate = args.rate / per_request if args.unit == "readings" else args.rate
+    url = f"{BASE_URL}/sensor-readings/batch/" if args.mode == "batch" else f"{BASE_URL}/sensor-readings/"
+    print(f"🚀 Load: {len(devices)} devices, {args.plots} virtual plots (over {len(plot_ids)} real), "
+          f"{request_rate:.1f} req/s ({args.mode}, {per_request} readings each) for {args.duration}s, "
+          f"ramp-up {args.ramp_up}s")
+
+    # 1. Pooled client: one session, as many connections as requests in flight
+    session = build_session(headers, args.concurrency)
+    executor = ThreadPoolExecutor(max_workers=args.concurrency)
+    in_flight = asyncio.Semaphore(args.concurrency)
+    loop = asyncio.get_running_loop()
+
+    latencies, service_times = [], []
+    statuses = Counter()
+    totals = {"requests": 0, "readings_sent": 0, "readings_created": 0}
+
+    async def fire(payload, scheduled):
+        async with in_flight:
+            status, created, service = await loop.run_in_executor(executor, send_request, session, url, payload)
+        latencies.append(loop.time() - scheduled)
+        service_times.append(service)
+        statuses[str(status)] += 1
+        totals["readings_created"] += created
+
+    # 2. Scheduler: start whatever is due, then sleep a tick
+    tasks = set()
+    start = loop.time()
+    started = 0
+    while (elapsed := loop.time() - start) < args.duration:
+        hour = int(elapsed / 2) % 24  # Same pace as the live simulator: 2s per virtual hour
+        while started < due_requests(request_rate, args.ramp_up, elapsed):
+            device = devices[started % len(devices)]
+            payload = make_payload(device, args.mode, per_request, hour)
+            task = asyncio.create_task(fire(payload, loop.time()))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            started += 1
+            totals["requests"] += 1
+            totals["readings_sent"] += per_request
+        await asyncio.sleep(0.005)
+
+    # 3. Let in-flight requests finish (they count towards the report)
+    if tasks:
+        await asyncio.gather(*tasks)
+    wall = loop.time() - start
+    executor.shutdown()
+    session.close()
+
+    ok = sum(count for status, count in statuses.items() if status in ("201", "207"))
+    return {
+        "config": {"mode": args.mode, "unit": args.unit, "rate": args.rate, "batch_size": per_request,
+                   "plots": args.plots, "devices": len(devices), "duration_s": args.duration,
+                   "ramp_up_s": args.ramp_up, "concurrency": args.concurrency, "url": url},
+        "wall_seconds": round(wall, 2),
+        "requests": totals["requests"],
+        "readings_sent": totals["readings_sent"],
+        "readings_created": totals["readings_created"],
+        "throughput": {"requests_per_s": round(totals["requests"] / wall, 2),
+                       "readings_per_s": round(totals["readings_created"] / wall, 2)},
+        "latency_ms": percentiles(latencies),
+        "service_ms": percentiles(service_times),
+        "status_counts": dict(statuses),
+        "errors": totals["requests"] - ok,
+    }
+
+def run_load_test(args):
+    report = asyncio.run(run_load(args))
+    if report is None: return
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    latency = report["latency_ms"] or {}
+    print(f"✅ {report['requests']} requests in {report['wall_seconds']}s "
+          f"({report['throughput']['requests_per_s']} req/s, {report['throughput']['readings_per_s']} readings/s), "
+          f"p50 {latency.get('p50')}ms p95 {latency.get('p95')}ms p99 {latency.get('p99')}ms, "
+          f"{report['errors']} errors")
+    print(f"📄 Report written to {args.report}")
+
+# --- OFFLINE DATASETS (python simulator.py generate / replay --help) ---
+
+ANOMALY_TYPES = ("none", "heat_wave", "pump_failure", "frost", "dry_air", "flood")
+# Anomaly type -> (index of the sensor it hits, low, high), as in generate_reading
+ANOMALY_EFFECTS = {1: (0, 40, 50), 2: (2, 5, 15), 3: (0, 0, 4), 4: (1, 5, 15), 5: (2, 92, 99)}
+
+def generate_dataset(n_plots, days, interval_minutes=60, seed=42, anomaly_rate=0.2, start=None):
+    """
+    Same patterns as generate_reading, for every plot and time step in one NumPy pass.
+    Returns flat columns (one row per reading, ordered by time): timestamp (epoch seconds),
+    plot (0-based virtual plot), sensor (index into SENSOR_TYPES), value, label (1 = injected
+    anomaly) and anomaly_type (index into ANOMALY_TYPES). Same seed + start = same data.
+    """
+    rng = np.random.default_rng(seed)
+    step = interval_minutes * 60
+    n_steps = int(days * 86400 // step)
+    if start is None:
+        # Midnight UTC, `days` ago: the data ends today
+        start = (int(time.time()) // 86400 - int(np.ceil(days))) * 86400
+    timestamps = start + np.arange(n_steps, dtype=np.int64) * step
+
+    # 1. Baseline, shape (time, plot). Variation stays in the live simulator's range.
+    hour = ((timestamps % 86400) / 3600.0)[:, None]
+    variation = (np.arange(n_plots) % 10)[None, :]
+    shape = (n_steps, n_plots)
+
+    temp_variation = (10 + 1 + variation % 3) * np.sin((hour - 8 + variation * 2) * np.pi / 12)
+    temperature = 25 + temp_variation + rng.normal(0, 0.5, shape)
+    humidity = 80 - temp_variation * 1.5 + rng.normal(0, 1.5, shape)
+    moisture = 60 - (0.5 + variation * 0.1) * hour + rng.normal(0, 0.2, shape)
+    refill = moisture < (20 + variation)
+    moisture[refill] = 60 + rng.uniform(-2, 5, refill.sum())
+    values = np.stack([temperature, humidity, moisture], axis=-1)
+
+    # 2. Inject anomalies: one per hit (time, plot), on the sensor its type affects
+    hit = rng.random(shape) < anomaly_rate
+    kinds = np.where(hit, rng.integers(1, len(ANOMALY_TYPES), shape), 0)
+    anomaly_type = np.zeros(values.shape, dtype=np.int8)
+    for kind, (sensor, low, high) in ANOMALY_EFFECTS.items():
+        mask = kinds == kind
+        values[mask, sensor] = rng.uniform(low, high, mask.sum())
+        anomaly_type[mask, sensor] = kind
+
+    # 3. Flatten to columns
+    return {
+        "timestamp": np.repeat(timestamps, n_plots * len(SENSOR_TYPES)),
+        "plot": np.tile(np.repeat(np.arange(n_plots, dtype=np.int32), len(SENSOR_TYPES)), n_steps),
+        "sensor": np.tile(np.arange(len(SENSOR_TYPES), dtype=np.int8), n_steps * n_plots),
+        "value": np.round(values, 2).astype(np.float32).ravel(),
+        "label": (anomaly_type > 0).astype(np.int8).ravel(),
+        "anomaly_type": anomaly_type.ravel(),
+    }
+
+def dataset_frame(columns):
+    """Readable table (names, ISO timestamps) for CSV / Parquet."""
+    import pandas as pd
+    return pd.DataFrame({
+        "timestamp": np.datetime_as_string(columns["timestamp"].astype("datetime64[s]"), timezone="UTC"),
+        "plot": columns["plot"],
+        "sensor_type": np.asarray(SENSOR_TYPES)[columns["sensor"]],
+        "value": columns["value"],
+        "label": columns["label"],
+        "anomaly_type": np.asarray(ANOMALY_TYPES)[columns["anomaly_type"]],
+    })
+
+def save_dataset(columns, path):
+    if path.endswith(".npz"):
+        np.savez_compressed(path, **columns)
+    elif path.endswith(".csv"):
+        dataset_frame(columns).to_csv(path, index=False)
+    elif path.endswith(".parquet"):
+        dataset_frame(columns).to_parquet(path, index=False)  # Needs pyarrow (not a project dependency)
+    else:
+        raise ValueError("Unknown format: use .npz, .csv or .parquet")
+
+def load_dataset(path):
+    """Columns as written by save_dataset (any format), ordered by time."""
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            columns = {name: data[name] for name in data.files}
+    else:
+        import pandas as pd
+        frame = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path)
+        columns = {
+            "timestamp": pd.to_datetime(frame["timestamp"], utc=True).dt.tz_localize(None)
+                           .to_numpy().astype("datetime64[s]").astype(np.int64),
+            "plot": frame["plot"].to_numpy(np.int32),
+            "sensor": frame["sensor_type"].map(SENSOR_TYPES.index).to_numpy(np.int8),
+            "value": frame["value"].to_numpy(np.float32),
+            "label": frame["label"].to_numpy(np.int8),
+            "anomaly_type": frame["anomaly_type"].map(ANOMALY_TYPES.index).to_numpy(np.int8),
+        }
+    order = np.argsort(columns["timestamp"], kind="stable")
+    if np.any(order != np.arange(len(order))):
+        columns = {name: column[order] for name, column in columns.items()}
+    return columns
+
+def run_generate(args):
+    started = time.perf_counter()
+    start = None
+    if args.start:
+        start = int(datetime.datetime.fromisoformat(args.start).replace(tzinfo=datetime.timezone.utc).timestamp())
+    columns = generate_dataset(args.plots, args.days, args.interval, args.seed, args.anomaly_rate, start)
+    try:
+        save_dataset(columns, args.output)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    except ImportError:
+        print("❌ Parquet output needs pyarrow (pip install pyarrow); .npz and .csv work without it.")
+        return
+    print(f"✅ {len(columns['value'])} readings ({columns['label'].sum()} anomalies) for {args.plots} plots "
+          f"over {args.days} days written to {args.output} in {time.perf_counter() - started:.1f}s")
+
+def run_replay(args):
+    """
+    Posts a dataset to the batch endpoint, paced at `speed` x real time (0 = as fast as
+    possible), keeping its timestamps. Virtual plots map round-robin onto the real plot ids.
+    """
+    columns = load_dataset(args.path)
+    if args.limit:
+        columns = {name: column[:args.limit] for name, column in columns.items()}
+    headers = get_auth_headers()
+    if not headers: return
+    plot_ids = get_plots(headers)
+    if not plot_ids:
+        print("❌ No plots to send readings to.")
+        return
+
+    # 1. Pre-render the per-row fields once
+    total = len(columns["value"])
+    stamps = columns["timestamp"]
+    iso = np.datetime_as_string(stamps.astype("datetime64[s]"), timezone="UTC").tolist()
+    plots = np.asarray(plot_ids)[columns["plot"] % len(plot_ids)].tolist()
+    sensors = np.asarray(SENSOR_TYPES)[columns["sensor"]].tolist()
+    values = columns["value"].astype(float).tolist()
+    print(f"▶️  Replaying {total} readings from {args.path} at {args.speed or 'max'}x onto plots {plot_ids}")
+
+    session = build_session(headers, 1)
+    url = f"{BASE_URL}/sensor-readings/batch/"
+    created = rejected = failed_requests = 0
+    wall_start = time.monotonic()
+    for first in range(0, total, args.batch_size):
+        last = min(first + args.batch_size, total)
+        # 2. Don't send a reading before its (scaled) time
+        if args.speed > 0:
+            wait = (stamps[last - 1] - stamps[0]) / args.speed - (time.monotonic() - wall_start)
+            if wait > 0:
+                time.sleep(wait)
+        batch = [{"plot": plots[i], "sensor_type": sensors[i], "value": values[i],
+                  "timestamp": iso[i], "source": args.source} for i in range(first, last)]
+        try:
+            r = session.post(url, json=batch, timeout=60)
+        except requests.RequestException as e:
+            print(f"Error sending: {e}")
+            failed_requests += 1
+            continue
+        if r.status_code in (201, 207):
+            result = r.json()
+            created += result["created"]
+            rejected += result["failed"]
+        else:
+            failed_requests += 1
+            print(f"❌ Batch rejected ({r.status_code}): {r.text[:100]}")
+        if (first // args.batch_size) % 20 == 0:
+            print(f"   📤 {last}/{total} readings ({created} created)")
+
+    elapsed = time.monotonic() - wall_start
+    print(f"✅ Replay done: {created} created, {rejected} rejected, {failed_requests} failed requests "
+          f"in {elapsed:.1f}s ({created / max(elapsed, 1e-9):.0f} readings/s)")
+
+def main():
+    global BASE_URL
+    parser = argparse.ArgumentParser(description="Sensor simulator. Without a command it streams live readings.")
+    parser.add_argument("--base-url", default=BASE_URL)
+    commands = parser.add_subparsers(dest="command")
+    load = commands.add_parser("load", help="Concurrent load test with a latency report")
+    load.add_argument("--plots", type=int, default=100, help="Virtual plots")
+    load.add_argument("--devices", type=int, default=20, help="Virtual devices (each sends for its share of plots)")
+    load.add_argument("--rate", type=float, default=50, help="Target rate, see --unit")
+    load.add_argument("--unit", choices=["requests", "readings"], default="requests", help="What --rate counts per second")
+    load.add_argument("--mode", choices=["single", "batch"], default="batch", help="One reading per request, or batches")
+    load.add_argument("--batch-size", type=int, default=30, help="Readings per batch request")
+    load.add_argument("--duration", type=float, default=60, help="Seconds (including ramp-up)")
+    load.add_argument("--ramp-up", type=float, default=10, help="Seconds to reach the target rate")
+    load.add_argument("--concurrency", type=int, default=64, help="Max requests in flight (connection pool size)")
+    load.add_argument("--report", default="load_report.json", help="Where to write the JSON report")
+    generate = commands.add_parser("generate", help="Write a seeded, labelled dataset (.npz, .csv or .parquet)")
+    generate.add_argument("output")
+    generate.add_argument("--plots", type=int, default=1000)
+    generate.add_argument("--days", type=float, default=30)
+    generate.add_argument("--interval", type=int, default=60, help="Minutes between readings")
+    generate.add_argument("--seed", type=int, default=42)
+    generate.add_argument("--anomaly-rate", type=float, default=0.2, help="Share of plot/time steps with an injected anomaly")
+    generate.add_argument("--start", help="UTC start date (default: midnight, --days ago). Pin it for identical files.")
+    replay = commands.add_parser("replay", help="Send a generated dataset to the API")
+    replay.add_argument("path")
+    replay.add_argument("--speed", type=float, default=3600, help="Times real time (0 = as fast as possible)")
+    replay.add_argument("--batch-size", type=int, default=500)
+    replay.add_argument("--limit", type=int, help="Only the first N readings")
+    replay.add_argument("--source", default="Replay")
+    args = parser.parse_args()
+
+    BASE_URL = args.base_url.rstrip("/")
+    if args.command == "load":
+        run_load_test(args)
+    elif args.command == "generate":
+        run_generate(args)
+    elif args.command == "replay":
+        run_replay(args)
+    else:
+        run_simulator()
+
 if __name__ == "__main__":
-    run_simulator()
\ No newline at end of file
+    main()
\ No newline at end of file